@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+CLI 启动时间基准测试
+在子进程中多次运行各工具的导入和 --help，统计启动耗时；
+同时测量 pandas 导入耗时作为对照 (提取工具只在导出 Excel 时才加载 pandas)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DOCS_DIR)
+
+STARTUP_CASES = [
+    ("python 空启动", ["-c", "pass"]),
+    ("import obd_extractor", ["-c", "import obd_extractor"]),
+    ("import enhanced_obd_extractor", ["-c", "import enhanced_obd_extractor"]),
+    ("import chevrolet_volt_pids", ["-c", "import chevrolet_volt_pids"]),
+    ("obd_extractor.py --help", ["obd_extractor.py", "--help"]),
+    ("enhanced_obd_extractor.py --help", ["enhanced_obd_extractor.py", "--help"]),
+    ("import pandas (对照)", ["-c", "import pandas"]),
+]
+
+
+def time_command(args: List[str], repeat: int) -> List[float]:
+    """运行子进程 repeat 次，返回每次耗时 (毫秒)，命令失败时返回空列表"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable] + args, cwd=DOCS_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = (time.perf_counter() - start) * 1000
+        if proc.returncode != 0:
+            return []
+        timings.append(elapsed)
+    return timings
+
+
+def time_in_process(repeat: int) -> Dict[str, float]:
+    """进程内实例化耗时 (毫秒)：首次构建 PID 表，之后复用"""
+    from chevrolet_volt_pids import VoltPIDDatabase
+    from enhanced_obd_extractor import EnhancedOBDExtractor
+
+    results = {}
+    for name, factory in (("VoltPIDDatabase()", VoltPIDDatabase),
+                          ("EnhancedOBDExtractor()", EnhancedOBDExtractor)):
+        start = time.perf_counter()
+        factory()
+        results[f"{name} 首次"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for _ in range(repeat):
+            factory()
+        results[f"{name} 之后"] = (time.perf_counter() - start) * 1000 / repeat
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI 启动时间基准测试')
+    parser.add_argument('-n', '--repeat', type=int, default=10, help='每项重复次数')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"=== CLI 启动时间 (重复 {args.repeat} 次，单位 ms) ===")
+    for name, command in STARTUP_CASES:
+        timings = time_command(command, args.repeat)
+        if not timings:
+            print(f"  {name:36s} 跳过 (运行失败或未安装)")
+            continue
+        results[name] = {'median_ms': statistics.median(timings), 'min_ms': min(timings)}
+        print(f"  {name:36s} 中位数 {statistics.median(timings):8.1f}  最小 {min(timings):8.1f}")
+
+    print(f"\n=== 进程内实例化耗时 (单位 ms) ===")
+    for name, elapsed in time_in_process(args.repeat).items():
+        results[name] = {'mean_ms': elapsed}
+        print(f"  {name:36s} {elapsed:8.3f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'startup', 'python': sys.version.split()[0], 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+提取 / 解码 / 导出基准测试
+生成指定规模的合成手册 (混合提取器识别的各种 PID 行格式，中英文)、覆盖每个 VoltPID 的
+合成原始响应日志和大型 PID 目录，分别计时文档提取、公式解码、CSV/JSON/Torque 导出和数据库查询；
+结果可写入 JSON，并与之前一次运行的 JSON 对比，标出变慢的项目
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DOCS_DIR)
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+from enhanced_obd_extractor import EnhancedOBDExtractor
+from obd_extractor import OBDExtractor
+
+# 手册中的 PID 行格式 (与两个提取器的 pid_patterns 对应)，{pid} / {desc} 为占位符
+PID_LINE_FORMATS = [
+    "PID: {pid} {desc}",
+    "PID-{pid} {desc}",
+    "{pid}: {desc}",
+    "{pid} - {desc}",
+    "0x{pid} {desc}",
+    "参数 {pid} {desc}",
+    "Parameter {pid} {desc}",
+    "${pid} {desc}",
+]
+
+# 详细信息行格式 (英文 / 中文)
+DETAIL_LINE_FORMATS = {
+    'length': ["Data Length: {length} bytes", "数据长度: {length} 字节", "Length - {length}",
+               "长度: {length}", "{length} byte response"],
+    'unit': ["Unit: {unit}", "单位: {unit}", "Units - {unit}", "Value ({unit})"],
+    'formula': ["Formula: {formula}", "公式: {formula}", "Calculation: {formula}", "计算: {formula}"],
+    'range': ["Range: {range}", "范围: {range}", "取值: {range}", "Min/Max: {range}"],
+    'notes': ["Note: {notes}", "备注: {notes}", "说明: {notes}", "Remark: {notes}"],
+}
+
+# 决定生成数据规模的参数，基线与本次不同时对比结果仅供参考
+SIZE_PARAMS = ('manual_entries', 'log_samples', 'catalog_size', 'seed')
+
+FILLER_LINES = [
+    "The following parameter is reported by the powertrain control module.",
+    "以下参数由动力总成控制模块提供。",
+    "See the service manual for connector pinouts.",
+    "所有数值均为原始数据，需要按公式换算。",
+]
+
+DESCRIPTIONS = [
+    ("Engine RPM", "发动机转速", "rpm", "((A*256)+B)/4", "0-16383.75", 2),
+    ("Vehicle Speed", "车速", "km/h", "A", "0-255", 1),
+    ("Coolant Temperature", "冷却液温度", "°C", "A-40", "-40 to 215", 1),
+    ("Battery Voltage", "电池电压", "V", "((A*256)+B)/100", "0-655.35", 2),
+    ("Throttle Position", "节气门位置", "%", "A*100/255", "0-100", 1),
+    ("Fuel Trim", "燃油修正", "%", "(A-128)*100/128", "-100 to 99.2", 1),
+    ("Battery Current", "电池电流", "A", "((A*256)+B-32768)/20", "-1638.4 to 1638.35", 2),
+]
+
+
+def generate_manual(entries: int, seed: int = 0) -> str:
+    """生成包含 entries 条 PID 的合成手册文本"""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(entries):
+        english, chinese, unit, formula, range_values, length = rng.choice(DESCRIPTIONS)
+        pid = f"{i % 0x10000:04X}" if i >= 0x100 else f"{i:02X}"
+        desc = chinese if rng.random() < 0.5 else english
+        if rng.random() < 0.3:
+            lines.append(rng.choice(FILLER_LINES))
+        lines.append(rng.choice(PID_LINE_FORMATS).format(pid=pid, desc=desc))
+        values = {'length': length, 'unit': unit, 'formula': formula,
+                  'range': range_values, 'notes': f"{english} / {chinese}"}
+        for key, formats in DETAIL_LINE_FORMATS.items():
+            if key == 'notes' and rng.random() < 0.5:
+                continue
+            lines.append(rng.choice(formats).format(**values))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _payload_length(pid: VoltPID) -> int:
+    decoder = pid.decoder
+    return decoder.byte_count if decoder is not None and decoder.byte_count else 2
+
+
+def generate_raw_log(db: VoltPIDDatabase, samples: int, seed: int = 0) -> List[Tuple[str, str, bytes]]:
+    """为每个 VoltPID 生成 samples 条随机原始响应 (响应 header, PID 代码, 数据字节)"""
+    rng = random.Random(seed)
+    log = []
+    for pid in db.pids:
+        length = _payload_length(pid)
+        for _ in range(samples):
+            log.append((pid.response, pid.pid, bytes(rng.getrandbits(8) for _ in range(length))))
+    rng.shuffle(log)
+    return log
+
+
+def generate_catalog(size: int) -> VoltPIDDatabase:
+    """以内置 PID 为模板，生成包含 size 条 PID 的大型目录 (DID 依次递增)"""
+    db = VoltPIDDatabase()
+    templates = list(db.pids)
+    did = 0x5000
+    while len(db.pids) < size:
+        template = templates[len(db.pids) % len(templates)]
+        db.add_pid(VoltPID(f"22{did:04X}", f"{template.description} #{did:04X}", template.unit,
+                           template.formula, template.range_values, template.header,
+                           template.response, template.category, template.notes))
+        did += 1
+    return db
+
+
+def time_case(func: Callable[[], object], repeat: int) -> List[float]:
+    """运行 func repeat 次，返回每次耗时 (毫秒)；被测代码的打印输出被丢弃"""
+    timings = []
+    sink = io.StringIO()
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(sink):
+            start = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - start) * 1000
+        sink.seek(0)
+        sink.truncate()
+        timings.append(elapsed)
+    return timings
+
+
+def build_cases(args, workdir: str) -> List[Tuple[str, int, Callable[[], object]]]:
+    """构建 (名称, 每次处理的条目数, 函数) 列表"""
+    manual = generate_manual(args.manual_entries, args.seed)
+    manual_lines = manual.split('\n')
+    manual_path = os.path.join(workdir, 'manual.txt')
+    with open(manual_path, 'w', encoding='utf-8') as f:
+        f.write(manual)
+
+    db = VoltPIDDatabase()
+    raw_log = generate_raw_log(db, args.log_samples, args.seed)
+    catalog = generate_catalog(args.catalog_size)
+
+    basic = OBDExtractor()
+    enhanced = EnhancedOBDExtractor()
+    commands = list(enhanced.iter_commands(manual_lines))
+    enhanced.commands = basic.commands = commands
+
+    # 批量解码：每个 PID 的全部样本拼接为一个连续缓冲区
+    batches = {}
+    for response, code, data in raw_log:
+        batches.setdefault((response, code), []).append(data)
+    batch_inputs = [(pid, b''.join(batches[(pid.response, pid.pid)]), _payload_length(pid))
+                    for pid in db.pids if pid.decoder is not None]
+
+    def decode_scalar():
+        decode = db.decode_response
+        for response, code, data in raw_log:
+            decode(code, data, response)
+
+    def decode_batch():
+        for pid, buffer, length in batch_inputs:
+            db.decode_batch(pid, buffer, length)
+
+    codes = [pid.pid for pid in catalog.pids]
+    keys = [(pid.response, pid.pid) for pid in catalog.pids]
+
+    def lookup_code():
+        get = catalog.get_pids_by_code
+        for code in codes:
+            get(code)
+
+    def lookup_response():
+        get = catalog.get_pids_by_response
+        for response, code in keys:
+            get(response, code)
+
+    def out(name: str) -> str:
+        return os.path.join(workdir, name)
+
+    entries = len(commands)
+    return [
+        ("extract.basic", len(manual_lines), lambda: list(basic.iter_commands(manual_lines))),
+        ("extract.enhanced", len(manual_lines), lambda: list(enhanced.iter_commands(manual_lines))),
+        ("extract.enhanced_file", len(manual_lines), lambda: list(enhanced.extract_from_file(manual_path))),
+        ("decode.scalar", len(raw_log), decode_scalar),
+        ("decode.batch", len(raw_log), decode_batch),
+        ("export.extractor_csv", entries, lambda: enhanced.export_to_csv(out('commands.csv'))),
+        ("export.extractor_json", entries, lambda: enhanced.export_to_json(out('commands.json'))),
+        ("export.extractor_jsonl", entries, lambda: enhanced.export_stream(out('commands.jsonl'), 'jsonl')),
+        ("export.catalog_csv", len(catalog.pids), lambda: catalog.export_to_csv(out('catalog.csv'))),
+        ("export.catalog_json", len(catalog.pids), lambda: catalog.export_to_json(out('catalog.json'))),
+        ("export.catalog_torque", len(catalog.pids), lambda: catalog.export_torque_csv(out('torque.csv'))),
+        ("lookup.code", len(codes), lookup_code),
+        ("lookup.response", len(keys), lookup_response),
+        ("lookup.category", len(catalog.pids), lambda: catalog.get_all_categories()),
+    ]
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """与基线逐项对比中位数，打印变化，返回变慢超过 threshold 的项目"""
+    regressions = []
+    print(f"\n=== 与基线对比 (中位数，阈值 {threshold:.0%}) ===")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('median_ms'):
+            print(f"  {name:28s} 基线中没有该项")
+            continue
+        ratio = result['median_ms'] / base['median_ms']
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  ⚠️ 变慢'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = '  ✅ 变快'
+        print(f"  {name:28s} {base['median_ms']:10.2f} -> {result['median_ms']:10.2f} ms  ×{ratio:5.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='提取 / 解码 / 导出基准测试')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='每项重复次数')
+    parser.add_argument('-k', '--filter', help='只运行名称包含该字符串的项目 (如 extract、decode)')
+    parser.add_argument('--manual-entries', type=int, default=2000, help='合成手册中的 PID 条数')
+    parser.add_argument('--log-samples', type=int, default=200, help='每个 VoltPID 的原始响应条数')
+    parser.add_argument('--catalog-size', type=int, default=20000, help='大型目录的 PID 条数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子 (相同种子生成相同数据)')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    parser.add_argument('--compare', help='与之前 --json 写出的结果对比')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定变慢的相对阈值 (默认 0.1)')
+    args = parser.parse_args()
+
+    baseline: Optional[Dict] = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    params = {key: getattr(args, key) for key in SIZE_PARAMS}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='obd_bench_') as workdir:
+        print("正在生成合成数据...")
+        cases = build_cases(args, workdir)
+        print(f"=== 基准测试 (重复 {args.repeat} 次，单位 ms) ===")
+        for name, items, func in cases:
+            if args.filter and args.filter not in name:
+                continue
+            timings = time_case(func, args.repeat)
+            median = statistics.median(timings)
+            rate = items / (median / 1000) if median > 0 else 0.0
+            results[name] = {'median_ms': median, 'min_ms': min(timings), 'items': items,
+                             'items_per_s': rate}
+            print(f"  {name:28s} 中位数 {median:10.2f}  最小 {min(timings):10.2f}  {rate:12,.0f} 条/秒")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'suite', 'python': sys.version.split()[0], 'repeat': args.repeat,
+                       'params': params, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+    if baseline is not None:
+        if baseline.get('params') and any(baseline['params'].get(key) != value
+                                          for key, value in params.items()):
+            print("\n注意：基线的数据规模参数与本次不同，对比仅供参考")
+        regressions = compare(results, baseline.get('results', {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项变慢: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
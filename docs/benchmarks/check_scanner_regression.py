@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+扫描器回归检查
+用改用预编译扫描器之前的逐模式 re.search 方式 (无关键字预筛选) 和当前的 PatternSet / LineScanner
+路径分别解析同一批合成手册 (bench_suite.generate_manual，中英文混合) 及边界样例，
+逐字段比较两个提取器产出的 OBDCommand，有任何差异时以非零状态退出
+"""
+
+import argparse
+import os
+import re
+import sys
+from typing import Iterator, List, Sequence
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DOCS_DIR)
+
+from bench_suite import generate_manual
+from enhanced_obd_extractor import EnhancedOBDExtractor
+from obd_extractor import OBDCommand, OBDExtractor
+from obd_scanner import LineScanner
+
+FIELDS = ('pid', 'mode', 'description', 'data_length', 'unit', 'formula', 'range_values', 'notes')
+
+# 关键字大小写、前缀写法和没有任何关键字的行，覆盖预筛选的边界
+EDGE_CASES = """\
+pid: 0C Engine RPM
+Pid-0d vehicle speed
+0X1F Run Time
+$2F Fuel Level
+参数 5C 机油温度
+PARAMETER 46 Ambient Air Temperature
+0142 - Control Module Voltage
+Length 2
+DATA LENGTH: 4 BYTES
+长度：1
+UNIT: KPA
+units - °C
+Value (rpm)
+FORMULA = A*100/255
+计算：(A*256+B)/4
+range 0 to 100
+no keywords on this line at all
+-- : --
+"""
+
+
+class LegacyPatternSet:
+    """旧实现：每行对每个模式直接调用 re.search (不预编译、不预筛选)"""
+    __slots__ = ('patterns',)
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = tuple(patterns)
+
+    def first(self, line: str):
+        for pattern in self.patterns:
+            match = re.search(pattern, line, re.IGNORECASE)
+            if match:
+                return match
+        return None
+
+    def matches(self, line: str) -> Iterator:
+        for pattern in self.patterns:
+            match = re.search(pattern, line, re.IGNORECASE)
+            if match:
+                yield match
+
+
+def use_legacy_scanner(extractor):
+    """让提取器的 _build_scanner 返回旧的逐模式扫描器 (实例属性覆盖，iter_commands 每次都会重新获取)"""
+    formula_patterns = getattr(extractor, 'formula_patterns', ())
+    extractor._build_scanner = lambda: LineScanner(
+        LegacyPatternSet(extractor.pid_patterns), LegacyPatternSet(extractor.length_patterns),
+        LegacyPatternSet(extractor.unit_patterns), LegacyPatternSet(formula_patterns))
+    return extractor
+
+
+def _fields(commands: List[OBDCommand]) -> List[tuple]:
+    return [tuple(getattr(cmd, name) for name in FIELDS) for cmd in commands]
+
+
+def compare(name: str, factory, text: str) -> int:
+    """返回差异条数并打印前几处差异"""
+    lines = text.split('\n')
+    expected = _fields(list(use_legacy_scanner(factory()).iter_commands(lines)))
+    actual = _fields(list(factory().iter_commands(lines)))
+    differences = [(i, old, new) for i, (old, new) in enumerate(zip(expected, actual)) if old != new]
+    if len(expected) != len(actual):
+        print(f"  {name}: 命令数不同 旧 {len(expected)} / 新 {len(actual)}")
+        return max(1, len(differences))
+    for i, old, new in differences[:5]:
+        print(f"  {name} 第 {i} 条不同:\n    旧 {old}\n    新 {new}")
+    status = '一致' if not differences else f'{len(differences)} 处不同'
+    print(f"  {name:28s} {len(actual):6d} 条命令 {status}")
+    return len(differences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较旧的逐模式匹配与预编译扫描器的提取结果')
+    parser.add_argument('--entries', type=int, default=2000, help='每份合成手册的 PID 条数')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2], help='合成手册的随机种子')
+    args = parser.parse_args()
+
+    corpora = [(f'manual seed={seed}', generate_manual(args.entries, seed)) for seed in args.seeds]
+    corpora.append(('edge cases', EDGE_CASES))
+
+    failures = 0
+    for extractor_name, factory in (('OBDExtractor', OBDExtractor), ('EnhancedOBDExtractor', EnhancedOBDExtractor)):
+        print(f"=== {extractor_name} ===")
+        for corpus_name, text in corpora:
+            failures += compare(corpus_name, factory, text)
+
+    if failures:
+        print(f"\n扫描器回归检查失败：共 {failures} 处不同")
+        sys.exit(1)
+    print("\n扫描器回归检查通过")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+二进制原始响应日志
+十六进制文本日志的体积是数据本身的 2-3 倍，回放时还要重新解析。二进制格式中每条 UDS 肯定响应 (62)
+为一个定长记录头 (时间戳, 响应 header 如 7E8 / 5EC, DID, 数据长度) 加数据字节，文件末尾是稀疏时间索引和尾部；
+读取端用 mmap 打开，按时间范围定位后把数据切片 (memoryview) 直接交给 PID 解码器，不复制
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+from did_packer import POSITIVE_RESPONSE, ResponseError, did_length, split_response
+from log_replay import LogReplayer
+
+MAGIC = b'VBL1'
+INDEX_MAGIC = b'VBLX'
+VERSION = 1
+# 文件头：魔数, 版本, 保留, 创建时间
+FILE_HEADER = struct.Struct('<4sHHd')
+# 记录头：时间戳 (秒), 响应 header, DID, 数据长度；多 DID 响应的 DID 为第一个 DID，数据中包含其余 DID
+RECORD = struct.Struct('<dIHH')
+# 索引项：块中第一条记录的时间戳, 文件偏移
+INDEX_ENTRY = np.dtype([('timestamp', '<f8'), ('offset', '<u8')])
+# 尾部：索引偏移, 索引项数, 魔数
+FOOTER = struct.Struct('<QQ4s')
+DEFAULT_INDEX_EVERY = 1024
+
+
+class BinaryLogError(ValueError):
+    """文件不是二进制日志或已损坏"""
+
+
+class BinaryLogWriter:
+    """顺序写入记录，每 index_every 条记录登记一个索引项，close() 时写出索引和尾部
+
+    时间戳应单调不减 (录制顺序)，读取端按此假设用索引定位。
+    """
+
+    def __init__(self, filename: str, index_every: int = DEFAULT_INDEX_EVERY):
+        self.filename = filename
+        self.index_every = max(1, index_every)
+        self.records = 0
+        self._index: List[Tuple[float, int]] = []
+        self._file = open(filename, 'wb', buffering=1 << 20)
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, time.time()))
+        self._offset = FILE_HEADER.size
+        self._last_time = float('-inf')
+
+    def __enter__(self) -> 'BinaryLogWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def last_time(self) -> float:
+        """最后一条记录的时间戳 (尚未写入时为 -inf)"""
+        return self._last_time
+
+    def write(self, timestamp: float, response: int, did: int, payload):
+        """写入一条响应 (DID 之后的数据字节)"""
+        if timestamp < self._last_time:
+            raise ValueError(f"时间戳必须单调不减: {timestamp} < {self._last_time}")
+        if self.records % self.index_every == 0:
+            self._index.append((timestamp, self._offset))
+        self._last_time = timestamp
+        length = len(payload)
+        self._file.write(RECORD.pack(timestamp, response, did, length))
+        self._file.write(payload)
+        self._offset += RECORD.size + length
+        self.records += 1
+
+    def write_message(self, response: int, message, timestamp: float) -> bool:
+        """写入一条完整响应 (服务字节开始)，只记录 UDS 肯定响应，返回是否写入"""
+        if len(message) < 3 or message[0] != POSITIVE_RESPONSE:
+            return False
+        self.write(timestamp, response, (message[1] << 8) | message[2], memoryview(message)[3:])
+        return True
+
+    def close(self):
+        """写出索引和尾部"""
+        if self._file.closed:
+            return
+        index = np.array(self._index, dtype=INDEX_ENTRY)
+        self._file.write(index.tobytes())
+        self._file.write(FOOTER.pack(self._offset, len(index), INDEX_MAGIC))
+        self._file.close()
+
+
+class BinaryLogReader:
+    """mmap 方式读取二进制日志
+
+    records() 产出的 payload 是映射内存的 memoryview，只在 close() 之前有效；
+    需要保留时请 bytes(payload)。没有尾部的文件 (写入中断) 在打开时扫描重建索引，并忽略末尾不完整的记录。
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            self._file.close()
+            raise BinaryLogError(f"不是二进制日志: {filename}")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, _, self.created = FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise BinaryLogError(f"不是二进制日志或版本不支持: {filename}")
+        self.complete = False
+        self.data_end = size
+        self.skipped = 0  # 最近一次 decode() 中无法拆分的记录数
+        self.index = self._read_index(size)
+
+    def __enter__(self) -> 'BinaryLogReader':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_index(self, size: int) -> np.ndarray:
+        if size >= FILE_HEADER.size + FOOTER.size:
+            index_offset, entries, magic = FOOTER.unpack_from(self._mmap, size - FOOTER.size)
+            if magic == INDEX_MAGIC and index_offset + entries * INDEX_ENTRY.itemsize + FOOTER.size == size:
+                self.complete = True
+                self.data_end = index_offset
+                # 索引直接映射为结构化数组，不复制
+                return np.frombuffer(self._mmap, dtype=INDEX_ENTRY, count=entries, offset=index_offset)
+        return self._rebuild_index(size)
+
+    def _rebuild_index(self, size: int) -> np.ndarray:
+        entries = []
+        offset = FILE_HEADER.size
+        count = 0
+        while offset + RECORD.size <= size:
+            timestamp, _, _, length = RECORD.unpack_from(self._mmap, offset)
+            if offset + RECORD.size + length > size:
+                break
+            if count % DEFAULT_INDEX_EVERY == 0:
+                entries.append((timestamp, offset))
+            offset += RECORD.size + length
+            count += 1
+        self.data_end = offset
+        return np.array(entries, dtype=INDEX_ENTRY)
+
+    def close(self):
+        """关闭映射 (仍有外部 memoryview 引用时映射在引用释放后才解除)"""
+        if self._mmap.closed:
+            return
+        # 索引是映射内存上的数组，复制后才能解除映射
+        self.index = self.index.copy()
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def time_range(self) -> Optional[Tuple[float, float]]:
+        """(第一条记录时间戳, 最后一条记录时间戳)"""
+        if not len(self.index):
+            return None
+        last = None
+        for timestamp, _, _, _ in self.records(start=float(self.index['timestamp'][-1])):
+            last = timestamp
+        return float(self.index['timestamp'][0]), last
+
+    def seek(self, start: Optional[float]) -> int:
+        """不晚于 start 的第一条记录所在块的文件偏移"""
+        if start is None or not len(self.index):
+            return FILE_HEADER.size
+        block = int(np.searchsorted(self.index['timestamp'], start, side='left')) - 1
+        return int(self.index['offset'][block]) if block >= 0 else FILE_HEADER.size
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None,
+                response: Optional[int] = None, did: Optional[int] = None
+                ) -> Iterator[Tuple[float, int, int, memoryview]]:
+        """产出 start <= 时间戳 <= end 的记录 (时间戳, 响应 header, DID, 数据)，可按 header / DID 过滤"""
+        view = self._view
+        unpack = RECORD.unpack_from
+        header_size = RECORD.size
+        offset = self.seek(start)
+        data_end = self.data_end
+        low = float('-inf') if start is None else start
+        high = float('inf') if end is None else end
+        while offset < data_end:
+            timestamp, record_response, record_did, length = unpack(view, offset)
+            payload_start = offset + header_size
+            offset = payload_start + length
+            if timestamp < low:
+                continue
+            if timestamp > high:
+                break
+            if (response is not None and record_response != response) or (did is not None and record_did != did):
+                continue
+            yield timestamp, record_response, record_did, view[payload_start:offset]
+
+    def decode(self, db: VoltPIDDatabase, start: Optional[float] = None, end: Optional[float] = None
+               ) -> Iterator[Tuple[float, VoltPID, Tuple]]:
+        """按响应 header + DID 匹配 PID 并解码，产出 (时间戳, PID, 值)
+
+        多 DID 响应 (数据比第一个 DID 的长度长) 按数据库中的 DID 长度拆分后分别解码，
+        与 LogReplayer 的处理一致；无法拆分的记录计入 self.skipped
+        """
+        pids_for = {}
+        for pid in db.pids:
+            pids_for.setdefault((int(pid.response, 16), pid.did), []).append(pid)
+        lengths = {}
+        for (response, did), pids in pids_for.items():
+            length = did_length(pids)
+            if length is not None:
+                lengths.setdefault(response, {})[did] = length
+        self.skipped = 0
+        for timestamp, response, did, payload in self.records(start, end):
+            length = lengths.get(response, {}).get(did)
+            if length is None or len(payload) == length:
+                segments = ((did, payload),)
+            else:
+                segments = self._split(response, did, payload, length, lengths.get(response, {}))
+                if segments is None:
+                    self.skipped += 1
+                    continue
+            for segment_did, segment in segments:
+                for pid in pids_for.get((response, segment_did), ()):
+                    try:
+                        yield timestamp, pid, pid.decode(segment)
+                    except ValueError:
+                        continue
+
+    @staticmethod
+    def _split(response: int, did: int, payload: memoryview, length: int, lengths):
+        """拆分数据长度与第一个 DID 不符的记录，返回 ((DID, 数据), ...)，无法解码时返回 None"""
+        message = bytes((POSITIVE_RESPONSE, did >> 8, did & 0xFF)) + payload
+        try:
+            return tuple(split_response(message, lengths=lengths).items())
+        except ResponseError:
+            if len(payload) > length:
+                # ECU 返回的数据比公式需要的长
+                return ((did, payload),)
+            return None
+
+
+class _LogConverter(LogReplayer):
+    """复用 LogReplayer 的日志解析和 ISO-TP 重组，把每条完整响应写入二进制日志而不是解码
+
+    二进制日志要求时间戳单调不减。多个日志合并时，某个文件的第一条记录早于已写入的记录
+    (如没有时间戳的 ELM 日志按行号计时，每个文件都从 1 开始) 则整个文件平移到已写入记录之后，
+    记在 shifted 中；文件内部时间倒退的记录不写入，计入 rejected。
+    """
+
+    def __init__(self, writer: BinaryLogWriter, db: Optional[VoltPIDDatabase] = None):
+        super().__init__(db, validate=False)
+        self.writer = writer
+        self.rejected = 0
+        self.shifted: List[Tuple[str, float]] = []  # (文件名, 平移秒数)
+        self._filename = ''
+        self._offset = 0.0
+        self._first = True
+
+    def start_file(self, filename: str):
+        """开始转换下一个文件 (时间戳平移按文件计算)"""
+        self._filename = filename
+        self._offset = 0.0
+        self._first = True
+
+    def feed_message(self, response_id: int, message, timestamp: float):
+        self.stats.messages += 1
+        timestamp += self._offset
+        last_time = self.writer.last_time
+        if self._first:
+            self._first = False
+            if timestamp < last_time:
+                self._offset = last_time - timestamp
+                self.shifted.append((self._filename, self._offset))
+                timestamp = last_time
+        if timestamp < last_time:
+            self.rejected += 1
+            return
+        if self.writer.write_message(response_id, message, timestamp):
+            self.stats.samples += 1
+        else:
+            self.stats.unmatched += 1
+
+
+def convert(logs: List[str], output: str, fmt: Optional[str] = None,
+            index_every: int = DEFAULT_INDEX_EVERY) -> LogReplayer:
+    """把 ELM327 文本日志 / candump 日志转换为二进制日志，返回带统计的转换器"""
+    with BinaryLogWriter(output, index_every) as writer:
+        converter = _LogConverter(writer)
+        for log in logs:
+            converter.start_file(log)
+            converter.replay_file(log, fmt)
+    return converter
+
+
+def main():
+    parser = argparse.ArgumentParser(description='二进制原始响应日志 - 转换 / 查看 / 按时间范围解码')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_convert = sub.add_parser('convert', help='把文本日志转换为二进制日志')
+    p_convert.add_argument('logs', nargs='+', help='ELM327 文本日志或 candump -L 日志')
+    p_convert.add_argument('-o', '--output', required=True, help='输出的二进制日志文件')
+    p_convert.add_argument('-f', '--format', choices=['auto', 'elm', 'candump'], default='auto', help='日志格式')
+    p_convert.add_argument('--index-every', type=int, default=DEFAULT_INDEX_EVERY, help='每多少条记录一个索引项')
+
+    p_info = sub.add_parser('info', help='显示二进制日志的基本信息')
+    p_info.add_argument('file')
+
+    p_dump = sub.add_parser('dump', help='按时间范围输出解码结果')
+    p_dump.add_argument('file')
+    p_dump.add_argument('--start', type=float, help='起始时间戳')
+    p_dump.add_argument('--end', type=float, help='结束时间戳')
+    p_dump.add_argument('-n', '--limit', type=int, default=20, help='最多输出的行数 (0 为不限)')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'convert':
+            started = time.perf_counter()
+            converter = convert(args.logs, args.output, None if args.format == 'auto' else args.format,
+                                args.index_every)
+            elapsed = time.perf_counter() - started
+            text_size = sum(os.path.getsize(log) for log in args.logs)
+            binary_size = os.path.getsize(args.output)
+            stats = converter.stats
+            print(f"{stats.frames} 帧 -> {stats.samples} 条记录 (跳过 {stats.unmatched} 条非肯定响应)，{elapsed:.2f} 秒")
+            for log, offset in converter.shifted:
+                print(f"注意：{log} 的时间戳早于之前的记录，已整体平移 {offset:.3f} 秒")
+            if converter.rejected:
+                print(f"警告：{converter.rejected} 条响应的时间戳早于前一条记录 (文件内时间倒退)，未写入")
+            if stats.errors:
+                print(f"无法解析的响应: {stats.errors} 条")
+            print(f"文本 {text_size:,} 字节 -> 二进制 {binary_size:,} 字节 ({text_size / max(binary_size, 1):.1f}x)")
+            return
+
+        with BinaryLogReader(args.file) as reader:
+            if args.command == 'info':
+                span = reader.time_range()
+                print(f"文件: {args.file} ({'完整' if reader.complete else '无尾部，已扫描重建索引'})")
+                print(f"索引项: {len(reader.index)}，数据 {reader.data_end:,} 字节")
+                if span:
+                    print(f"时间范围: {span[0]:.3f} - {span[1]:.3f} ({span[1] - span[0]:.1f} 秒)")
+                return
+
+            db = VoltPIDDatabase()
+            started = time.perf_counter()
+            count = 0
+            for timestamp, pid, values in reader.decode(db, args.start, args.end):
+                if not args.limit or count < args.limit:
+                    print(f"{timestamp:.3f} {pid.pid} {pid.description}: {values} {pid.unit}")
+                count += 1
+            elapsed = time.perf_counter() - started
+            print(f"共 {count} 个解码值，跳过 {reader.skipped} 条无法拆分的记录，{elapsed:.2f} 秒", file=sys.stderr)
+    except (FileNotFoundError, BinaryLogError) as e:
+        print(f"错误：{e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,23 +6,57 @@
 
 import csv
 import json
-from typing import List, Dict
+import sys
+from typing import List, Dict, Iterable, Optional, Tuple
+
+from pid_formula import CompiledFormula, compile_formula
+from pid_ranges import split_range
 
 class VoltPID:
-    """Volt PID 数据结构"""
+    """Volt PID 数据结构 (使用 __slots__，单位/公式/header/类别等重复字符串会被驻留共享)"""
+    __slots__ = ('pid', 'description', 'unit', 'formula', 'range_values',
+                 'header', 'response', 'category', 'notes', '_decoder')
+    
     def __init__(self, pid: str, description: str, unit: str = "", 
                  formula: str = "", range_values: str = "", 
                  header: str = "7E0", response: str = "7E8",
                  category: str = "", notes: str = ""):
-        self.pid = pid.upper()
+        self.pid = sys.intern(pid.upper())
         self.description = description
-        self.unit = unit
-        self.formula = formula
-        self.range_values = range_values
-        self.header = header
-        self.response = response
-        self.category = category
+        self.unit = sys.intern(unit)
+        self.formula = sys.intern(formula)
+        self.range_values = sys.intern(range_values)
+        self.header = sys.intern(header)
+        self.response = sys.intern(response)
+        self.category = sys.intern(category)
         self.notes = notes
+        self._decoder = None
+    
+    @property
+    def decoder(self) -> Optional[CompiledFormula]:
+        """该 PID 公式编译后的解码函数 (首次访问时编译并缓存)"""
+        if self._decoder is None or self._decoder.formula != self.formula:
+            self._decoder = compile_formula(self.formula)
+        return self._decoder
+    
+    @property
+    def request_code(self) -> str:
+        """发送给 ECU 的请求 (模式 + DID)，未写模式的代码 (如 4368) 按 Mode 22 处理"""
+        if len(self.pid) == 6 and self.pid.startswith('22'):
+            return self.pid
+        return '22' + self.pid
+    
+    @property
+    def did(self) -> int:
+        """Mode 22 数据标识符 (DID)"""
+        return int(self.request_code[2:], 16)
+    
+    def decode(self, data) -> Tuple:
+        """解码响应数据字节 (DID 回显之后的 A, B, C... 字节)"""
+        decoder = self.decoder
+        if decoder is None:
+            return ()
+        return decoder(data)
     
     def to_dict(self) -> Dict:
         return {
@@ -40,12 +74,34 @@ class VoltPID:
 class VoltPIDDatabase:
     """雪佛兰 Volt PID 数据库"""
     
+    _default_pid_data: Optional[Tuple[tuple, ...]] = None
+    
     def __init__(self):
         self.pids: List[VoltPID] = []
+        # 索引：PID 代码 / (请求 header, 代码) / (响应 header, 代码) / 类别 -> PID 列表
+        # 同一代码可能对应多个信号 (如 22002F 同时是燃油液位和剩余燃油量)
+        self._by_code: Dict[str, List[VoltPID]] = {}
+        self._by_header: Dict[Tuple[str, str], List[VoltPID]] = {}
+        self._by_response: Dict[Tuple[str, str], List[VoltPID]] = {}
+        self._by_category: Dict[str, List[VoltPID]] = {}
+        self._range_table = None
         self._load_volt_pids()
     
     def _load_volt_pids(self):
-        """加载 Volt 专用 PID 数据"""
+        """加载 Volt 专用 PID 数据
+
+        数据表在每个进程只构建一次，但每个实例都创建自己的 VoltPID 记录，
+        修改某个数据库中的记录不会影响其他实例
+        """
+        cls = VoltPIDDatabase
+        if cls._default_pid_data is None:
+            cls._default_pid_data = cls._volt_pid_data()
+        for pid_info in cls._default_pid_data:
+            self.add_pid(VoltPID(*pid_info))
+    
+    @staticmethod
+    def _volt_pid_data() -> Tuple[tuple, ...]:
+        """Volt 专用 PID 的构造参数 (不可变元组)"""
         volt_pid_data = [
             # 电池相关 PIDs
             ("22005B", "Hybrid Pack Remaining (SOC)", "%", "A*100/255", "0-100%", "7E0", "7E8", "Battery", "电池剩余电量"),
@@ -124,22 +180,86 @@ class VoltPIDDatabase:
             ("434F", "HV Battery Temperature", "°C", "A-40", "-40 to 215°C", "7E4", "5EC", "Battery", "高压电池温度 (特殊header)"),
         ]
         
-        for pid_info in volt_pid_data:
-            pid = VoltPID(*pid_info)
-            self.pids.append(pid)
+        return tuple(volt_pid_data)
+    
+    def add_pid(self, pid: VoltPID):
+        """添加 PID 并更新索引"""
+        self.pids.append(pid)
+        self._index_pid(pid)
+        self._range_table = None
+    
+    def _index_pid(self, pid: VoltPID):
+        self._by_code.setdefault(pid.pid, []).append(pid)
+        self._by_header.setdefault((pid.header.upper(), pid.pid), []).append(pid)
+        self._by_response.setdefault((pid.response.upper(), pid.pid), []).append(pid)
+        self._by_category.setdefault(pid.category.lower(), []).append(pid)
+    
+    def rebuild_indexes(self):
+        """直接修改 self.pids 后重建索引"""
+        self._by_code.clear()
+        self._by_header.clear()
+        self._by_response.clear()
+        self._by_category.clear()
+        self._range_table = None
+        for pid in self.pids:
+            self._index_pid(pid)
     
     def get_pids_by_category(self, category: str) -> List[VoltPID]:
         """按类别获取 PID"""
-        return [pid for pid in self.pids if pid.category.lower() == category.lower()]
+        return list(self._by_category.get(category.lower(), ()))
     
     def get_pid_by_code(self, pid_code: str) -> VoltPID:
-        """根据 PID 代码获取特定 PID"""
-        pid_code = pid_code.upper()
-        for pid in self.pids:
-            if pid.pid == pid_code:
-                return pid
-        return None
+        """根据 PID 代码获取特定 PID (同一代码有多个信号时返回第一个)"""
+        pids = self._by_code.get(pid_code.upper())
+        return pids[0] if pids else None
+    
+    def get_pids_by_code(self, pid_code: str) -> List[VoltPID]:
+        """根据 PID 代码获取该代码解码出的所有信号"""
+        return list(self._by_code.get(pid_code.upper(), ()))
+    
+    def get_pids_by_header(self, header: str, pid_code: str) -> List[VoltPID]:
+        """根据请求 header 和 PID 代码获取 PID"""
+        return list(self._by_header.get((header.upper(), pid_code.upper()), ()))
     
+    def get_pids_by_response(self, response: str, pid_code: str) -> List[VoltPID]:
+        """根据响应 header 和 PID 代码获取 PID，用于响应分发"""
+        return list(self._by_response.get((response.upper(), pid_code.upper()), ()))
+    
+    def decode_response(self, pid_code: str, data, response: str = None) -> List[Tuple[VoltPID, Tuple]]:
+        """解码一条响应数据，返回该代码下每个信号的 (PID, 解码值)"""
+        if response:
+            pids = self._by_response.get((response.upper(), pid_code.upper()), ())
+        else:
+            pids = self._by_code.get(pid_code.upper(), ())
+        return [(pid, pid.decode(data)) for pid in pids]
+    
+    def decode_batch(self, pid, payloads, payload_length: Optional[int] = None):
+        """批量解码某个 PID 的定长原始响应数据，返回 NumPy 数组
+
+        pid 可以是 PID 代码或 VoltPID 对象；payloads 为连续字节缓冲区或 (N, 长度) 的 uint8 数组。
+        """
+        from pid_batch_decoder import decode_batch
+
+        if isinstance(pid, str):
+            code = pid
+            pid = self.get_pid_by_code(code)
+            if pid is None:
+                raise KeyError(f"未知的 PID: {code}")
+        return decode_batch(pid, payloads, payload_length)
+
+    @property
+    def range_table(self):
+        """与 self.pids 顺序对应的数值量程表 (pid_ranges.RangeTable，首次访问时解析，PID 变化后重建)"""
+        if self._range_table is None:
+            from pid_ranges import RangeTable
+            
+            self._range_table = RangeTable(self.pids)
+        return self._range_table
+    
+    def validate_batch(self, pid: VoltPID, values):
+        """decode_batch 结果中每个采样是否在量程内，返回布尔数组"""
+        return self.range_table.valid_mask(pid, values)
+
     def get_all_categories(self) -> List[str]:
         """获取所有类别"""
         categories = set(pid.category for pid in self.pids if pid.category)
@@ -173,6 +293,23 @@ class VoltPIDDatabase:
         
         print(f"已导出 {len(self.pids)} 条雪佛兰 Volt PID 到 {filename}")
     
+    def export_stream(self, filename: str, fmt: str, pids: Optional[Iterable[VoltPID]] = None) -> int:
+        """流式导出 (csv / jsonl / json / excel)，pids 可以是任意 VoltPID 迭代器，默认按类别排序导出全部"""
+        from obd_export import write_stream
+        
+        if pids is None:
+            pids = sorted(self.pids, key=lambda x: (x.category, x.pid))
+        fieldnames = ['PID', 'Description', 'Unit', 'Formula', 'Range', 
+                     'OBD Header', 'Response', 'Category', 'Notes']
+        try:
+            count = write_stream(pids, filename, fmt, fieldnames)
+        except ImportError:
+            print("错误：需要安装 openpyxl 来导出 Excel 文件: pip install openpyxl")
+            return 0
+        
+        print(f"已导出 {count} 条雪佛兰 Volt PID 到 {filename}")
+        return count
+    
     def export_torque_csv(self, filename: str = "volt_torque_pids.csv"):
         """导出 Torque Pro 应用专用格式"""
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
@@ -200,24 +337,9 @@ class VoltPIDDatabase:
         print(f"已导出 Torque Pro 格式文件到 {filename}")
     
     def _extract_min_max(self, range_str: str) -> tuple:
-        """从范围字符串中提取最小值和最大值"""
-        if not range_str:
-            return ("", "")
-        
-        import re
-        # 尝试匹配 "min-max" 或 "min to max" 格式
-        patterns = [
-            r'(-?\d+\.?\d*)\s*-\s*(\d+\.?\d*)',
-            r'(-?\d+\.?\d*)\s+to\s+(\d+\.?\d*)',
-            r'(\d+\.?\d*)\s*~\s*(\d+\.?\d*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, range_str)
-            if match:
-                return (match.group(1), match.group(2))
-        
-        return ("", "")
+        """从范围中提取最小值和最大值 ("min-max"、"min to max"、"min~max"，支持负数上下限)"""
+        bounds = split_range(range_str)
+        return bounds if bounds is not None else ("", "")
     
     def print_summary(self):
         """打印 PID 数据库摘要"""
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+死区 / 变化量压缩
+大多数 Volt 信号 (A-40 的温度、燃油液位、SOC) 的变化远慢于轮询频率，录制结果中是大段相同的值。
+按 PID 公式求出量化步长 (如 1 °C、100/255 %、0.01 A)，只保留相对上一个保留值变化超过死区
+或距上一个保留值超过心跳间隔的采样；读取时按阶梯 (采样保持) 重建，死区小于一个步长时与原序列完全一致
+"""
+
+import argparse
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+from pid_formula import quantization_steps
+
+# 死区默认为半个量化步长：解码值只要变化一个步长就保留，重建无损
+DEFAULT_DEADBAND = 0.5
+DEFAULT_HEARTBEAT = 60.0
+
+
+def reconstruct(kept_times, kept_values, timestamps) -> np.ndarray:
+    """按阶梯重建：每个时间点取不晚于它的最后一个保留值，早于第一个保留值的为 NaN"""
+    kept_times = np.asarray(kept_times, dtype=np.float64)
+    kept_values = np.asarray(kept_values)
+    index = np.searchsorted(kept_times, np.asarray(timestamps, dtype=np.float64), side='right') - 1
+    result = kept_values[np.maximum(index, 0)].astype(np.float64)
+    result[index < 0] = np.nan
+    return result
+
+
+class _Channel:
+    """一个信号的压缩状态"""
+    __slots__ = ('pid', 'tolerance', 'scalar_tolerance', 'lossless', 'ref_time', 'ref_value',
+                 'last_time', 'last_value', 'last_kept', 'seen', 'kept')
+
+    def __init__(self, pid: VoltPID, tolerance: np.ndarray):
+        self.pid = pid
+        self.tolerance = tolerance   # 每个输出的死区 (绝对值)
+        self.scalar_tolerance = float(tolerance[0]) if len(tolerance) == 1 else None
+        self.lossless = False        # 死区小于量化步长：每个变化点都必然保留
+        self.ref_time: Optional[float] = None
+        self.ref_value = None        # 上一个保留的值
+        self.last_time: Optional[float] = None
+        self.last_value = None       # 上一个收到的值 (可能未保留)
+        self.last_kept = True
+        self.seen = 0
+        self.kept = 0
+
+    def exceeds(self, value) -> bool:
+        """value 相对上一个保留值是否超出死区 (NaN 与非 NaN 之间的变化也算)"""
+        ref = self.ref_value
+        if self.scalar_tolerance is not None and np.ndim(value) == 0:
+            # 单输出：用 Python 浮点比较，避免逐个采样创建数组
+            value, ref = float(value), float(ref)
+            if value != value or ref != ref:
+                return (value != value) != (ref != ref)
+            return abs(value - ref) > self.scalar_tolerance
+        delta = np.abs(np.asarray(value, dtype=np.float64) - ref)
+        changed = np.isnan(np.asarray(value, dtype=np.float64)) != np.isnan(np.asarray(ref, dtype=np.float64))
+        return bool(np.any((delta > self.tolerance) | changed))
+
+
+class DeadbandFilter:
+    """按 PID 的死区 / 心跳过滤采样
+
+    deadband 以量化步长为单位 (默认 0.5，即任何真实变化都保留)；overrides 按 PID 代码指定绝对死区
+    (与解码值同单位)。heartbeat 秒内没有保留过采样时，无论是否变化都保留一个，
+    使读取端能区分 "值未变化" 和 "没有数据"。位字段没有量化步长，只在值变化时保留。
+    """
+
+    def __init__(self, db: Optional[VoltPIDDatabase] = None, deadband: float = DEFAULT_DEADBAND,
+                 heartbeat: Optional[float] = DEFAULT_HEARTBEAT, overrides: Optional[Dict[str, float]] = None):
+        self.db = db or VoltPIDDatabase()
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        self.overrides = {code.upper(): value for code, value in (overrides or {}).items()}
+        self._channels: Dict[int, _Channel] = {}
+
+    def tolerance(self, pid: VoltPID) -> np.ndarray:
+        """一个 PID 各输出的绝对死区"""
+        override = self.overrides.get(pid.pid.upper())
+        decoder = pid.decoder
+        steps = quantization_steps(decoder) if decoder is not None else (None,)
+        if override is not None:
+            return np.full(len(steps), float(override))
+        return np.array([self.deadband * step if step is not None else 0.0 for step in steps])
+
+    def _channel(self, pid: VoltPID) -> _Channel:
+        channel = self._channels.get(id(pid))
+        if channel is None:
+            channel = self._channels[id(pid)] = _Channel(pid, self.tolerance(pid))
+            steps = quantization_steps(pid.decoder) if pid.decoder is not None else (None,)
+            channel.lossless = all(tolerance < (step or 0.0) or (step is None and tolerance == 0)
+                                   for tolerance, step in zip(channel.tolerance, steps))
+        return channel
+
+    def _with_heartbeats(self, channel: _Channel, timestamps: np.ndarray, points: np.ndarray) -> np.ndarray:
+        """在相邻两个保留点相隔超过心跳间隔的区段中补上心跳采样"""
+        heartbeat = self.heartbeat
+        if heartbeat is None:
+            return points
+        n = len(timestamps)
+        ref_time = channel.ref_time if channel.ref_time is not None else -np.inf
+        gap_start_times = np.concatenate(([ref_time], timestamps[points]))
+        gap_first = np.concatenate(([0], points + 1))
+        gap_end = np.append(points, n)
+        nonempty = gap_end > gap_first
+        last_in_gap = timestamps[np.maximum(gap_end - 1, 0)]
+        beats: List[int] = []
+        for gap in np.flatnonzero(nonempty & (last_in_gap - gap_start_times >= heartbeat)).tolist():
+            start_time, end = gap_start_times[gap], gap_end[gap]
+            index = int(np.searchsorted(timestamps, start_time + heartbeat, side='left'))
+            while index < end:
+                beats.append(index)
+                index = max(index + 1, int(np.searchsorted(timestamps, timestamps[index] + heartbeat,
+                                                           side='left')))
+        if not beats:
+            return points
+        return np.sort(np.concatenate((points, np.asarray(beats, dtype=points.dtype))))
+
+    def _keep(self, channel: _Channel, timestamp: float, value):
+        channel.ref_time = timestamp
+        channel.ref_value = value
+        channel.kept += 1
+
+    def accept(self, pid: VoltPID, timestamp: float, values: Tuple) -> bool:
+        """单个采样是否需要保留 (VoltPID.decode / ELM327 客户端 Sample 的值)"""
+        channel = self._channel(pid)
+        value = values[0] if len(values) == 1 else values
+        channel.seen += 1
+        channel.last_time, channel.last_value = timestamp, value
+        keep = (channel.ref_time is None
+                or (self.heartbeat is not None and timestamp - channel.ref_time >= self.heartbeat)
+                or channel.exceeds(value))
+        if keep:
+            self._keep(channel, timestamp, value)
+        channel.last_kept = keep
+        return keep
+
+    def filter(self, pid: VoltPID, timestamps, values) -> Tuple[np.ndarray, np.ndarray]:
+        """整批过滤一个 PID 的采样 (时间戳已排序)，返回保留的 (时间戳, 值)
+
+        只有与前一个采样不同的位置才可能因死区被保留 (值不变时与保留值的差也不变)，
+        因此逐个检查的只是变化点和心跳点，其余采样在 NumPy 中一次跳过。
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values)
+        n = len(timestamps)
+        if not n:
+            return timestamps, values
+        channel = self._channel(pid)
+        flat = values if values.ndim == 1 else values.reshape(n, -1)
+
+        # 变化点：与前一个采样 (第一个采样与上一批的最后一个) 不同
+        previous = np.empty_like(flat)
+        previous[1:] = flat[:-1]
+        if channel.last_value is not None:
+            previous[0] = channel.last_value
+        differs = flat != previous
+        if flat.dtype.kind == 'f':
+            differs &= ~(np.isnan(flat) & np.isnan(previous))
+        if differs.ndim == 2:
+            differs = differs.any(axis=1)
+        if channel.last_value is None:
+            differs[0] = True
+        if channel.lossless:
+            kept_index = self._with_heartbeats(channel, timestamps, np.flatnonzero(differs))
+            if len(kept_index):
+                last = int(kept_index[-1])
+                channel.ref_time, channel.ref_value = float(timestamps[last]), flat[last].copy()
+                channel.kept += len(kept_index)
+            return self._finish(channel, timestamps, values, flat, kept_index)
+        candidates = np.flatnonzero(differs).tolist()
+
+        kept: List[int] = []
+        heartbeat = self.heartbeat
+
+        def next_heartbeat(start: int) -> int:
+            if heartbeat is None or channel.ref_time is None:
+                return n
+            return max(start, int(np.searchsorted(timestamps, channel.ref_time + heartbeat, side='left')))
+
+        beat = next_heartbeat(0)
+        for index in candidates + [n]:
+            while beat < index:
+                kept.append(beat)
+                self._keep(channel, float(timestamps[beat]), flat[beat])
+                beat = next_heartbeat(beat + 1)
+            if index == n:
+                break
+            if channel.ref_time is None or channel.exceeds(flat[index]):
+                kept.append(index)
+                self._keep(channel, float(timestamps[index]), flat[index])
+                beat = next_heartbeat(index + 1)
+
+        return self._finish(channel, timestamps, values, flat, np.asarray(kept, dtype=np.intp))
+
+    @staticmethod
+    def _finish(channel: _Channel, timestamps: np.ndarray, values: np.ndarray, flat: np.ndarray,
+                kept_index: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(timestamps)
+        channel.seen += n
+        channel.last_time, channel.last_value = float(timestamps[-1]), flat[-1].copy()
+        channel.last_kept = bool(len(kept_index)) and int(kept_index[-1]) == n - 1
+        return timestamps[kept_index], values[kept_index]
+
+    def tails(self) -> Iterator[Tuple[VoltPID, float, object]]:
+        """各信号最后一个未保留的采样 (录制结束时写入，使重建的序列延续到真实的结束时间)"""
+        for channel in self._channels.values():
+            if not channel.last_kept and channel.last_time is not None:
+                channel.last_kept = True
+                self._keep(channel, channel.last_time, channel.last_value)
+                yield channel.pid, channel.last_time, channel.last_value
+
+    def stats(self) -> Tuple[int, int]:
+        """(收到的采样数, 保留的采样数)"""
+        return (sum(c.seen for c in self._channels.values()),
+                sum(c.kept for c in self._channels.values()))
+
+    def summary(self) -> str:
+        seen, kept = self.stats()
+        ratio = seen / kept if kept else 0.0
+        return f"收到 {seen} 个采样，保留 {kept} 个 (压缩比 {ratio:.1f}x)"
+
+
+class FilteredSink:
+    """在写入端之前应用死区过滤的包装
+
+    sink 可以是 TimeSeriesStore、RollupEngine、SQLiteIngestWriter 等带 append(pid, timestamp, values)
+    的对象；有 extend(pid, timestamps, values) 时整批转发。close() 先写入各信号的结尾采样。
+    """
+
+    def __init__(self, sink, deadband: Optional[DeadbandFilter] = None):
+        self.sink = sink
+        self.filter = deadband or DeadbandFilter(getattr(sink, 'db', None))
+
+    def append(self, pid: VoltPID, timestamp: float, values: Tuple, *args):
+        if self.filter.accept(pid, timestamp, values):
+            self.sink.append(pid, timestamp, values, *args)
+
+    def ingest(self, samples):
+        for sample in samples:
+            self.append(sample.pid, sample.timestamp, sample.values)
+
+    def extend(self, pid: VoltPID, timestamps, values):
+        timestamps, values = self.filter.filter(pid, timestamps, values)
+        if hasattr(self.sink, 'extend'):
+            self.sink.extend(pid, timestamps, values)
+            return
+        for timestamp, value in zip(timestamps.tolist(), values.tolist()):
+            self.sink.append(pid, timestamp, value if isinstance(value, list) else (value,))
+
+    def close(self):
+        for pid, timestamp, value in self.filter.tails():
+            self.sink.append(pid, timestamp, tuple(value) if np.ndim(value) else (value,))
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='死区压缩演示 (模拟器信号，检查压缩比和重建误差)')
+    parser.add_argument('-s', '--seconds', type=float, default=3600, help='模拟的时长 (秒)')
+    parser.add_argument('--rate', type=float, default=10.0, help='每个信号的采样率 (Hz)')
+    parser.add_argument('-d', '--deadband', type=float, default=DEFAULT_DEADBAND, help='死区 (量化步长的倍数)')
+    parser.add_argument('--heartbeat', type=float, default=DEFAULT_HEARTBEAT, help='心跳间隔 (秒)，0 为关闭')
+
+    args = parser.parse_args()
+
+    import random
+
+    from elm327_simulator import SignalGenerator
+
+    db = VoltPIDDatabase()
+    deadband = DeadbandFilter(db, args.deadband, args.heartbeat or None)
+    count = int(args.seconds * args.rate)
+    timestamps = time.time() + np.arange(count) / args.rate
+    rng = random.Random(1)
+    worst = 0.0
+    started = time.perf_counter()
+    filter_seconds = 0.0
+    for pid in db.pids:
+        if pid.decoder is None:
+            continue
+        generator = SignalGenerator(pid.decoder, pid.range_values, pid.decoder.byte_count or 1, rng)
+        # 模拟器的信号每个采样都在变化，这里按轮询频率的 1/20 更新一次，接近真实的慢变信号
+        raw = [generator.next() for _ in range(count // 20 + 1)]
+        payloads = b''.join(raw[i // 20] for i in range(count))
+        values = db.decode_batch(pid, payloads, len(raw[0]))
+        filter_started = time.perf_counter()
+        kept_times, kept_values = deadband.filter(pid, timestamps, values)
+        filter_seconds += time.perf_counter() - filter_started
+        if values.dtype.kind == 'f':
+            rebuilt = reconstruct(kept_times, kept_values, timestamps)
+            worst = max(worst, float(np.nanmax(np.abs(rebuilt - values)) / (deadband.tolerance(pid)[0] or 1)))
+    elapsed = time.perf_counter() - started
+    list(deadband.tails())
+    print(deadband.summary())
+    print(f"过滤 {filter_seconds:.2f} 秒 (总计 {elapsed:.2f} 秒)，最大重建误差 {worst:.2f} 倍死区")
+
+
+if __name__ == '__main__':
+    main()
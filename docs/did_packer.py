@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Mode 22 多 DID 请求打包
+UDS ReadDataByIdentifier (0x22) 允许一次请求多个 DID (ECU 支持时)。
+按每个 VoltPID 公式推导出的数据长度，把同一 header 的 DID 合并为多 DID 请求，
+并提供对应的响应拆分器，把每段数据交给正确的解码器，减少总线往返次数
+"""
+
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+
+SERVICE_READ_DID = 0x22
+POSITIVE_RESPONSE = SERVICE_READ_DID + 0x40
+NEGATIVE_RESPONSE = 0x7F
+
+# 经典 CAN 单帧最多 7 字节有效载荷 (多帧请求需要流控，ELM327 不支持发送)
+SINGLE_FRAME_PAYLOAD = 7
+# ISO-TP (ISO 15765-2) 单条消息最大长度
+ISOTP_MAX_PAYLOAD = 4095
+DID_SIZE = 2
+
+# 常见否定响应码
+NRC_NAMES = {
+    0x10: 'generalReject',
+    0x11: 'serviceNotSupported',
+    0x12: 'subFunctionNotSupported',
+    0x13: 'incorrectMessageLengthOrInvalidFormat',
+    0x14: 'responseTooLong',
+    0x22: 'conditionsNotCorrect',
+    0x31: 'requestOutOfRange',
+    0x33: 'securityAccessDenied',
+    0x78: 'responsePending',
+}
+
+
+class ResponseError(ValueError):
+    """响应格式错误或与请求不匹配"""
+
+
+class EchoMismatchError(ResponseError):
+    """响应回显的 DID 与请求不符 (流水线发送时通常说明响应与命令的对应已错位)"""
+
+
+class NegativeResponseError(ResponseError):
+    """ECU 返回否定响应 (7F 22 NRC)"""
+
+    def __init__(self, service: int, nrc: int):
+        self.service = service
+        self.nrc = nrc
+        name = NRC_NAMES.get(nrc, 'unknown')
+        super().__init__(f"ECU 否定响应：服务 0x{service:02X}，NRC 0x{nrc:02X} ({name})")
+
+
+def did_length(pids: Iterable[VoltPID]) -> Optional[int]:
+    """同一 DID 上各信号公式所需的数据长度，无法确定时返回 None"""
+    length = None
+    for pid in pids:
+        decoder = pid.decoder
+        if decoder is None or not decoder.byte_count:
+            return None
+        length = max(length or 0, decoder.byte_count)
+    return length
+
+
+class PackedRequest:
+    """一条多 DID 请求 (同一 header)"""
+    __slots__ = ('header', 'response', 'dids', 'pids', 'lengths')
+
+    def __init__(self, header: str, response: str):
+        self.header = header
+        self.response = response
+        self.dids: List[int] = []
+        self.pids: Dict[int, List[VoltPID]] = {}     # DID -> 共用该 DID 的信号
+        self.lengths: Dict[int, Optional[int]] = {}  # DID -> 数据长度 (None 表示未知)
+
+    def add(self, did: int, pids: List[VoltPID], length: Optional[int]):
+        self.dids.append(did)
+        self.pids[did] = pids
+        self.lengths[did] = length
+
+    @property
+    def payload(self) -> bytes:
+        """请求字节：22 DID1 DID2 ..."""
+        return bytes([SERVICE_READ_DID]) + b''.join(did.to_bytes(DID_SIZE, 'big') for did in self.dids)
+
+    @property
+    def command(self) -> str:
+        """发送给 ELM327 的十六进制命令"""
+        return self.payload.hex().upper()
+
+    @property
+    def request_size(self) -> int:
+        return 1 + DID_SIZE * len(self.dids)
+
+    @property
+    def response_size(self) -> Optional[int]:
+        """预期的肯定响应长度，任一 DID 长度未知时返回 None"""
+        if any(length is None for length in self.lengths.values()):
+            return None
+        return 1 + sum(DID_SIZE + length for length in self.lengths.values())
+
+    def split(self, data) -> Dict[int, memoryview]:
+        """按本请求的 DID 顺序拆分响应"""
+        return split_response(data, self.dids, self.lengths)
+
+    def decode(self, data) -> List[Tuple[VoltPID, Tuple]]:
+        """拆分响应并用各信号的公式解码，返回 [(VoltPID, 解码值)]"""
+        results = []
+        for did, segment in self.split(data).items():
+            for pid in self.pids[did]:
+                results.append((pid, pid.decode(segment)))
+        return results
+
+    def __repr__(self) -> str:
+        return f"PackedRequest({self.header} {self.command})"
+
+
+def pack_requests(pids: Iterable[VoltPID], max_dids: int = 3,
+                  request_limit: int = SINGLE_FRAME_PAYLOAD,
+                  response_limit: int = ISOTP_MAX_PAYLOAD) -> List[PackedRequest]:
+    """把 PID 按 header 合并为多 DID 请求
+
+    每条请求最多 max_dids 个 DID (不支持多 DID 的 ECU 传 1)，请求字节数不超过
+    request_limit (默认单帧 7 字节，即最多 3 个 DID)，预期响应不超过 response_limit。
+    数据长度未知的 DID (如位编码) 单独请求，以便拆分时把剩余字节全部交给它。
+    """
+    # 按 (header, DID) 去重，保持首次出现的顺序
+    groups: Dict[Tuple[str, str], Dict[int, List[VoltPID]]] = {}
+    for pid in pids:
+        key = (pid.header.upper(), pid.response.upper())
+        did_pids = groups.setdefault(key, {}).setdefault(pid.did, [])
+        if pid not in did_pids:
+            did_pids.append(pid)
+
+    max_dids = max(1, min(max_dids, (request_limit - 1) // DID_SIZE))
+    requests: List[PackedRequest] = []
+    for (header, response), dids in groups.items():
+        current: Optional[PackedRequest] = None
+        current_size = 1
+        for did, did_pids in dids.items():
+            length = did_length(did_pids)
+            if length is None:
+                single = PackedRequest(header, response)
+                single.add(did, did_pids, None)
+                requests.append(single)
+                continue
+            segment = DID_SIZE + length
+            if current is None or len(current.dids) >= max_dids or current_size + segment > response_limit:
+                current = PackedRequest(header, response)
+                current_size = 1
+                requests.append(current)
+            current.add(did, did_pids, length)
+            current_size += segment
+    return requests
+
+
+def _check_header(data: memoryview) -> memoryview:
+    """检查响应服务字节，返回去掉服务字节后的数据"""
+    if not data:
+        raise ResponseError("空响应")
+    if data[0] == NEGATIVE_RESPONSE:
+        if len(data) < 3:
+            raise ResponseError(f"否定响应长度不足: {bytes(data).hex().upper()}")
+        raise NegativeResponseError(data[1], data[2])
+    if data[0] != POSITIVE_RESPONSE:
+        raise ResponseError(f"非 ReadDataByIdentifier 响应: {bytes(data).hex().upper()}")
+    return data[1:]
+
+
+def split_response(data, dids: Optional[List[int]] = None,
+                   lengths: Optional[Dict[int, Optional[int]]] = None) -> Dict[int, memoryview]:
+    """拆分多 DID 肯定响应 (62 DID1 数据1 DID2 数据2 ...)，返回 {DID: 数据}
+
+    提供 dids (请求顺序) 时按顺序匹配：每段至少取公式长度，若紧随其后的两个字节
+    不是下一个 DID 的回显，则向后查找回显位置 (ECU 返回的数据比公式长时)；最后一段
+    取剩余全部字节。未提供 dids 时按 lengths (DID -> 长度，如 catalog_lengths())
+    逐段读取回显的 DID。data 可以是 bytes 或 memoryview (如 ISO-TP 重组结果)，
+    返回的各段是其 memoryview 切片，不复制数据。
+    """
+    body = _check_header(memoryview(data))
+    lengths = lengths or {}
+    segments: Dict[int, memoryview] = {}
+    pos = 0
+
+    if dids is None:
+        while pos < len(body):
+            if pos + DID_SIZE > len(body):
+                raise ResponseError(f"响应在偏移 {pos + 1} 处截断")
+            did = int.from_bytes(body[pos:pos + DID_SIZE], 'big')
+            length = lengths.get(did)
+            if length is None:
+                raise ResponseError(f"未知 DID 0x{did:04X} 的数据长度")
+            start = pos + DID_SIZE
+            if start + length > len(body):
+                raise ResponseError(f"DID 0x{did:04X} 数据不足 {length} 字节")
+            segments[did] = body[start:start + length]
+            pos = start + length
+        return segments
+
+    for i, did in enumerate(dids):
+        echo = int.from_bytes(body[pos:pos + DID_SIZE], 'big') if pos + DID_SIZE <= len(body) else None
+        if echo != did:
+            raise EchoMismatchError(f"期望 DID 0x{did:04X}，偏移 {pos + 1} 处为 {body[pos:pos + DID_SIZE].hex().upper() or '空'}")
+        start = pos + DID_SIZE
+        if i + 1 == len(dids):
+            end = len(body)
+        else:
+            end = start + (lengths.get(did) or 0)
+            next_echo = dids[i + 1].to_bytes(DID_SIZE, 'big')
+            if body[end:end + DID_SIZE] != next_echo:
+                # 少见的情况，复制剩余部分查找下一个回显
+                found = bytes(body[end:]).find(next_echo)
+                if found < 0:
+                    raise ResponseError(f"响应中找不到 DID 0x{dids[i + 1]:04X}")
+                end += found
+        if end - start < (lengths.get(did) or 0):
+            raise ResponseError(f"DID 0x{did:04X} 数据不足 {lengths[did]} 字节")
+        segments[did] = body[start:end]
+        pos = end
+    return segments
+
+
+def catalog_lengths(db: VoltPIDDatabase, header: Optional[str] = None) -> Dict[int, int]:
+    """数据库中每个 DID 的数据长度 (可按请求 header 过滤)，用于无请求上下文的拆分"""
+    by_did: Dict[int, List[VoltPID]] = {}
+    for pid in db.pids:
+        if header is None or pid.header.upper() == header.upper():
+            by_did.setdefault(pid.did, []).append(pid)
+    lengths = {}
+    for did, pids in by_did.items():
+        length = did_length(pids)
+        if length is not None:
+            lengths[did] = length
+    return lengths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Volt Mode 22 多 DID 请求打包')
+    parser.add_argument('pids', nargs='*', help='PID 代码 (默认使用关键监控参数)')
+    parser.add_argument('-n', '--max-dids', type=int, default=3, help='每条请求最多的 DID 数')
+    parser.add_argument('-a', '--all', action='store_true', help='打包数据库中的全部 PID')
+
+    args = parser.parse_args()
+
+    db = VoltPIDDatabase()
+    if args.all:
+        selected = db.pids
+    else:
+        codes = args.pids or ['22005B', '2204AF', '2204B0', '220273', '220274', '22000C',
+                              '22002F', '220005', '224373', '224372', '2243A5', '4368', '4369']
+        selected = []
+        for code in codes:
+            pids = db.get_pids_by_code(code)
+            if not pids:
+                print(f"错误：未知的 PID {code}")
+                return
+            selected.extend(pids)
+
+    requests = pack_requests(selected, max_dids=args.max_dids)
+    single = len({(pid.header, pid.did) for pid in selected})
+    print(f"\n=== 多 DID 请求打包 ===")
+    print(f"{single} 个 DID 合并为 {len(requests)} 条请求 (每轮减少 {single - len(requests)} 次往返)")
+    for request in requests:
+        size = request.response_size
+        names = ', '.join(pid.description for did in request.dids for pid in request.pids[did])
+        print(f"  {request.header}  {request.command:14s} 响应 {size if size is not None else '?':>3} 字节  {names}")
+
+
+if __name__ == '__main__':
+    main()
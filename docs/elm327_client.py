@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+asyncio ELM327 客户端
+通过 TCP (WiFi 适配器) 或串口 / 伪终端与 ELM327 通信：按 '>' 提示符整块读取响应 (不逐字节读)，
+在适配器允许时保持有限个请求同时在途，用 VoltPIDDatabase 的公式解码，并以异步迭代器产出采样
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Iterable, List, Optional, Tuple, Union
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+from did_packer import EchoMismatchError, PackedRequest, ResponseError, pack_requests
+
+PROMPT = b'>'
+DEFAULT_TIMEOUT = 5.0
+# 超时后重新同步时，链路静默这么久 (秒) 即认为迟到的响应已全部丢弃
+RESYNC_QUIET = 0.25
+INIT_COMMANDS = ('ATZ', 'ATE0', 'ATL0', 'ATS0', 'ATH0', 'ATSP6')
+
+# 适配器返回的错误信息
+ADAPTER_ERRORS = ('?', 'NO DATA', 'CAN ERROR', 'BUS BUSY', 'BUS ERROR', 'BUFFER FULL', 'DATA ERROR',
+                  'FB ERROR', 'STOPPED', 'UNABLE TO CONNECT', 'ACT ALERT', 'LV RESET')
+
+
+class AdapterError(RuntimeError):
+    """适配器返回错误信息 (NO DATA、CAN ERROR 等) 或连接中断"""
+
+
+class Sample:
+    """一次解码后的采样"""
+    __slots__ = ('timestamp', 'pid', 'values')
+
+    def __init__(self, timestamp: float, pid: VoltPID, values: Tuple):
+        self.timestamp = timestamp
+        self.pid = pid
+        self.values = values
+
+    def __repr__(self) -> str:
+        return f"Sample({self.pid.pid} {self.values} @ {self.timestamp:.3f})"
+
+
+class ClientStats:
+    """请求 / 采样计数，用于吞吐量测量"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.samples = 0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def request_rate(self) -> float:
+        elapsed = self.elapsed()
+        return self.requests / elapsed if elapsed else 0.0
+
+    def sample_rate(self) -> float:
+        elapsed = self.elapsed()
+        return self.samples / elapsed if elapsed else 0.0
+
+
+def parse_response(text: str) -> bytes:
+    """把 ATH0 下的响应文本解析为字节，支持多帧格式 ("00D" 长度行 + "0:" "1:" 帧行)"""
+    length = None
+    chunks = []
+    for line in text.replace('\n', '\r').split('\r'):
+        line = line.strip()
+        if not line or line.startswith('SEARCHING'):
+            continue
+        if line in ADAPTER_ERRORS or line.startswith('ERR'):
+            raise AdapterError(line)
+        line = line.replace(' ', '')
+        if len(line) == 3 and length is None and not chunks:
+            length = int(line, 16)
+            continue
+        if len(line) > 2 and line[1] == ':':
+            line = line[2:]
+        chunks.append(line)
+    try:
+        data = bytes.fromhex(''.join(chunks))
+    except ValueError:
+        raise AdapterError(f"无法解析的响应: {text!r}")
+    return data[:length] if length is not None else data
+
+
+class ELM327Client:
+    """ELM327 异步客户端
+
+    max_inflight 为同时在途的命令数。原装 ELM327 在处理命令时收到新字符会中止当前命令，
+    只能为 1；带缓冲的 WiFi 桥接和模拟器可以设置更大的值，省去每条请求的链路往返。
+    响应按 FIFO 对应到命令，某条命令超时后无法再确定之后的 '>' 属于哪条命令，
+    因此会让所有在途命令失败并重新同步 (见 _resync)。
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 db: Optional[VoltPIDDatabase] = None, max_inflight: int = 1,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.reader = reader
+        self.writer = writer
+        self.db = db or VoltPIDDatabase()
+        self.max_inflight = max(1, max_inflight)
+        self.timeout = timeout
+        self.stats = ClientStats()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._pending: Deque[asyncio.Future] = deque()
+        # 重新同步期间清除，_send 等待其置位后才发送新命令
+        self._synced = asyncio.Event()
+        self._synced.set()
+        self._resync_lock = asyncio.Lock()
+        # 连接断开或已关闭后为对应的 AdapterError，之后的 _send 直接抛出
+        self._closed: Optional[AdapterError] = None
+        self._header: Optional[str] = None
+        self._receive: Optional[str] = None
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def open_tcp(cls, host: str, port: int, **kwargs) -> 'ELM327Client':
+        """连接 TCP 适配器 (如 WiFi ELM327 或本地模拟器)"""
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, **kwargs)
+
+    @classmethod
+    async def open_serial(cls, path: str, baudrate: int = 38400, **kwargs) -> 'ELM327Client':
+        """打开串口或伪终端 (原始模式)"""
+        import termios
+        import tty
+
+        fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(fd)
+        speed = getattr(termios, f"B{baudrate}", None)
+        if speed is not None:
+            attrs = termios.tcgetattr(fd)
+            attrs[4] = attrs[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                     os.fdopen(fd, 'rb', buffering=0))
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin,
+                                                            os.fdopen(os.dup(fd), 'wb', buffering=0))
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        return cls(reader, writer, **kwargs)
+
+    async def close(self):
+        self.writer.close()
+        await self._stop_reader()
+        self._shutdown(AdapterError("连接已关闭"))
+
+    async def _stop_reader(self):
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _read_loop(self):
+        """按 '>' 切分响应，依次交给最早发出的命令"""
+        try:
+            while True:
+                data = await self.reader.readuntil(PROMPT)
+                future = self._pending.popleft() if self._pending else None
+                if future is None:
+                    continue
+                self._slots.release()
+                if not future.done():
+                    future.set_result((data[:-1].decode('ascii', 'replace'), time.time()))
+        except (asyncio.IncompleteReadError, ConnectionError) as exc:
+            self._shutdown(AdapterError(f"连接已断开: {exc}"))
+
+    def _fail_pending(self, error: AdapterError) -> int:
+        """让所有在途命令以 error 失败，返回移除的命令数"""
+        count = len(self._pending)
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+                # 调用方可能在等待之前就因 _send 失败而放弃了这个 future，避免 "exception was never retrieved"
+                future.exception()
+        return count
+
+    def _shutdown(self, error: AdapterError):
+        """连接不再可用：记录原因，让在途命令失败并归还名额，唤醒等待名额的 _send (随后抛出 error)"""
+        if self._closed is None:
+            self._closed = error
+        for _ in range(self._fail_pending(error)):
+            self._slots.release()
+
+    async def _resync(self):
+        """命令超时后重新同步
+
+        停止读取任务，让所有在途命令失败，丢弃迟到的响应直到链路静默 RESYNC_QUIET 秒，
+        然后归还这些命令占用的名额并重新开始读取。期间不发送新命令；
+        header / 接收过滤可能未生效，下一条请求会重新设置。
+        """
+        self._synced.clear()
+        try:
+            await self._stop_reader()
+            lost = self._fail_pending(AdapterError("命令超时，在途命令已丢弃"))
+            while True:
+                try:
+                    await asyncio.wait_for(self.reader.readuntil(PROMPT), RESYNC_QUIET)
+                except asyncio.TimeoutError:
+                    break
+                except asyncio.LimitOverrunError as exc:
+                    await self.reader.readexactly(exc.consumed)
+                except (asyncio.IncompleteReadError, ConnectionError) as exc:
+                    self._closed = self._closed or AdapterError(f"连接已断开: {exc}")
+                    break
+            self._header = self._receive = None
+            if self._closed is None:
+                self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+            for _ in range(lost):
+                self._slots.release()
+        finally:
+            self._synced.set()
+
+    async def _send(self, command: str) -> asyncio.Future:
+        """发送一条命令 (在途命令达到上限或正在重新同步时等待)，返回响应 future"""
+        await self._synced.wait()
+        if self._closed is not None:
+            raise self._closed
+        await self._slots.acquire()
+        if self._closed is not None:
+            # 等待期间连接已断开，把名额传给下一个等待者 (它同样会抛出)
+            self._slots.release()
+            raise self._closed
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self.writer.write(command.encode('ascii') + b'\r')
+        await self.writer.drain()
+        return future
+
+    async def _wait(self, future: asyncio.Future) -> Tuple[str, float]:
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # 超时的 future 已被取消；仍在队列中说明响应没有到达，需要重新同步
+            async with self._resync_lock:
+                if future in self._pending:
+                    await self._resync()
+            raise
+
+    async def _realign(self):
+        """收到的响应与命令不符 (之前有响应丢失)，仍有在途命令时它们的响应也已错位，重新同步"""
+        async with self._resync_lock:
+            if self._pending:
+                await self._resync()
+
+    async def command(self, command: str) -> str:
+        """发送命令并等待响应文本 (不含提示符)"""
+        text, _ = await self._wait(await self._send(command))
+        return text.strip()
+
+    async def initialize(self, commands: Iterable[str] = INIT_COMMANDS) -> str:
+        """复位并关闭回显 / 换行 / 空格 / 帧头，返回适配器版本"""
+        version = ''
+        for command in commands:
+            response = await self.command(command)
+            if command == 'ATZ':
+                version = response.split('\r')[-1].strip()
+        self._header = self._receive = None
+        return version
+
+    async def _select_ecu(self, header: str, response: str) -> List[asyncio.Future]:
+        """切换请求 header 及接收过滤 (响应 ID 不是 header+8 时，如 7E4/5EC)"""
+        futures = []
+        if header != self._header:
+            futures.append(await self._send(f"ATSH{header}"))
+            self._header = header
+        if response != self._receive:
+            futures.append(await self._send(f"ATCRA{response}"))
+            self._receive = response
+        return futures
+
+    async def request(self, command: str, header: str, response: str) -> bytes:
+        """向指定 ECU 发送一条原始 OBD 请求 (如 "0100"、"0902")，返回响应字节
+
+        适配器错误 (NO DATA 等) 抛出 AdapterError；ECU 的否定响应 (7F ...) 原样返回，由调用方判断。
+        """
+        setup = await self._select_ecu(header, response)
+        future = await self._send(command)
+        self.stats.requests += 1
+        for pending in setup:
+            text, _ = await self._wait(pending)
+            if text.strip() != 'OK':
+                raise AdapterError(f"设置 header 失败: {text.strip()!r}")
+        text, _ = await self._wait(future)
+        return parse_response(text)
+
+    async def _submit(self, request: PackedRequest) -> Tuple[List[asyncio.Future], asyncio.Future]:
+        setup = await self._select_ecu(request.header, request.response)
+        self.stats.requests += 1
+        return setup, await self._send(request.command)
+
+    async def _collect(self, request: PackedRequest, setup: List[asyncio.Future],
+                       future: asyncio.Future) -> List[Sample]:
+        """等待一条请求的响应并解码，错误计入统计并返回空列表"""
+        try:
+            for pending in setup:
+                text, _ = await self._wait(pending)
+                if text.strip() != 'OK':
+                    raise AdapterError(f"设置 header 失败: {text.strip()!r}")
+            text, timestamp = await self._wait(future)
+            decoded = request.decode(parse_response(text))
+        except EchoMismatchError:
+            self.stats.errors += 1
+            await self._realign()
+            return []
+        except (AdapterError, ResponseError, asyncio.TimeoutError):
+            self.stats.errors += 1
+            return []
+        self.stats.samples += len(decoded)
+        return [Sample(timestamp, pid, values) for pid, values in decoded]
+
+    async def query(self, pid: Union[str, VoltPID]) -> List[Sample]:
+        """查询一个 PID (代码或 VoltPID)，同一 DID 上的多个信号一起返回"""
+        pids = self.db.get_pids_by_code(pid) if isinstance(pid, str) else [pid]
+        if not pids:
+            raise KeyError(f"未知的 PID: {pid}")
+        request = pack_requests(pids, max_dids=1)[0]
+        return await self._collect(request, *(await self._submit(request)))
+
+    async def stream(self, pids: Iterable[VoltPID], cycles: Optional[int] = None,
+                     max_dids: int = 1) -> AsyncIterator[Sample]:
+        """循环轮询 PID，按发送顺序产出采样 (cycles 为 None 时无限循环)
+
+        pids 的顺序即轮询顺序，可直接传入 PollPlan 展开后的 PID 序列；
+        max_dids > 1 时把去重后的 PID 按 header 打包为多 DID 请求，每个周期各请求一次。
+        """
+        requests = self._plan_requests(list(pids), max_dids)
+        if not requests:
+            return
+        pending: Deque[Tuple[PackedRequest, List[asyncio.Future], asyncio.Future]] = deque()
+        cycle = 0
+        try:
+            while cycles is None or cycle < cycles:
+                for request in requests:
+                    if len(pending) >= self.max_inflight:
+                        for sample in await self._collect(*pending.popleft()):
+                            yield sample
+                    pending.append((request, *(await self._submit(request))))
+                cycle += 1
+            while pending:
+                for sample in await self._collect(*pending.popleft()):
+                    yield sample
+        finally:
+            # 提前结束迭代时仍需读完在途响应，保持 FIFO 对齐
+            for request, setup, future in pending:
+                for item in (*setup, future):
+                    try:
+                        await self._wait(item)
+                    except (AdapterError, asyncio.TimeoutError):
+                        pass
+
+    @staticmethod
+    def _plan_requests(pids: List[VoltPID], max_dids: int) -> List[PackedRequest]:
+        """按顺序把 PID 转换为请求：max_dids 为 1 时每个 PID 一条 (保留重复以体现轮询频率)"""
+        if max_dids > 1:
+            return pack_requests(pids, max_dids=max_dids)
+        requests = []
+        for pid in pids:
+            previous = requests[-1] if requests else None
+            # 同一 DID 上的多个信号 (如 22002F) 共用一次请求
+            if previous is not None and previous.header == pid.header.upper() and previous.dids == [pid.did]:
+                previous.pids[pid.did].append(pid)
+                continue
+            requests.append(pack_requests([pid], max_dids=1)[0])
+        return requests
+
+
+async def _run(args):
+    server = None
+    if args.simulate:
+        from elm327_simulator import ELM327Simulator, SimulatorConfig, serve_tcp
+
+        sim = ELM327Simulator(SimulatorConfig(latency=args.latency / 1000, seed=1))
+        server = await serve_tcp(sim, '127.0.0.1', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        client = await ELM327Client.open_tcp(host, port, max_inflight=args.inflight)
+    elif args.serial:
+        client = await ELM327Client.open_serial(args.serial, args.baudrate, max_inflight=args.inflight)
+    else:
+        host, _, port = args.tcp.rpartition(':')
+        client = await ELM327Client.open_tcp(host or '127.0.0.1', int(port), max_inflight=args.inflight)
+
+    try:
+        version = await client.initialize()
+        print(f"已连接: {version}")
+        if args.pids:
+            pids = []
+            for code in args.pids:
+                found = client.db.get_pids_by_code(code)
+                if not found:
+                    print(f"错误：未知的 PID {code}")
+                    return
+                pids.extend(found)
+        else:
+            from poll_scheduler import build_poll_plan
+
+            plan = build_poll_plan(client.db, latency=args.latency / 1000)
+            pids = [slot.pids[0] for slot in plan.slots]
+
+        client.stats = ClientStats()
+        deadline = time.monotonic() + args.duration
+        samples = client.stream(pids, max_dids=args.pack)
+        try:
+            async for sample in samples:
+                if not args.quiet:
+                    print(f"{sample.timestamp:.3f} {sample.pid.pid:8s} {sample.pid.description}: "
+                          f"{', '.join(f'{v:g}' for v in sample.values)} {sample.pid.unit}")
+                if time.monotonic() >= deadline:
+                    break
+        finally:
+            await samples.aclose()
+        stats = client.stats
+        print(f"\n{stats.elapsed():.2f} 秒内 {stats.requests} 条请求 ({stats.request_rate():.1f}/s)，"
+              f"{stats.samples} 个采样 ({stats.sample_rate():.1f}/s)，错误 {stats.errors} 次")
+    finally:
+        await client.close()
+        if server is not None:
+            server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='asyncio ELM327 客户端 - 轮询并解码 Volt PID')
+    parser.add_argument('pids', nargs='*', help='PID 代码 (默认按轮询计划轮询全部 PID)')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--tcp', default='127.0.0.1:35000', help='TCP 适配器地址 host:port')
+    target.add_argument('--serial', help='串口或伪终端路径')
+    target.add_argument('--simulate', action='store_true', help='连接进程内的模拟适配器')
+    parser.add_argument('--baudrate', type=int, default=38400, help='串口波特率')
+    parser.add_argument('-j', '--inflight', type=int, default=1, help='同时在途的请求数')
+    parser.add_argument('--pack', type=int, default=1, help='每条请求最多打包的 DID 数')
+    parser.add_argument('-d', '--duration', type=float, default=5.0, help='运行时长 (秒)')
+    parser.add_argument('-l', '--latency', type=float, default=20.0, help='模拟适配器延迟 (ms)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='只输出吞吐量统计')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+ELM327 / ECU 模拟器
+在本地 TCP 端口或伪终端上模拟 ELM327 适配器的 AT/OBD 命令协议，
+应答 VoltPIDDatabase 中的全部 Mode 22 PID、EnhancedOBDExtractor 参考表中的 Mode 01 PID 和 0902 VIN；
+数据由公式反求得到 (数值在量程内缓慢变化)，并可配置请求延迟、抖动、header 切换开销和错误注入，
+用于在没有实车的环境 (CI) 中测量轮询调度和客户端吞吐量
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from chevrolet_volt_pids import VoltPIDDatabase
+from enhanced_obd_extractor import EnhancedOBDExtractor
+from pid_formula import CompiledFormula
+from pid_ranges import parse_ranges
+
+ELM_VERSION = 'ELM327 v1.5'
+DEFAULT_HEADER = '7DF'
+ENGINE_ECU = '7E0'
+FUNCTIONAL_HEADER = '7DF'
+PROTOCOLS = {
+    '0': 'AUTO',
+    '6': 'ISO 15765-4 (CAN 11/500)',
+    '7': 'ISO 15765-4 (CAN 29/500)',
+    '8': 'ISO 15765-4 (CAN 11/250)',
+    '9': 'ISO 15765-4 (CAN 29/250)',
+}
+DEFAULT_ERRORS = ('NO DATA', 'CAN ERROR', 'BUS BUSY', 'STOPPED')
+SUPPORTED_PID_BITMAPS = ('00', '20', '40', '60', '80', 'A0', 'C0')
+# 模拟车辆的 VIN (Mode 09 PID 02)
+DEFAULT_VIN = '1G1RA6E40DU100001'
+
+_VAR_RE = re.compile(r'(S_)?([A-Z])')
+
+
+class SimulatorConfig:
+    """模拟器时序与错误注入配置 (时间单位为秒)"""
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0, switch_cost: float = 0.0,
+                 at_latency: float = 0.0, error_rate: float = 0.0, errors=DEFAULT_ERRORS,
+                 multi_did: bool = True, seed: Optional[int] = None,
+                 vin: str = DEFAULT_VIN, unsupported=()):
+        self.latency = latency          # 每条 OBD 请求的基本响应延迟
+        self.jitter = jitter            # 延迟的均匀抖动幅度 (±)
+        self.switch_cost = switch_cost  # 请求 header 与上一条 OBD 请求不同时附加的延迟
+        self.at_latency = at_latency    # AT 命令的响应延迟
+        self.error_rate = error_rate    # OBD 请求返回错误的概率
+        self.errors = tuple(errors)
+        self.multi_did = multi_did      # ECU 是否接受一条请求中的多个 DID
+        self.seed = seed
+        self.vin = vin
+        # ECU 不支持的 PID 代码 (Mode 01 两位代码或 VoltPID 代码)，用于测试 PID 发现
+        self.unsupported = {code.upper() for code in unsupported}
+
+
+class _OutputSolver:
+    """把一个输出用到的字节视为一个大端整数，用二分查找反求公式 (要求输出对该整数单调)"""
+
+    def __init__(self, decoder: CompiledFormula, index: int, length: int):
+        expr = decoder.outputs[index]
+        found = _VAR_RE.findall(expr)
+        self.decoder = decoder
+        self.index = index
+        self.length = length
+        self.positions = sorted({ord(var) - ord('A') for _, var in found})
+        bits = 8 * len(self.positions)
+        # 最高字节按有符号解释时在有符号整数空间中搜索，保持单调
+        signed = bool(self.positions) and f"S_{chr(ord('A') + self.positions[0])}" in expr
+        self.low = -(1 << (bits - 1)) if signed else 0
+        self.high = ((1 << (bits - 1)) if signed else (1 << bits)) - 1
+        self.mask = (1 << bits) - 1
+        self.f_low = self._value(bytearray(length), self.low)
+        self.f_high = self._value(bytearray(length), self.high)
+
+    def _value(self, data: bytearray, raw: int) -> float:
+        self._store(data, raw)
+        return self.decoder(data)[self.index]
+
+    def _store(self, data: bytearray, raw: int):
+        raw &= self.mask
+        for position in reversed(self.positions):
+            data[position] = raw & 0xFF
+            raw >>= 8
+
+    @property
+    def span(self) -> Tuple[float, float]:
+        return min(self.f_low, self.f_high), max(self.f_low, self.f_high)
+
+    def solve(self, data: bytearray, target: float):
+        """在 data 中写入使输出最接近 target 的字节"""
+        low, high = self.low, self.high
+        increasing = self.f_high >= self.f_low
+        while low < high:
+            mid = (low + high) // 2
+            value = self._value(data, mid)
+            if (value < target) if increasing else (value > target):
+                low = mid + 1
+            else:
+                high = mid
+        self._store(data, low)
+
+
+class SignalGenerator:
+    """为一个 PID 生成在量程内缓慢变化的原始数据字节"""
+
+    def __init__(self, decoder: Optional[CompiledFormula], range_values: str, length: int,
+                 rng: random.Random):
+        self.length = length
+        self.rng = rng
+        self.solvers: List[_OutputSolver] = []
+        self.waves: List[Tuple[float, float, float, float]] = []
+        self.step = 0
+        if decoder is None or decoder.kind != 'expr' or not decoder.variables:
+            # 位编码或无公式：固定的随机字节 (如监控状态)
+            self.constant = bytes(rng.getrandbits(8) for _ in range(length))
+            return
+        self.constant = None
+        ranges = parse_ranges(range_values, len(decoder.outputs))
+        for index in range(len(decoder.outputs)):
+            solver = _OutputSolver(decoder, index, length)
+            low, high = solver.span
+            if ranges[index] is not None:
+                low, high = max(low, ranges[index][0]), min(high, ranges[index][1])
+                if low > high:
+                    low, high = solver.span
+            span = high - low
+            center = low + span * rng.uniform(0.3, 0.7)
+            amplitude = span * rng.uniform(0.05, 0.2)
+            period = rng.uniform(20, 200)
+            self.solvers.append(solver)
+            self.waves.append((center, amplitude, period, rng.uniform(0, 2 * math.pi)))
+
+    def next(self) -> bytes:
+        """下一次采样的数据字节"""
+        if self.constant is not None:
+            return self.constant
+        data = bytearray(self.length)
+        for solver, (center, amplitude, period, phase) in zip(self.solvers, self.waves):
+            target = center + amplitude * math.sin(2 * math.pi * self.step / period + phase)
+            solver.solve(data, target)
+        self.step += 1
+        return bytes(data)
+
+
+class ELM327Simulator:
+    """ELM327 命令处理核心 (不涉及 I/O，可直接在测试中调用 handle / respond)"""
+
+    def __init__(self, config: Optional[SimulatorConfig] = None, db: Optional[VoltPIDDatabase] = None,
+                 reference: Optional[Dict] = None):
+        self.config = config or SimulatorConfig()
+        self.rng = random.Random(self.config.seed)
+        self.db = db or VoltPIDDatabase()
+        self.reference = reference if reference is not None else EnhancedOBDExtractor().reference_pids
+        self._generators: Dict[Tuple[str, str], SignalGenerator] = {}
+        # (请求 header, DID) -> (响应 header, 数据长度, 信号记录)
+        self._dids: Dict[Tuple[str, int], Tuple[str, int, object]] = {}
+        for pid in self.db.pids:
+            if pid.pid in self.config.unsupported:
+                continue
+            decoder = pid.decoder
+            length = decoder.byte_count if decoder is not None and decoder.byte_count else 1
+            key = (pid.header.upper(), pid.did)
+            current = self._dids.get(key)
+            if current is None or length > current[1]:
+                self._dids[key] = (pid.response.upper(), length, pid)
+        self._mode01 = {code.upper(): cmd for code, cmd in self.reference.items()
+                        if code.upper() not in SUPPORTED_PID_BITMAPS
+                        and code.upper() not in self.config.unsupported}
+        self.reset()
+
+    def reset(self):
+        """恢复默认设置 (ATZ / ATD)"""
+        self.echo = True
+        self.linefeeds = False
+        self.spaces = True
+        self.headers = False
+        self.header = DEFAULT_HEADER
+        self.receive_filter: Optional[str] = None
+        self.protocol = '0'
+        self.last_command = ''
+        self.last_obd_header: Optional[str] = None
+
+    # ---- 数据生成 ----
+
+    def _generator(self, key: Tuple[str, str], record, length: int) -> SignalGenerator:
+        generator = self._generators.get(key)
+        if generator is None:
+            seed = zlib.crc32(f"{self.config.seed}:{key[0]}:{key[1]}".encode('ascii'))
+            generator = SignalGenerator(record.decoder, record.range_values, length, random.Random(seed))
+            self._generators[key] = generator
+        return generator
+
+    def _supported_bitmap(self, base: int) -> bytes:
+        """Mode 01 的 PID 支持位图 (0100 / 0120 / 0140 ...)"""
+        bits = 0
+        for code in self._mode01:
+            value = int(code, 16)
+            if base < value <= base + 32:
+                bits |= 1 << (32 - (value - base))
+        # 最后一位表示下一组位图是否可用
+        if any(int(code, 16) > base + 32 for code in self._mode01):
+            bits |= 1
+        return bits.to_bytes(4, 'big')
+
+    # ---- OBD 请求 ----
+
+    def _read_mode01(self, pid: str) -> Optional[Tuple[str, bytes]]:
+        if self.header not in (FUNCTIONAL_HEADER, ENGINE_ECU):
+            return None
+        if pid in SUPPORTED_PID_BITMAPS:
+            return '7E8', bytes([0x41, int(pid, 16)]) + self._supported_bitmap(int(pid, 16))
+        command = self._mode01.get(pid)
+        if command is None:
+            return None
+        decoder = command.decoder
+        length = max(decoder.byte_count if decoder is not None else 0,
+                     _data_length(command.data_length), 1)
+        data = self._generator(('01', pid), command, length).next()
+        return '7E8', bytes([0x41, int(pid, 16)]) + data
+
+    def _read_mode09(self, pid: str) -> Optional[Tuple[str, bytes]]:
+        """车辆信息：0900 支持位图 (只有 PID 02)、0902 VIN"""
+        if self.header not in (FUNCTIONAL_HEADER, ENGINE_ECU):
+            return None
+        if pid == '00':
+            return '7E8', bytes([0x49, 0x00]) + (1 << 30).to_bytes(4, 'big')
+        if pid == '02':
+            return '7E8', bytes([0x49, 0x02, 0x01]) + self.config.vin.encode('ascii')
+        return None
+
+    def _lookup_did(self, did: int) -> Optional[Tuple[str, int, object]]:
+        entry = self._dids.get((self.header, did))
+        if entry is None and self.header == FUNCTIONAL_HEADER:
+            entry = self._dids.get((ENGINE_ECU, did))
+        return entry
+
+    def _read_mode22(self, dids: List[int]) -> Optional[Tuple[str, bytes]]:
+        if len(dids) > 1 and not self.config.multi_did:
+            return self._dids_response_header(), bytes([0x7F, 0x22, 0x13])
+        response = None
+        payload = bytearray([0x62])
+        for did in dids:
+            entry = self._lookup_did(did)
+            if entry is None:
+                continue
+            response_header, length, record = entry
+            response = response or response_header
+            payload += did.to_bytes(2, 'big')
+            payload += self._generator((self.header, f"{did:04X}"), record, length).next()
+        if response is None:
+            if self.header == FUNCTIONAL_HEADER or not any(key[0] == self.header for key in self._dids):
+                return None
+            return self._dids_response_header(), bytes([0x7F, 0x22, 0x31])
+        return response, bytes(payload)
+
+    def _dids_response_header(self) -> str:
+        for (header, _did), (response, _length, _record) in self._dids.items():
+            if header == self.header:
+                return response
+        return '7E8'
+
+    def _obd_request(self, command: str) -> List[str]:
+        if len(command) % 2:
+            # ELM327 允许在请求末尾附加期望的响应数 (如 010C1)
+            command = command[:-1]
+        try:
+            request = bytes.fromhex(command)
+        except ValueError:
+            return ['?']
+        if len(request) < 2:
+            return ['?']
+
+        result = None
+        service = request[0]
+        if service == 0x01 and len(request) == 2:
+            result = self._read_mode01(f"{request[1]:02X}")
+        elif service == 0x09 and len(request) == 2:
+            result = self._read_mode09(f"{request[1]:02X}")
+        elif service == 0x22 and len(request) >= 3 and len(request) % 2 == 1:
+            result = self._read_mode22([int.from_bytes(request[i:i + 2], 'big')
+                                   for i in range(1, len(request), 2)])
+        if result is None:
+            return ['NO DATA']
+        response_header, payload = result
+        if self.receive_filter and response_header != self.receive_filter:
+            return ['NO DATA']
+        return self._format_frames(response_header, payload)
+
+    def _format_bytes(self, data) -> str:
+        return (' ' if self.spaces else '').join(f"{b:02X}" for b in data)
+
+    def _format_frames(self, response_header: str, payload: bytes) -> List[str]:
+        """按 ISO-TP 分帧并按当前 ATH / ATS 设置格式化输出行"""
+        sep = ' ' if self.spaces else ''
+        if len(payload) <= 7:
+            if self.headers:
+                return [sep.join([response_header, self._format_bytes(bytes([len(payload)]) + payload)])]
+            return [self._format_bytes(payload)]
+
+        frames = [bytes([0x10 | (len(payload) >> 8), len(payload) & 0xFF]) + payload[:6]]
+        index = 1
+        for pos in range(6, len(payload), 7):
+            frames.append(bytes([0x20 | (index & 0x0F)]) + payload[pos:pos + 7])
+            index += 1
+        if self.headers:
+            return [sep.join([response_header, self._format_bytes(frame)]) for frame in frames]
+        lines = [f"{len(payload):03X}"]
+        for i, frame in enumerate(frames):
+            lines.append(f"{i & 0x0F:X}:{sep}{self._format_bytes(frame[2:] if i == 0 else frame[1:])}")
+        return lines
+
+    # ---- AT 命令 ----
+
+    def _at_command(self, command: str) -> List[str]:
+        body = command[2:]
+        if body in ('Z', 'WS'):
+            self.reset()
+            return ['', ELM_VERSION]
+        if body == 'D':
+            self.reset()
+            return ['OK']
+        if body == 'I':
+            return [ELM_VERSION]
+        if body == '@1':
+            return ['OBDII to RS232 Interpreter']
+        if body == 'RV':
+            return [f"{12.4 + self.rng.uniform(0, 0.4):.1f}V"]
+        if body == 'DP':
+            return [PROTOCOLS.get(self.protocol, PROTOCOLS['6']) if self.protocol != '0'
+                    else f"AUTO, {PROTOCOLS['6']}"]
+        if body == 'DPN':
+            return ['A6' if self.protocol == '0' else self.protocol]
+        flags = {'E': 'echo', 'L': 'linefeeds', 'S': 'spaces', 'H': 'headers'}
+        if len(body) == 2 and body[0] in flags and body[1] in '01':
+            setattr(self, flags[body[0]], body[1] == '1')
+            return ['OK']
+        if body.startswith('SH') and len(body) in (5, 8) and _is_hex(body[2:]):
+            self.header = body[2:]
+            return ['OK']
+        if body.startswith('CRA'):
+            value = body[3:]
+            if value and not _is_hex(value):
+                return ['?']
+            self.receive_filter = value or None
+            return ['OK']
+        if body == 'AR':
+            self.receive_filter = None
+            return ['OK']
+        if body.startswith('SP') or body.startswith('TP'):
+            protocol = body[2:].lstrip('A') or '0'
+            if protocol not in PROTOCOLS:
+                return ['?']
+            self.protocol = protocol
+            return ['OK']
+        if body[:2] in ('ST', 'AT', 'CA', 'AL', 'NL', 'M0', 'M1', 'CF', 'CM', 'FC', 'PC'):
+            return ['OK']
+        return ['?']
+
+    # ---- 入口 ----
+
+    def handle(self, command: str) -> List[str]:
+        """处理一条命令 (不含回车)，返回响应行"""
+        command = command.replace(' ', '').strip().upper()
+        if not command:
+            command = self.last_command
+            if not command:
+                return []
+        self.last_command = command
+        if command.startswith('AT'):
+            return self._at_command(command)
+        lines = self._obd_request(command)
+        if lines != ['?'] and self.config.error_rate and self.rng.random() < self.config.error_rate:
+            return [self.rng.choice(self.config.errors)]
+        return lines
+
+    def delay_for(self, command: str) -> float:
+        """一条命令的模拟处理时间 (秒)"""
+        command = command.replace(' ', '').strip().upper() or self.last_command
+        if command.startswith('AT'):
+            return self.config.at_latency
+        delay = self.config.latency
+        if self.config.jitter:
+            delay += self.rng.uniform(-self.config.jitter, self.config.jitter)
+        if self.last_obd_header is not None and self.last_obd_header != self.header:
+            delay += self.config.switch_cost
+        self.last_obd_header = self.header
+        return max(0.0, delay)
+
+    def respond(self, command: str) -> Tuple[str, float]:
+        """处理一条命令，返回 (完整输出文本，含回显和 '>' 提示符, 模拟延迟)"""
+        delay = self.delay_for(command)
+        echo = self.echo
+        lines = self.handle(command)
+        eol = '\r\n' if self.linefeeds else '\r'
+        text = (command + eol) if echo else ''
+        text += ''.join(line + eol for line in lines) + eol + '>'
+        return text, delay
+
+
+def _data_length(data_length) -> int:
+    """"2 bytes" 之类的数据长度，无法解析时为 0"""
+    match = re.search(r'(\d+)', str(data_length or ''))
+    return int(match.group(1)) if match else 0
+
+
+def _is_hex(text: str) -> bool:
+    return all(c in '0123456789ABCDEF' for c in text)
+
+
+async def _session(sim: ELM327Simulator, reader: asyncio.StreamReader, write):
+    """逐条处理以回车结尾的命令，同一连接上的命令按顺序应答"""
+    buffer = b''
+    while True:
+        chunk = await reader.read(4096)
+        if not chunk:
+            return
+        buffer += chunk.replace(b'\n', b'')
+        while b'\r' in buffer:
+            line, _, buffer = buffer.partition(b'\r')
+            text, delay = sim.respond(line.decode('ascii', 'replace'))
+            if delay:
+                await asyncio.sleep(delay)
+            await write(text.encode('ascii'))
+
+
+async def serve_tcp(sim: ELM327Simulator, host: str = '127.0.0.1', port: int = 35000) -> asyncio.AbstractServer:
+    """在 TCP 端口上提供模拟适配器 (类似 WiFi ELM327)，每个连接从默认设置开始"""
+
+    async def handle_client(reader, writer):
+        sim.reset()
+
+        async def write(data):
+            writer.write(data)
+            await writer.drain()
+
+        try:
+            await _session(sim, reader, write)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_client, host, port)
+
+
+async def serve_pty(sim: ELM327Simulator) -> str:
+    """在伪终端上提供模拟适配器，返回从设备路径 (客户端按串口打开)"""
+    import tty
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+
+    def on_readable():
+        try:
+            data = os.read(master, 4096)
+        except OSError:
+            return
+        reader.feed_data(data)
+
+    loop.add_reader(master, on_readable)
+
+    async def write(data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(master, view):]
+            except BlockingIOError:
+                await asyncio.sleep(0.001)
+
+    async def run():
+        # 保持从设备打开，客户端断开重连时主设备不会读到 EIO
+        try:
+            await _session(sim, reader, write)
+        finally:
+            loop.remove_reader(master)
+            os.close(master)
+            os.close(slave)
+
+    loop.create_task(run())
+    return os.ttyname(slave)
+
+
+async def _run(args):
+    config = SimulatorConfig(latency=args.latency / 1000, jitter=args.jitter / 1000,
+                             switch_cost=args.switch_cost / 1000, error_rate=args.error_rate,
+                             multi_did=not args.no_multi_did, seed=args.seed, vin=args.vin,
+                             unsupported=args.unsupported.split(',') if args.unsupported else ())
+    sim = ELM327Simulator(config)
+    print(f"模拟 {len(sim._dids)} 个 Mode 22 DID、{len(sim._mode01)} 个 Mode 01 PID")
+    if args.pty:
+        path = await serve_pty(sim)
+        print(f"伪终端: {path}")
+        await asyncio.Event().wait()
+    server = await serve_tcp(sim, args.host, args.port)
+    print(f"监听 {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ELM327 / ECU 模拟器 - 用于无实车的吞吐量测试')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('-p', '--port', type=int, default=35000, help='TCP 端口')
+    parser.add_argument('--pty', action='store_true', help='使用伪终端代替 TCP')
+    parser.add_argument('-l', '--latency', type=float, default=20.0, help='每条请求的响应延迟 (ms)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟抖动幅度 (ms)')
+    parser.add_argument('--switch-cost', type=float, default=0.0, help='header 切换附加延迟 (ms)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='请求返回错误的概率 (0-1)')
+    parser.add_argument('--no-multi-did', action='store_true', help='拒绝多 DID 请求')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子 (数据与错误可重复)')
+    parser.add_argument('--vin', default=DEFAULT_VIN, help='0902 返回的 VIN')
+    parser.add_argument('--unsupported', help='ECU 不支持的 PID 代码，逗号分隔 (如 0C,0D,2204AF)')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
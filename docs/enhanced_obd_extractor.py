@@ -4,22 +4,23 @@
 包含常见 OBD-II PID 参考数据，并能从文档中提取更多指令
 """
 
-import re
 import csv
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 import argparse
 import sys
 
-# 尝试导入 pandas，如果失败则禁用 Excel 功能
-try:
-    import pandas as pd
-    PANDAS_AVAILABLE = True
-except ImportError:
-    PANDAS_AVAILABLE = False
+from obd_scanner import (LEADING_SEPARATORS_RE, TRAILING_SEPARATORS_RE, VALUE_RE,
+                         LineScanner, build_scanner)
+from obd_export import STREAM_EXTENSIONS, write_stream
+from obd_stream import iter_file_lines
+from pid_formula import CompiledFormula, compile_formula
 
 class OBDCommand:
-    """OBD 命令数据结构"""
+    """OBD 命令数据结构 (使用 __slots__，模式/单位/公式等重复字符串会被驻留共享)"""
+    __slots__ = ('pid', 'mode', 'description', 'data_length', 'unit', 'formula',
+                 'range_values', 'notes', 'min_value', 'max_value', '_decoder')
+    
     def __init__(self, 
                  pid: str = "", 
                  mode: str = "01", 
@@ -31,16 +32,31 @@ class OBDCommand:
                  notes: str = "",
                  min_value: str = "",
                  max_value: str = ""):
-        self.pid = pid.upper()
-        self.mode = mode
+        self.pid = sys.intern(pid.upper())
+        self.mode = sys.intern(mode)
         self.description = description
-        self.data_length = data_length
-        self.unit = unit
-        self.formula = formula
-        self.range_values = range_values
+        self.data_length = sys.intern(data_length)
+        self.unit = sys.intern(unit)
+        self.formula = sys.intern(formula)
+        self.range_values = sys.intern(range_values)
         self.notes = notes
         self.min_value = min_value
         self.max_value = max_value
+        self._decoder = None
+    
+    @property
+    def decoder(self) -> Optional[CompiledFormula]:
+        """该 PID 公式编译后的解码函数 (首次访问时编译并缓存)"""
+        if self._decoder is None or self._decoder.formula != self.formula:
+            self._decoder = compile_formula(self.formula, self.data_length)
+        return self._decoder
+    
+    def decode(self, data) -> Tuple:
+        """解码响应数据字节 (模式/PID 回显之后的 A, B, C... 字节)"""
+        decoder = self.decoder
+        if decoder is None:
+            return ()
+        return decoder(data)
     
     def to_dict(self) -> Dict:
         return {
@@ -59,6 +75,8 @@ class OBDCommand:
 class EnhancedOBDExtractor:
     """增强版 OBD 指令提取器，包含常见 PID 参考数据"""
     
+    _reference_cache: Optional[Tuple[tuple, ...]] = None
+    
     def __init__(self):
         self.commands: List[OBDCommand] = []
         self.reference_pids = self._load_reference_pids()
@@ -101,8 +119,54 @@ class EnhancedOBDExtractor:
             r'=\s*(.+)(?:\s*[,;\n]|$)',
         ]
         
+        # 各阶段的关键字预筛选 (PID, 长度, 单位, 公式)，修改上面的模式时需同步更新
+        self.prefilters = [
+            r'pid|0x|[:\-$]|参数|parameter',
+            r'\d',
+            r'单位|unit|\)|in',
+            r'公式|formula|calculation|计算|=',
+        ]
+        # 逐模式性能分析 (enable_profiling() 启用)
+        self.profiler = None
+        self._scanner = self._build_scanner()
+    
+    def enable_profiling(self, profiler=None):
+        """启用逐模式计数与计时，返回 ExtractionProfiler (可在多个提取器间共享)"""
+        from obd_profile import ExtractionProfiler
+        
+        self.profiler = profiler or ExtractionProfiler()
+        # 用实例属性覆盖逐行步骤的方法 (重复启用时先取回原方法)，未启用时 iter_commands 的执行路径不变
+        for name, phase in (('_find_pid_in_line', 'pid_line'), ('_parse_command_details', 'details')):
+            self.__dict__.pop(name, None)
+            setattr(self, name, self.profiler.wrap(phase, getattr(self, name)))
+        self._scanner = self._build_scanner()
+        return self.profiler
+    
+    def _build_scanner(self) -> LineScanner:
+        """按当前模式列表获取预编译扫描器"""
+        if self.profiler is not None:
+            return self.profiler.build_scanner(self.pid_patterns, self.length_patterns,
+                                               self.unit_patterns, self.formula_patterns, self.prefilters)
+        return build_scanner(tuple(self.pid_patterns), tuple(self.length_patterns),
+                             tuple(self.unit_patterns), tuple(self.formula_patterns),
+                             tuple(self.prefilters))
+        
     def _load_reference_pids(self) -> Dict[str, OBDCommand]:
-        """加载常见的 OBD-II PID 参考数据"""
+        """加载常见的 OBD-II PID 参考数据
+
+        构造参数在每个进程只整理一次，每个实例都创建自己的 OBDCommand 记录
+        (参考命令会被加入 self.commands 并可能被修改，不能在实例间共享)
+        """
+        cls = EnhancedOBDExtractor
+        if cls._reference_cache is None:
+            cls._reference_cache = cls._build_reference_pids()
+        return {pid.upper(): OBDCommand(pid=pid, description=desc, data_length=length, unit=unit,
+                                        formula=formula, range_values=range_val)
+                for pid, desc, length, unit, formula, range_val in cls._reference_cache}
+    
+    @staticmethod
+    def _build_reference_pids() -> Tuple[tuple, ...]:
+        """整理常见的 OBD-II PID 参考数据 (OBDCommand 构造参数的不可变元组)"""
         reference_data = [
             ("00", "PIDs supported (01-20)", "4", "Bit encoded", "32 bits", "Shows which PIDs are supported"),
             ("01", "Monitor status since DTCs cleared", "4", "Bit encoded", "32 bits", "Malfunction Indicator Lamp status"),
@@ -189,26 +253,44 @@ class EnhancedOBDExtractor:
             ("52", "Ethanol fuel %", "1", "%", "A*100/255", "0-100%"),
         ]
         
-        reference = {}
-        for data in reference_data:
-            pid, desc, length, unit, formula, range_val = data
-            cmd = OBDCommand(
-                pid=pid,
-                description=desc,
-                data_length=f"{length} bytes" if length.isdigit() else length,
-                unit=unit,
-                formula=formula,
-                range_values=range_val
-            )
-            reference[pid.upper()] = cmd
-        
-        return reference
+        return tuple(
+            (pid, desc, f"{length} bytes" if length.isdigit() else length, unit, formula, range_val)
+            for pid, desc, length, unit, formula, range_val in reference_data
+        )
     
     def extract_from_text(self, text: str) -> List[OBDCommand]:
         """从文本中提取 OBD 命令，结合参考数据"""
-        lines = text.split('\n')
-        current_command = None
+        return self.extract_from_lines(text.split('\n'))
+    
+    def extract_from_lines(self, lines: Iterable[str]) -> List[OBDCommand]:
+        """从逐行输入中提取 OBD 命令并加入 self.commands，结合参考数据"""
         found_pids = set()
+        for command in self.iter_commands(lines):
+            self.commands.append(command)
+            found_pids.add(command.pid)
+        
+        print(f"从文档中提取到 {len(self.commands)} 条 PID")
+        
+        # 询问是否添加未在文档中找到的常见 PID
+        missing_pids = set(self.reference_pids.keys()) - found_pids
+        if missing_pids:
+            print(f"发现 {len(missing_pids)} 个常见 PID 未在文档中找到")
+            response = input("是否要添加所有常见的 OBD-II PID 到结果中？ (y/n): ").lower().strip()
+            if response in ['y', 'yes', '是']:
+                for pid in sorted(missing_pids):
+                    self.commands.append(self.reference_pids[pid])
+                print(f"已添加 {len(missing_pids)} 个常见 PID")
+            
+        return sorted(self.commands, key=lambda x: x.pid)
+    
+    def extract_from_file(self, filename: str, encoding: Optional[str] = None) -> Iterator[OBDCommand]:
+        """流式读取文件，每解析完一条命令立即产出 (不加入 self.commands，内存占用恒定)"""
+        return self.iter_commands(iter_file_lines(filename, encoding))
+    
+    def iter_commands(self, lines: Iterable[str]) -> Iterator[OBDCommand]:
+        """逐行解析并用参考数据补充，遇到下一条 PID 行时产出上一条已完整的命令"""
+        current_command = None
+        self._scanner = self._build_scanner()
         
         for line in lines:
             line = line.strip()
@@ -218,10 +300,9 @@ class EnhancedOBDExtractor:
             # 检查是否是新的 PID 行
             pid_match = self._find_pid_in_line(line)
             if pid_match:
-                # 保存之前的命令
+                # 产出之前的命令
                 if current_command and current_command.pid:
-                    self.commands.append(current_command)
-                    found_pids.add(current_command.pid)
+                    yield current_command
                 
                 # 开始新命令
                 pid = pid_match['pid'].upper()
@@ -247,45 +328,28 @@ class EnhancedOBDExtractor:
                 # 继续解析当前命令的其他属性
                 self._parse_command_details(current_command, line)
         
-        # 添加最后一个命令
+        # 产出最后一个命令
         if current_command and current_command.pid:
-            self.commands.append(current_command)
-            found_pids.add(current_command.pid)
-        
-        print(f"从文档中提取到 {len(self.commands)} 条 PID")
-        
-        # 询问是否添加未在文档中找到的常见 PID
-        missing_pids = set(self.reference_pids.keys()) - found_pids
-        if missing_pids:
-            print(f"发现 {len(missing_pids)} 个常见 PID 未在文档中找到")
-            response = input("是否要添加所有常见的 OBD-II PID 到结果中？ (y/n): ").lower().strip()
-            if response in ['y', 'yes', '是']:
-                for pid in sorted(missing_pids):
-                    self.commands.append(self.reference_pids[pid])
-                print(f"已添加 {len(missing_pids)} 个常见 PID")
-            
-        return sorted(self.commands, key=lambda x: x.pid)
+            yield current_command
     
     def _find_pid_in_line(self, line: str) -> Optional[Dict]:
         """在行中查找 PID（增强版）"""
-        for pattern in self.pid_patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
-            if match:
-                pid = match.group(1)
-                if len(pid) >= 2:  # 确保是有效的 PID
-                    if len(match.groups()) >= 2:
-                        return {
-                            'pid': pid,
-                            'description': match.group(2).strip()
-                        }
-                    else:
-                        # 尝试从行的其余部分提取描述
-                        desc = line.replace(match.group(0), '').strip()
-                        desc = re.sub(r'^[:\-\s]+', '', desc)  # 清理开头的符号
-                        return {
-                            'pid': pid,
-                            'description': desc if desc else pid
-                        }
+        for match in self._scanner.pid.matches(line):
+            pid = match.group(1)
+            if len(pid) >= 2:  # 确保是有效的 PID
+                if len(match.groups()) >= 2:
+                    return {
+                        'pid': pid,
+                        'description': match.group(2).strip()
+                    }
+                else:
+                    # 尝试从行的其余部分提取描述
+                    desc = line.replace(match.group(0), '').strip()
+                    desc = LEADING_SEPARATORS_RE.sub('', desc)  # 清理开头的符号
+                    return {
+                        'pid': pid,
+                        'description': desc if desc else pid
+                    }
         return None
     
     def _parse_command_details(self, command: OBDCommand, line: str):
@@ -294,37 +358,31 @@ class EnhancedOBDExtractor:
         
         # 查找数据长度
         if not command.data_length:
-            for pattern in self.length_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    command.data_length = match.group(1) + " bytes"
-                    break
+            match = self._scanner.length.first(line)
+            if match:
+                command.data_length = sys.intern(match.group(1) + " bytes")
         
         # 查找单位
         if not command.unit:
-            for pattern in self.unit_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    unit = match.group(1).strip()
-                    # 清理单位字符串
-                    unit = re.sub(r'^[:\-\s]+', '', unit)
-                    unit = re.sub(r'[,;\s]+$', '', unit)
-                    if unit and len(unit) < 20:  # 避免太长的字符串
-                        command.unit = unit
-                        break
+            for match in self._scanner.unit.matches(line):
+                unit = match.group(1).strip()
+                # 清理单位字符串
+                unit = LEADING_SEPARATORS_RE.sub('', unit)
+                unit = TRAILING_SEPARATORS_RE.sub('', unit)
+                if unit and len(unit) < 20:  # 避免太长的字符串
+                    command.unit = sys.intern(unit)
+                    break
         
         # 查找公式
         if not command.formula:
-            for pattern in self.formula_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    formula = match.group(1).strip()
-                    command.formula = formula
-                    break
+            match = self._scanner.formula.first(line)
+            if match:
+                formula = match.group(1).strip()
+                command.formula = formula
         
         # 查找范围
         if 'range' in line_lower or '范围' in line_lower or '取值' in line_lower or 'min' in line_lower or 'max' in line_lower:
-            range_match = re.search(r'[:=]\s*(.+)', line)
+            range_match = VALUE_RE.search(line)
             if range_match:
                 command.range_values = range_match.group(1).strip()
         
@@ -357,7 +415,10 @@ class EnhancedOBDExtractor:
             print("没有找到 OBD 命令数据")
             return
         
-        if not PANDAS_AVAILABLE:
+        # pandas 导入较慢，只在导出 Excel 时加载
+        try:
+            import pandas as pd
+        except ImportError:
             print("错误：需要安装 pandas 和 openpyxl 来导出 Excel 文件")
             print("运行: pip install pandas openpyxl")
             return
@@ -381,6 +442,21 @@ class EnhancedOBDExtractor:
         
         print(f"已导出 {len(self.commands)} 条 OBD 命令到 {filename}")
     
+    def export_stream(self, filename: str, fmt: str, commands: Optional[Iterable[OBDCommand]] = None) -> int:
+        """流式导出 (csv / jsonl / json / excel)，commands 可以是 extract_from_file 产生的生成器"""
+        fieldnames = ['PID', 'Mode', 'Description', 'Data Length', 'Unit', 'Formula', 'Range', 'Min Value', 'Max Value', 'Notes']
+        try:
+            count = write_stream(self.commands if commands is None else commands, filename, fmt, fieldnames)
+        except ImportError:
+            print("错误：需要安装 openpyxl 来导出 Excel 文件: pip install openpyxl")
+            return 0
+        
+        if count:
+            print(f"已导出 {count} 条 OBD 命令到 {filename}")
+        else:
+            print("没有找到 OBD 命令数据")
+        return count
+    
     def print_summary(self):
         """打印提取结果摘要"""
         print(f"\n=== 增强版 OBD 命令提取结果 ===")
@@ -421,19 +497,56 @@ class EnhancedOBDExtractor:
             for i, cmd in enumerate(self.commands[:10], 1):
                 print(f"{i:2d}. PID {cmd.pid}: {cmd.description[:50]}")
 
+def _setup_profiling(extractor: EnhancedOBDExtractor, args):
+    """按命令行参数启用逐模式性能分析"""
+    if args.profile or args.profile_json:
+        extractor.enable_profiling()
+
+def _finish_profiling(extractor: EnhancedOBDExtractor, args):
+    """输出性能分析报告 / JSON"""
+    if extractor.profiler is None:
+        return
+    if args.profile:
+        extractor.profiler.report()
+    if args.profile_json:
+        extractor.profiler.dump_json(args.profile_json)
+
 def main():
     parser = argparse.ArgumentParser(description='Enhanced OBD Command Extractor - 增强版 OBD 查询指令提取工具')
     parser.add_argument('input_file', nargs='?', help='输入文件路径 (支持 .txt，可选)')
     parser.add_argument('-o', '--output', help='输出文件名 (不含扩展名)', default='enhanced_obd_commands')
-    parser.add_argument('-f', '--format', choices=['csv', 'excel', 'json', 'all'], 
+    parser.add_argument('-f', '--format', choices=['csv', 'excel', 'json', 'jsonl', 'all'], 
                        default='csv', help='输出格式')
+    parser.add_argument('--stream', action='store_true',
+                       help='边提取边导出，内存占用与文档大小无关 (需要输入文件，不支持 all)')
+    parser.add_argument('--profile', action='store_true',
+                       help='提取结束后打印逐模式性能分析报告')
+    parser.add_argument('--profile-json', metavar='FILE',
+                       help='把逐模式性能分析结果写入 JSON 文件')
     parser.add_argument('-r', '--reference-only', action='store_true', 
                        help='仅导出常见 OBD-II PID 参考数据')
     
     args = parser.parse_args()
     
+    if args.stream and args.input_file and not args.reference_only:
+        # 边提取边导出，不在内存中保存全部命令
+        if args.format == 'all':
+            print("错误：--stream 一次只能导出一种格式")
+            sys.exit(1)
+        extractor = EnhancedOBDExtractor()
+        _setup_profiling(extractor, args)
+        try:
+            extractor.export_stream(f"{args.output}.{STREAM_EXTENSIONS[args.format]}", args.format,
+                                    extractor.extract_from_file(args.input_file))
+        except FileNotFoundError:
+            print(f"错误：找不到文件 {args.input_file}")
+            sys.exit(1)
+        _finish_profiling(extractor, args)
+        return
+    
     # 创建提取器
     extractor = EnhancedOBDExtractor()
+    _setup_profiling(extractor, args)
     
     if args.reference_only:
         # 仅导出参考数据
@@ -441,24 +554,18 @@ def main():
         extractor.commands = list(extractor.reference_pids.values())
     else:
         if args.input_file:
-            # 读取输入文件
+            # 逐行读取输入文件并提取命令
             try:
-                with open(args.input_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except UnicodeDecodeError:
-                with open(args.input_file, 'r', encoding='gb2312') as f:
-                    content = f.read()
+                extractor.extract_from_lines(iter_file_lines(args.input_file))
             except FileNotFoundError:
                 print(f"错误：找不到文件 {args.input_file}")
                 sys.exit(1)
-            
-            # 提取命令
-            extractor.extract_from_text(content)
         else:
             print("未指定输入文件，将导出所有常见 OBD-II PID...")
             extractor.commands = list(extractor.reference_pids.values())
     
     extractor.print_summary()
+    _finish_profiling(extractor, args)
     
     # 导出结果
     if args.format == 'csv' or args.format == 'all':
@@ -469,6 +576,9 @@ def main():
     
     if args.format == 'json' or args.format == 'all':
         extractor.export_to_json(f"{args.output}.json")
+    
+    if args.format == 'jsonl':
+        extractor.export_stream(f"{args.output}.jsonl", 'jsonl')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+ISO-TP (ISO 15765-2) 多帧重组
+按响应 ID (7E8、5EC ...) 把原始 CAN 帧的首帧 / 连续帧拼接到每个 ID 预先分配的缓冲区中，
+完成后把 memoryview 切片直接交给解码器，不生成十六进制字符串副本
+"""
+
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+ISOTP_MAX_LENGTH = 4095
+
+# 协议控制信息 (PCI) 帧类型 (首字节高 4 位)
+SINGLE_FRAME = 0x0
+FIRST_FRAME = 0x1
+CONSECUTIVE_FRAME = 0x2
+FLOW_CONTROL = 0x3
+
+def parse_can_id(text: str) -> int:
+    """CAN ID 文本 (如 "7E8"、"18DAF110") 转为整数"""
+    return int(text, 16)
+
+
+def parse_elm_line(line: str) -> Optional[Tuple[int, bytes]]:
+    """解析 ATH1 下的 ELM327 输出行 ("7E8 10 0D 62 00 5B ..." 或无空格的 "7E8100D62005B...")，
+    不是帧的行返回 None (输入须为 ATH1 输出，ATH0 的数据行无法与 29 位 ID 区分)"""
+    line = line.strip()
+    head, sep, rest = line.partition(' ')
+    if not sep:
+        # ATS0：11 位 ID 使总长为奇数，29 位 ID 使总长为偶数
+        id_len = 3 if len(line) % 2 else 8
+        head, rest = line[:id_len], line[id_len:]
+    elif len(head) == 2:
+        # 29 位 ID 按字节分开输出 ("18 DA F1 10 ...")
+        head, rest = line[:11].replace(' ', ''), line[12:]
+    if len(head) not in (3, 8):
+        return None
+    try:
+        can_id = int(head, 16)
+        # bytes.fromhex 本身接受字节间的空格，无需先拼接字符串
+        data = bytes.fromhex(rest)
+    except ValueError:
+        return None
+    if not data or len(data) > 8:
+        return None
+    return can_id, data
+
+
+def parse_candump_line(line: str) -> Optional[Tuple[float, int, bytes]]:
+    """解析 candump -L 格式行 "(1600000000.123456) can0 7E8#100D62005B4604AF"，
+    返回 (时间戳, CAN ID, 数据)，不是帧的行返回 None"""
+    line = line.strip()
+    if not line.startswith('('):
+        return None
+    stamp_end = line.find(')')
+    hash_pos = line.find('#', stamp_end)
+    if stamp_end < 0 or hash_pos < 0:
+        return None
+    space = line.rfind(' ', 0, hash_pos)
+    try:
+        timestamp = float(line[1:stamp_end])
+        can_id = int(line[space + 1:hash_pos], 16)
+        data = bytes.fromhex(line[hash_pos + 1:].split(None, 1)[0]) if hash_pos + 1 < len(line) else b''
+    except ValueError:
+        return None
+    return timestamp, can_id, data
+
+
+class _Channel:
+    """一个响应 ID 的重组状态"""
+    __slots__ = ('buffer', 'view', 'length', 'position', 'sequence')
+
+    def __init__(self, max_length: int):
+        self.buffer = bytearray(max_length)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+        self.position = 0
+        self.sequence = 0
+
+
+class IsoTpReassembler:
+    """按 CAN ID 重组 ISO-TP 消息
+
+    feed() 在消息完整时返回 memoryview：单帧直接引用输入帧数据，多帧引用该 ID 的预分配缓冲区，
+    在该 ID 的下一个首帧到来前有效 (需要保留时请自行 bytes() 复制)。
+    """
+
+    def __init__(self, ids: Optional[Iterable[Union[int, str]]] = None, max_length: int = ISOTP_MAX_LENGTH):
+        self.max_length = max_length
+        self.ids = None if ids is None else {parse_can_id(i) if isinstance(i, str) else i for i in ids}
+        self._channels: Dict[int, _Channel] = {}
+        self.frames = 0
+        self.messages = 0
+        self.errors = 0
+
+    def _channel(self, can_id: int) -> _Channel:
+        channel = self._channels.get(can_id)
+        if channel is None:
+            channel = self._channels[can_id] = _Channel(self.max_length)
+        return channel
+
+    def reset(self, can_id: Optional[int] = None):
+        """丢弃未完成的消息"""
+        channels = self._channels.values() if can_id is None else [self._channels.get(can_id)]
+        for channel in channels:
+            if channel is not None:
+                channel.length = channel.position = 0
+
+    def feed(self, can_id: int, data) -> Optional[memoryview]:
+        """输入一帧 (8 字节以内的数据字段)，消息完整时返回其 memoryview"""
+        if self.ids is not None and can_id not in self.ids:
+            return None
+        self.frames += 1
+        if not data:
+            return None
+        pci = data[0]
+        kind = pci >> 4
+
+        if kind == SINGLE_FRAME:
+            length = pci & 0x0F
+            if length == 0 or length + 1 > len(data):
+                self.errors += 1
+                return None
+            self.messages += 1
+            return memoryview(data)[1:1 + length]
+
+        if kind == FIRST_FRAME:
+            if len(data) < 3:
+                self.errors += 1
+                return None
+            length = ((pci & 0x0F) << 8) | data[1]
+            if length < 8 or length > self.max_length:
+                self.errors += 1
+                return None
+            channel = self._channel(can_id)
+            chunk = len(data) - 2
+            channel.view[:chunk] = data[2:]
+            channel.length = length
+            channel.position = chunk
+            channel.sequence = 1
+            return None
+
+        if kind == CONSECUTIVE_FRAME:
+            channel = self._channels.get(can_id)
+            if channel is None or not channel.length:
+                # 没有对应首帧 (如日志从消息中间开始)
+                self.errors += 1
+                return None
+            if (pci & 0x0F) != channel.sequence:
+                self.errors += 1
+                channel.length = channel.position = 0
+                return None
+            chunk = min(len(data) - 1, channel.length - channel.position)
+            channel.view[channel.position:channel.position + chunk] = data[1:1 + chunk]
+            channel.position += chunk
+            channel.sequence = (channel.sequence + 1) & 0x0F
+            if channel.position < channel.length:
+                return None
+            length = channel.length
+            channel.length = channel.position = 0
+            self.messages += 1
+            return channel.view[:length]
+
+        # 流控帧及未知类型不产生数据
+        return None
+
+    def iter_messages(self, frames: Iterable[Tuple[int, bytes]]) -> Iterator[Tuple[int, memoryview]]:
+        """从 (CAN ID, 数据) 帧序列中产出完整消息 (CAN ID, memoryview)，
+        帧序列中的 None (如 parse_elm_line 跳过的非帧行) 被忽略"""
+        feed = self.feed
+        for frame in frames:
+            if frame is None:
+                continue
+            can_id, data = frame
+            message = feed(can_id, data)
+            if message is not None:
+                yield can_id, message
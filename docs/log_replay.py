@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+原始日志回放解码
+按大块读取录制的 ELM327 文本日志 (ATH0 / ATH1) 和 candump -L 日志，重组 ISO-TP 响应，
+按响应 header + DID 匹配 VoltPIDDatabase 中的 PID，批量解码后为每个 PID 写出时间序列 CSV，
+修正 chevrolet_volt_pids.py 中的公式后重新运行即可重新生成全部数据，并报告处理速度 (帧/秒)
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+from did_packer import NEGATIVE_RESPONSE, POSITIVE_RESPONSE, ResponseError, did_length, split_response
+from isotp import IsoTpReassembler, parse_candump_line, parse_elm_line
+
+DEFAULT_CHUNK_SIZE = 4 << 20
+DEFAULT_BATCH_SIZE = 1 << 16
+DEFAULT_RESPONSE_ID = 0x7E8
+
+# 行首时间戳："12.345 ..."、"[1700000000.123] ..."、"12.345,..." (必须带小数点，避免与数据字节混淆)
+_TIMESTAMP_RE = re.compile(r'^\[?(\d+\.\d+)\]?[\s,]+')
+_SLUG_RE = re.compile(r'[^0-9A-Za-z]+')
+
+# ELM327 状态 / 错误输出，回放时跳过
+_NON_DATA_PREFIXES = ('SEARCHING', 'NO DATA', 'OK', '?', 'ELM', 'CAN ERROR', 'BUS', 'STOPPED',
+                      'UNABLE', 'BUFFER', 'DATA ERROR', 'FB ERROR', 'ACT ALERT', 'LV RESET', 'ERR')
+
+
+class ReplayStats:
+    """回放计数"""
+
+    def __init__(self):
+        self.lines = 0
+        self.frames = 0       # CAN 帧 / ELM 响应行
+        self.messages = 0     # 重组后的完整响应
+        self.samples = 0      # 匹配到 PID 的响应段
+        self.unmatched = 0    # 找不到对应 PID 的响应
+        self.negative = 0     # 否定响应 (7F)
+        self.errors = 0       # 无法解析的响应或 ISO-TP 错误
+        self.out_of_range = 0 # 解码值超出量程而被丢弃的采样
+        self.suppressed = 0   # 死区过滤省略的采样 (未变化)
+        self.elapsed = 0.0
+
+    def frames_per_second(self) -> float:
+        return self.frames / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.frames} 帧 / {self.messages} 条响应 / {self.samples} 个采样，"
+                f"未匹配 {self.unmatched}，否定响应 {self.negative}，错误 {self.errors}，"
+                f"超出量程 {self.out_of_range}，死区省略 {self.suppressed}，"
+                f"{self.elapsed:.2f} 秒 ({self.frames_per_second():,.0f} 帧/秒)")
+
+
+def iter_log_lines(filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[str]]:
+    """按大块读取日志，产出每块中的完整行 (\\r、\\n、\\r\\n 均视为行结束)"""
+    with open(filename, 'rb') as f:
+        tail = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (tail + chunk).replace(b'\r', b'\n').decode('latin-1').split('\n')
+            tail = lines.pop().encode('latin-1')
+            yield lines
+        if tail:
+            yield [tail.decode('latin-1')]
+
+
+def detect_format(filename: str) -> str:
+    """判断日志格式：二进制日志按文件头魔数，文本日志按第一条非空行 ('candump' 或 'elm')"""
+    from binlog import MAGIC
+
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            return 'binlog'
+        f.seek(0)
+        for raw in f:
+            line = raw.strip()
+            if line:
+                return 'candump' if line.startswith(b'(') else 'elm'
+    return 'elm'
+
+
+class _Series:
+    """一个 (响应 ID, DID) 的待解码数据：定长原始字节连续存放，便于批量解码"""
+    __slots__ = ('pids', 'length', 'payloads', 'timestamps', 'count')
+
+    def __init__(self, pids: List[VoltPID], length: int):
+        self.pids = pids
+        self.length = length
+        self.payloads = bytearray()
+        self.timestamps = array('d')
+        self.count = 0
+
+    def append(self, segment, timestamp: float):
+        self.payloads += segment[:self.length]
+        self.timestamps.append(timestamp)
+        self.count += 1
+
+
+class LogReplayer:
+    """把日志中的响应按 PID 分组并批量解码
+
+    指定 output_dir 时每个 PID 写出一个 CSV (时间戳 + 解码值)；否则结果保存在内存中，
+    可通过 results() 获取。validate 为 True 时按量程表丢弃超出检查范围的采样 (帧损坏或公式错误，默认关闭)；
+    指定 deadband (deadband.DeadbandFilter) 时只输出变化超过死区或到达心跳间隔的采样。
+    """
+
+    def __init__(self, db: Optional[VoltPIDDatabase] = None, output_dir: Optional[str] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, validate: bool = False, deadband=None):
+        self.db = db or VoltPIDDatabase()
+        self.ranges = self.db.range_table if validate else None
+        self.deadband = deadband
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.stats = ReplayStats()
+        self._series: Dict[Tuple[int, int], _Series] = {}
+        self._lengths: Dict[int, Dict[int, int]] = {}
+        self._response_for_header: Dict[str, int] = {}
+        self._files: Dict[VoltPID, object] = {}
+        self._results: Dict[VoltPID, List[Tuple[np.ndarray, np.ndarray]]] = {}
+
+        by_key: Dict[Tuple[int, int], List[VoltPID]] = {}
+        for pid in self.db.pids:
+            response = int(pid.response, 16)
+            by_key.setdefault((response, pid.did), []).append(pid)
+            self._response_for_header.setdefault(pid.header.upper(), response)
+        for (response, did), pids in by_key.items():
+            length = did_length(pids)
+            if length is None:
+                continue
+            self._series[(response, did)] = _Series(pids, length)
+            self._lengths.setdefault(response, {})[did] = length
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    # ---- 匹配 ----
+
+    def feed_message(self, response_id: int, message, timestamp: float):
+        """处理一条完整的响应 (服务字节开始)"""
+        stats = self.stats
+        stats.messages += 1
+        if len(message) < 3:
+            stats.errors += 1
+            return
+        service = message[0]
+        if service == NEGATIVE_RESPONSE:
+            stats.negative += 1
+            return
+        if service != POSITIVE_RESPONSE:
+            stats.unmatched += 1
+            return
+
+        series = self._series.get((response_id, (message[1] << 8) | message[2]))
+        if series is not None and len(message) == 3 + series.length:
+            # 单 DID 响应 (最常见的情况)
+            self._append(series, message[3:], timestamp)
+            return
+        try:
+            segments = split_response(message, lengths=self._lengths.get(response_id, {}))
+        except ResponseError:
+            if series is not None and len(message) > 3 + series.length:
+                # ECU 返回的数据比公式需要的长
+                self._append(series, message[3:], timestamp)
+            elif series is None:
+                stats.unmatched += 1
+            else:
+                stats.errors += 1
+            return
+        for did, segment in segments.items():
+            self._append(self._series[(response_id, did)], segment, timestamp)
+
+    def _append(self, series: _Series, segment, timestamp: float):
+        series.append(segment, timestamp)
+        self.stats.samples += 1
+        if series.count >= self.batch_size:
+            self._flush_series(series)
+
+    # ---- 解码与输出 ----
+
+    def _flush_series(self, series: _Series):
+        if not series.count:
+            return
+        timestamps = np.frombuffer(series.timestamps, dtype=np.float64).copy()
+        for pid in series.pids:
+            values = self.db.decode_batch(pid, series.payloads, series.length)
+            pid_timestamps = timestamps
+            if self.ranges is not None:
+                pid_timestamps, values, dropped = self.ranges.filter(pid, timestamps, values)
+                self.stats.out_of_range += dropped
+            if self.deadband is not None:
+                count = len(pid_timestamps)
+                pid_timestamps, values = self.deadband.filter(pid, pid_timestamps, values)
+                self.stats.suppressed += count - len(pid_timestamps)
+            self._output(pid, pid_timestamps, values)
+        series.payloads = bytearray()
+        series.timestamps = array('d')
+        series.count = 0
+
+    def _output(self, pid: VoltPID, timestamps: np.ndarray, values: np.ndarray):
+        if self.output_dir:
+            self._write(pid, timestamps, values)
+        else:
+            self._results.setdefault(pid, []).append((timestamps, values))
+
+    def _flush_tails(self):
+        """死区过滤时补上各信号最后一个被省略的采样，使阶梯重建延续到日志结束"""
+        if self.deadband is None:
+            return
+        for pid, timestamp, value in self.deadband.tails():
+            self.stats.suppressed -= 1
+            value = np.asarray(value)
+            self._output(pid, np.array([timestamp]), value.reshape((1,) + value.shape))
+
+    def _write(self, pid: VoltPID, timestamps: np.ndarray, values: np.ndarray):
+        f = self._files.get(pid)
+        if f is None:
+            slug = _SLUG_RE.sub('_', pid.description).strip('_')
+            path = os.path.join(self.output_dir, f"{pid.pid}_{slug}.csv")
+            f = self._files[pid] = open(path, 'w', encoding='utf-8')
+            columns = values.shape[1] if values.ndim == 2 else 1
+            units = [u.strip() for u in pid.unit.split(',')] if columns > 1 else [pid.unit]
+            names = [f"value_{i + 1}" if columns > 1 else 'value' for i in range(columns)]
+            f.write(','.join(['timestamp'] + [f"{name} ({unit})" if unit else name
+                                              for name, unit in zip(names, units + [''] * columns)]) + '\n')
+        if values.dtype == np.uint64:
+            # 位字段按整数写出，避免转换为浮点丢失精度
+            f.writelines(f"{t:.6f},{v}\n" for t, v in zip(timestamps.tolist(), values.tolist()))
+            return
+        # 整批用一次 % 格式化生成文本，比逐行格式化 (np.savetxt) 快数倍
+        columns = values.shape[1] if values.ndim == 2 else 1
+        row = '%.6f' + ',%.10g' * columns + '\n'
+        f.write((row * len(timestamps)) % tuple(np.column_stack([timestamps, values]).ravel().tolist()))
+
+    def flush(self):
+        """解码所有缓冲的数据"""
+        for series in self._series.values():
+            self._flush_series(series)
+
+    def close(self):
+        self.flush()
+        self._flush_tails()
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def results(self) -> Dict[VoltPID, Tuple[np.ndarray, np.ndarray]]:
+        """内存模式下每个 PID 的 (时间戳, 解码值)"""
+        self.flush()
+        self._flush_tails()
+        merged = {}
+        for pid, parts in self._results.items():
+            merged[pid] = (np.concatenate([t for t, _ in parts]), np.concatenate([v for _, v in parts]))
+        return merged
+
+    # ---- 日志解析 ----
+
+    def _replay_candump(self, filename: str, chunk_size: int):
+        stats = self.stats
+        reassembler = IsoTpReassembler()
+        feed = reassembler.feed
+        feed_message = self.feed_message
+        for lines in iter_log_lines(filename, chunk_size):
+            stats.lines += len(lines)
+            for line in lines:
+                frame = parse_candump_line(line)
+                if frame is None:
+                    continue
+                timestamp, can_id, data = frame
+                stats.frames += 1
+                message = feed(can_id, data)
+                if message is not None:
+                    feed_message(can_id, message, timestamp)
+        stats.errors += reassembler.errors
+
+    def _replay_elm(self, filename: str, chunk_size: int):
+        """ELM327 文本日志：'>' 开头或 AT 开头的行为命令，其余为响应 (ATH1 带 CAN ID，ATH0 不带)"""
+        stats = self.stats
+        reassembler = IsoTpReassembler()
+        feed_message = self.feed_message
+        headers = False
+        response_id = DEFAULT_RESPONSE_ID
+        pending: Optional[bytearray] = None
+        pending_length = 0
+        line_number = 0
+        for lines in iter_log_lines(filename, chunk_size):
+            stats.lines += len(lines)
+            for line in lines:
+                line_number += 1
+                line = line.strip()
+                if not line:
+                    continue
+                timestamp = float(line_number)
+                if line[0] == '[' or line[0].isdigit():
+                    match = _TIMESTAMP_RE.match(line)
+                    if match:
+                        timestamp = float(match.group(1))
+                        line = line[match.end():]
+                if line[0] == '>':
+                    line = line[1:].strip()
+                    if not line:
+                        continue
+                    is_command = True
+                else:
+                    is_command = line[:2].upper() == 'AT'
+                if is_command:
+                    command = line.replace(' ', '').upper()
+                    if command in ('ATH1', 'ATH0'):
+                        headers = command == 'ATH1'
+                    elif command.startswith('ATSH'):
+                        response_id = self._response_for_header.get(command[4:], response_id)
+                    elif command.startswith('ATCRA') and len(command) > 5:
+                        response_id = int(command[5:], 16)
+                    continue
+                if line.upper().startswith(_NON_DATA_PREFIXES):
+                    continue
+
+                stats.frames += 1
+                first = line.split(' ', 1)[0]
+                # 带 CAN ID 的帧行；单独的 3 位十六进制行是 ATH0 多帧响应的长度行
+                if headers or (first != line and len(first) == 3) or (first == line and len(line) % 2 and len(line) > 3):
+                    frame = parse_elm_line(line)
+                    if frame is None:
+                        stats.errors += 1
+                        continue
+                    message = reassembler.feed(*frame)
+                    if message is not None:
+                        feed_message(frame[0], message, timestamp)
+                    continue
+
+                # ATH0：单行响应，或 "00D" 长度行 + "0:" "1:" 帧行
+                text = line.replace(' ', '')
+                try:
+                    if len(text) == 3:
+                        pending_length = int(text, 16)
+                        pending = bytearray()
+                        continue
+                    if pending is not None and len(text) > 2 and text[1] == ':':
+                        pending += bytes.fromhex(text[2:])
+                        if len(pending) >= pending_length:
+                            feed_message(response_id, memoryview(pending)[:pending_length], timestamp)
+                            pending = None
+                        continue
+                    pending = None
+                    feed_message(response_id, bytes.fromhex(text), timestamp)
+                except ValueError:
+                    stats.errors += 1
+        stats.errors += reassembler.errors
+
+    def _replay_binlog(self, filename: str, start: Optional[float] = None, end: Optional[float] = None):
+        """二进制日志 (binlog.py)：单 DID 响应的数据切片直接进入批量解码缓冲，其余按完整响应处理"""
+        from binlog import BinaryLogReader
+
+        stats = self.stats
+        series_for = self._series
+        with BinaryLogReader(filename) as reader:
+            for timestamp, response, did, payload in reader.records(start, end):
+                stats.frames += 1
+                series = series_for.get((response, did))
+                if series is not None and len(payload) == series.length:
+                    stats.messages += 1
+                    self._append(series, payload, timestamp)
+                else:
+                    message = bytes((POSITIVE_RESPONSE, did >> 8, did & 0xFF)) + payload
+                    self.feed_message(response, message, timestamp)
+
+    def replay_file(self, filename: str, fmt: Optional[str] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> ReplayStats:
+        """回放一个日志文件，返回累计统计"""
+        fmt = fmt or detect_format(filename)
+        started = time.perf_counter()
+        if fmt == 'candump':
+            self._replay_candump(filename, chunk_size)
+        elif fmt == 'elm':
+            self._replay_elm(filename, chunk_size)
+        elif fmt == 'binlog':
+            self._replay_binlog(filename)
+        else:
+            raise ValueError(f"不支持的日志格式: {fmt}")
+        self.stats.elapsed += time.perf_counter() - started
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='原始日志回放 - 用当前 PID 公式重新解码录制的 ELM / CAN 日志')
+    parser.add_argument('logs', nargs='+', help='日志文件 (ELM327 文本日志、candump -L 格式或 binlog.py 二进制日志)')
+    parser.add_argument('-o', '--output', default='replay_output', help='输出目录 (每个 PID 一个 CSV)')
+    parser.add_argument('-f', '--format', choices=['auto', 'elm', 'candump', 'binlog'], default='auto',
+                        help='日志格式')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每个 PID 批量解码的采样数')
+    parser.add_argument('--drop-out-of-range', action='store_true',
+                        help='丢弃超出检查范围的采样 (默认保留全部采样)')
+    parser.add_argument('--deadband', type=float, metavar='STEPS',
+                        help='死区压缩：只输出变化超过 STEPS 个量化步长的采样 (0.5 为无损)')
+    parser.add_argument('--heartbeat', type=float, default=60.0, help='死区压缩的心跳间隔 (秒)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE >> 20, help='读取块大小 (MB)')
+
+    args = parser.parse_args()
+
+    deadband = None
+    if args.deadband is not None:
+        from deadband import DeadbandFilter
+        deadband = DeadbandFilter(deadband=args.deadband, heartbeat=args.heartbeat or None)
+    replayer = LogReplayer(output_dir=args.output, batch_size=args.batch_size,
+                           validate=args.drop_out_of_range, deadband=deadband)
+    if replayer.ranges is not None and replayer.ranges.conflicts:
+        print(f"注意：{len(replayer.ranges.conflicts)} 个 PID 的量程文字与公式不一致，按公式范围检查 "
+              f"(详见 python pid_ranges.py)")
+    started = time.perf_counter()
+    try:
+        for log in args.logs:
+            before = replayer.stats.frames
+            try:
+                replayer.replay_file(log, None if args.format == 'auto' else args.format,
+                                     chunk_size=max(1, args.chunk_size) << 20)
+            except FileNotFoundError:
+                print(f"错误：找不到文件 {log}")
+                sys.exit(1)
+            print(f"{log}: {replayer.stats.frames - before} 帧")
+    finally:
+        replayer.close()
+    stats = replayer.stats
+    stats.elapsed = time.perf_counter() - started
+
+    print(f"\n=== 回放结果 ===")
+    print(stats.summary())
+    print(f"已写出 {len(os.listdir(args.output))} 个 PID 时间序列到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
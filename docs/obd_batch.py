@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+批量 OBD 指令提取工具
+对目录 / 通配符匹配到的大量文档并行运行 EnhancedOBDExtractor，
+超大文件按 PID 行边界切分成多个块并行处理，最后按确定的顺序合并结果并记录每条 PID 的来源
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from enhanced_obd_extractor import EnhancedOBDExtractor, OBDCommand
+from obd_cache import DEFAULT_MAX_BYTES, ExtractionCache, file_hash, pattern_version
+from obd_stream import detect_encoding
+
+DEFAULT_EXTENSIONS = ('.txt',)
+DEFAULT_CHUNK_SIZE = 8 << 20
+
+# 每个工作进程复用同一个提取器 (模式只编译一次)
+_worker_extractor: Optional[EnhancedOBDExtractor] = None
+
+
+def _get_extractor() -> EnhancedOBDExtractor:
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = EnhancedOBDExtractor()
+    return _worker_extractor
+
+
+class BatchResult:
+    """合并后的提取结果"""
+
+    def __init__(self):
+        self.commands: List[OBDCommand] = []
+        # PID -> 出现过该 PID 的来源文件 (按处理顺序，第一个来源的内容被保留)
+        self.provenance: Dict[str, List[str]] = {}
+        # 来源文件 -> 提取到的命令条数
+        self.source_counts: Dict[str, int] = {}
+
+    def add_source(self, source: str, commands: List[OBDCommand]):
+        """合并一个来源的命令：同一 PID 以最先出现的为准，其余来源只记录出处"""
+        self.source_counts[source] = len(commands)
+        for command in commands:
+            sources = self.provenance.get(command.pid)
+            if sources is None:
+                self.provenance[command.pid] = [source]
+                self.commands.append(command)
+            elif sources[-1] != source:
+                sources.append(source)
+
+    def to_rows(self) -> Iterator[Dict]:
+        for command in self.commands:
+            row = command.to_dict()
+            row['Sources'] = '; '.join(self.provenance[command.pid])
+            yield row
+
+
+def collect_inputs(inputs: List[str], extensions=DEFAULT_EXTENSIONS) -> List[str]:
+    """展开目录和通配符，返回排序去重后的文件列表"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _dirs, files in os.walk(item):
+                for name in files:
+                    if name.lower().endswith(extensions):
+                        paths.add(os.path.join(root, name))
+        elif glob.has_magic(item):
+            paths.update(p for p in glob.glob(item, recursive=True) if os.path.isfile(p))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            print(f"警告：找不到输入 {item}")
+    return sorted(paths)
+
+
+def plan_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """按大约 chunk_size 字节把文件切成若干块，每块都从行首开始"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        pos = chunk_size
+        while pos < size:
+            f.seek(pos - 1)
+            f.readline()
+            line_start = f.tell()
+            if line_start >= size:
+                break
+            bounds.append(line_start)
+            pos = line_start + chunk_size
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _is_pid_line(extractor: EnhancedOBDExtractor, line: str) -> bool:
+    line = line.strip()
+    return bool(line) and extractor._find_pid_in_line(line) is not None
+
+
+def _chunk_lines(f, start: int, end: int, encoding: str,
+                 extractor: EnhancedOBDExtractor) -> Iterator[str]:
+    """产出一个块负责的行 (按 \\n 切分)
+
+    非首块跳过开头不属于任何 PID 的行 (它们属于上一块的最后一条命令)；
+    到达块末尾后继续读到下一条 PID 行为止，把最后一条命令补完整。
+    """
+    pos = start
+    skipping = start > 0
+    for raw in f:
+        line = raw.decode(encoding)
+        if pos >= end:
+            if _is_pid_line(extractor, line):
+                return
+        elif skipping:
+            if not _is_pid_line(extractor, line):
+                pos += len(raw)
+                continue
+            skipping = False
+        pos += len(raw)
+        yield line
+
+
+def _prepare_source(args) -> Tuple[Optional[str], str, List[Tuple[int, int]]]:
+    """工作进程：计算内容哈希 (启用缓存时)、检测编码并切分文件"""
+    path, chunk_size, with_hash = args
+    content_hash = file_hash(path) if with_hash else None
+    return content_hash, detect_encoding(path), plan_chunks(path, chunk_size)
+
+
+def _extract_chunk(args) -> List[OBDCommand]:
+    """工作进程：提取文件中一个块的命令"""
+    path, start, end, encoding = args
+    extractor = _get_extractor()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return list(extractor.iter_commands(_chunk_lines(f, start, end, encoding, extractor)))
+
+
+def extract_batch(paths: List[str], workers: Optional[int] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  cache: Optional[ExtractionCache] = None) -> BatchResult:
+    """并行提取多个文档并按文件顺序、块顺序确定性地合并
+
+    指定 cache 时，内容未变的文档直接使用缓存结果，只解析新增或修改过的文档。
+    """
+    result = BatchResult()
+    if not paths:
+        return result
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    run = executor.map if executor else map
+    try:
+        prepared = list(run(_prepare_source, [(p, chunk_size, cache is not None) for p in paths]))
+
+        per_source: Dict[str, List[OBDCommand]] = {}
+        hashes: Dict[str, str] = {}
+        tasks = []
+        owners = []
+        for path, (content_hash, encoding, chunks) in zip(paths, prepared):
+            if cache is not None:
+                hashes[path] = content_hash
+                cached = cache.get(content_hash)
+                if cached is not None:
+                    per_source[path] = cached
+                    continue
+            per_source[path] = []
+            for start, end in chunks:
+                tasks.append((path, start, end, encoding))
+                owners.append(path)
+
+        # map 按提交顺序返回，合并结果与并行度无关
+        for owner, commands in zip(owners, run(_extract_chunk, tasks)):
+            per_source[owner].extend(commands)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if cache is not None:
+        for path in dict.fromkeys(owners):
+            cache.put(hashes[path], per_source[path])
+        cache.evict()
+
+    for path in paths:
+        result.add_source(path, per_source[path])
+    return result
+
+
+def export_to_csv(result: BatchResult, filename: str):
+    """导出合并结果到 CSV 文件 (附带来源列)"""
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
+        fieldnames = ['PID', 'Mode', 'Description', 'Data Length', 'Unit', 'Formula', 'Range',
+                      'Min Value', 'Max Value', 'Notes', 'Sources']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(result.to_rows())
+    print(f"已导出 {len(result.commands)} 条 OBD 命令到 {filename}")
+
+
+def export_to_json(result: BatchResult, filename: str):
+    """导出合并结果到 JSON 文件 (附带来源列)"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(list(result.to_rows()), f, ensure_ascii=False, indent=2)
+    print(f"已导出 {len(result.commands)} 条 OBD 命令到 {filename}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量 OBD 指令提取工具 - 并行处理多个文档')
+    parser.add_argument('inputs', nargs='+', help='输入文件、目录或通配符 (如 "manuals/**/*.txt")')
+    parser.add_argument('-o', '--output', help='输出文件名 (不含扩展名)', default='batch_obd_commands')
+    parser.add_argument('-f', '--format', choices=['csv', 'json', 'all'], default='csv', help='输出格式')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='并行进程数 (默认为 CPU 核数)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE >> 20,
+                        help='大文件切块大小 (MB)')
+    parser.add_argument('-r', '--add-reference', action='store_true',
+                        help='把文档中未出现的常见 OBD-II PID 也加入结果')
+    parser.add_argument('--cache-dir', help='提取结果缓存目录 (未修改的文档直接读取缓存)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES >> 20,
+                        help='缓存大小上限 (MB)')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='运行前清空缓存，并删除旧模式版本留下的缓存目录')
+
+    args = parser.parse_args()
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("错误：没有找到可处理的输入文件")
+        sys.exit(1)
+
+    cache = None
+    if args.cache_dir:
+        cache = ExtractionCache(args.cache_dir, pattern_version(EnhancedOBDExtractor()),
+                                max_bytes=args.cache_size << 20)
+        if args.clear_cache:
+            cache.clear()
+            removed = cache.prune_stale()
+            if removed:
+                print(f"已删除 {removed} 个旧版本缓存目录")
+
+    print(f"共 {len(paths)} 个文档，开始并行提取...")
+    result = extract_batch(paths, workers=args.jobs, chunk_size=max(1, args.chunk_size) << 20,
+                           cache=cache)
+    if cache is not None:
+        print(f"缓存命中 {cache.hits} 个文档，重新解析 {cache.misses} 个文档")
+
+    if args.add_reference:
+        reference = EnhancedOBDExtractor().reference_pids
+        missing = [pid for pid in sorted(reference) if pid not in result.provenance]
+        result.add_source('reference', [reference[pid] for pid in missing])
+
+    print(f"\n=== 批量提取结果 ===")
+    print(f"合并后共 {len(result.commands)} 条 OBD 命令")
+    for source, count in result.source_counts.items():
+        print(f"  {source}: {count} 条")
+
+    if args.format in ('csv', 'all'):
+        export_to_csv(result, f"{args.output}.csv")
+
+    if args.format in ('json', 'all'):
+        export_to_json(result, f"{args.output}.json")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+OBD 提取结果缓存
+以 "文档内容哈希 + 提取器模式版本" 为键把每个文档提取出的命令保存到磁盘，
+重复运行时只解析新增或修改过的文档；缓存总大小超过上限时按最近使用时间淘汰
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import List, Optional
+
+from enhanced_obd_extractor import EnhancedOBDExtractor, OBDCommand
+
+# 缓存条目格式变化时递增，使旧条目全部失效
+CACHE_FORMAT = 1
+DEFAULT_MAX_BYTES = 256 << 20
+# 缓存目录下的专用子目录；只有其中的版本目录会被清理，不会触及用户放在 cache_dir 中的其他内容
+CACHE_NAMESPACE = 'obd_extract'
+# 缓存写入每个版本目录的标记文件
+MARKER_FILE = '.obd_extract_cache'
+_VERSION_RE = re.compile(r'[0-9a-f]{16}')
+
+_FIELDS = [name for name in OBDCommand.__slots__ if not name.startswith('_')]
+
+
+def file_hash(filename: str, chunk_size: int = 1 << 20) -> str:
+    """按块计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pattern_version(extractor: EnhancedOBDExtractor) -> str:
+    """提取器的模式版本：模式列表、预筛选或参考数据任何变化都会得到新的版本"""
+    digest = hashlib.sha256()
+    state = {
+        'format': CACHE_FORMAT,
+        'extractor': type(extractor).__name__,
+        'pid_patterns': extractor.pid_patterns,
+        'length_patterns': extractor.length_patterns,
+        'unit_patterns': extractor.unit_patterns,
+        'formula_patterns': extractor.formula_patterns,
+        'prefilters': extractor.prefilters,
+        'reference': [cmd.to_dict() for _, cmd in sorted(extractor.reference_pids.items())],
+    }
+    digest.update(json.dumps(state, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class ExtractionCache:
+    """磁盘上的提取结果缓存：条目位于 <cache_dir>/obd_extract/<模式版本>/
+
+    构造时不删除任何内容；旧版本目录只在显式调用 prune_stale() 时清理。
+    """
+
+    def __init__(self, cache_dir: str, version: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._namespace_dir = os.path.join(cache_dir, CACHE_NAMESPACE)
+        self._version_dir = os.path.join(self._namespace_dir, version)
+        self._make_version_dir()
+
+    def _make_version_dir(self):
+        os.makedirs(self._version_dir, exist_ok=True)
+        marker = os.path.join(self._version_dir, MARKER_FILE)
+        if not os.path.exists(marker):
+            with open(marker, 'w', encoding='utf-8') as f:
+                f.write(self.version)
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self._version_dir, f"{content_hash}.json")
+
+    def get(self, content_hash: str) -> Optional[List[OBDCommand]]:
+        """读取缓存的命令，未命中返回 None"""
+        path = self._path(content_hash)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        # 更新访问时间，用于按最近使用淘汰
+        os.utime(path)
+        self.hits += 1
+        return [OBDCommand(**row) for row in rows]
+
+    def put(self, content_hash: str, commands: List[OBDCommand]):
+        """写入一个文档的提取结果"""
+        rows = [{name: getattr(cmd, name) for name in _FIELDS} for cmd in commands]
+        path = self._path(content_hash)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """总大小超过上限时删除最久未使用的条目"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self._version_dir):
+            if entry.is_file() and entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _mtime, size, path in sorted(entries):
+            os.remove(path)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def prune_stale(self) -> int:
+        """删除其他模式版本留下的目录，返回删除的个数
+
+        只处理 obd_extract 子目录中名称为版本哈希或带有缓存标记文件的目录。
+        """
+        removed = 0
+        for entry in os.scandir(self._namespace_dir):
+            if not entry.is_dir(follow_symlinks=False) or entry.name == self.version:
+                continue
+            if _VERSION_RE.fullmatch(entry.name) or os.path.isfile(os.path.join(entry.path, MARKER_FILE)):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def clear(self):
+        """清空当前版本的全部条目"""
+        shutil.rmtree(self._version_dir, ignore_errors=True)
+        self._make_version_dir()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+流式导出
+从迭代器逐条写出记录 (OBDCommand / VoltPID 或 to_dict() 产生的字典)，
+不需要先把全部数据放进列表或 DataFrame，可直接接收流式提取器的生成器输出
+"""
+
+import csv
+import itertools
+import json
+from typing import Dict, Iterable, Iterator, List
+
+# 流式导出格式及对应的文件扩展名
+STREAM_EXTENSIONS = {'csv': 'csv', 'jsonl': 'jsonl', 'json': 'json', 'excel': 'xlsx'}
+
+
+def iter_rows(records: Iterable) -> Iterator[Dict]:
+    """把记录转换为字典行"""
+    for record in records:
+        yield record if isinstance(record, dict) else record.to_dict()
+
+
+def write_csv(records: Iterable, filename: str, fieldnames: List[str]) -> int:
+    """逐行写出 CSV 文件，返回写出的行数"""
+    count = 0
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in iter_rows(records):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_jsonl(records: Iterable, filename: str) -> int:
+    """写出 JSON Lines 文件 (每行一个 JSON 对象)，返回写出的行数"""
+    count = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        for row in iter_rows(records):
+            f.write(json.dumps(row, ensure_ascii=False))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def write_json_array(records: Iterable, filename: str, indent: int = 2) -> int:
+    """增量写出 JSON 数组，输出格式与 json.dump(list, indent=indent) 相同，返回写出的条数"""
+    count = 0
+    pad = ' ' * indent
+    with open(filename, 'w', encoding='utf-8') as f:
+        for row in iter_rows(records):
+            f.write(',\n' if count else '[\n')
+            item = json.dumps(row, ensure_ascii=False, indent=indent)
+            f.write(pad + item.replace('\n', '\n' + pad))
+            count += 1
+        f.write('\n]' if count else '[]')
+    return count
+
+
+def write_excel(records: Iterable, filename: str, fieldnames: List[str]) -> int:
+    """使用 openpyxl 只写模式逐行写出 Excel 文件 (不依赖 pandas)，返回写出的行数"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(fieldnames)
+    count = 0
+    for row in iter_rows(records):
+        sheet.append([row.get(name, '') for name in fieldnames])
+        count += 1
+    workbook.save(filename)
+    return count
+
+
+def write_stream(records: Iterable, filename: str, fmt: str, fieldnames: List[str]) -> int:
+    """按格式流式导出，返回写出的条数
+
+    先取出第一条记录再打开输出文件：输入文件不存在或无法解码时异常在此抛出，不会先清空已有的输出
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is not None:
+        records = itertools.chain((first,), records)
+    if fmt == 'csv':
+        return write_csv(records, filename, fieldnames)
+    if fmt == 'jsonl':
+        return write_jsonl(records, filename)
+    if fmt == 'json':
+        return write_json_array(records, filename)
+    if fmt == 'excel':
+        return write_excel(records, filename, fieldnames)
+    raise ValueError(f"不支持的导出格式: {fmt}")
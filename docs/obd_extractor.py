@@ -4,22 +4,22 @@ OBD Command Extractor Tool
 用于从文档中提取 OBD-II 查询指令并生成表格
 """
 
-import re
 import csv
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 import argparse
 import sys
 
-# 尝试导入 pandas，如果失败则禁用 Excel 功能
-try:
-    import pandas as pd
-    PANDAS_AVAILABLE = True
-except ImportError:
-    PANDAS_AVAILABLE = False
+from obd_scanner import VALUE_RE, LineScanner, build_scanner
+from obd_export import STREAM_EXTENSIONS, write_stream
+from obd_stream import iter_file_lines
+from pid_formula import CompiledFormula, compile_formula
 
 class OBDCommand:
-    """OBD 命令数据结构"""
+    """OBD 命令数据结构 (使用 __slots__，模式/单位/公式等重复字符串会被驻留共享)"""
+    __slots__ = ('pid', 'mode', 'description', 'data_length', 'unit', 'formula',
+                 'range_values', 'notes', '_decoder')
+    
     def __init__(self, 
                  pid: str = "", 
                  mode: str = "01", 
@@ -29,14 +29,29 @@ class OBDCommand:
                  formula: str = "", 
                  range_values: str = "", 
                  notes: str = ""):
-        self.pid = pid.upper()
-        self.mode = mode
+        self.pid = sys.intern(pid.upper())
+        self.mode = sys.intern(mode)
         self.description = description
-        self.data_length = data_length
-        self.unit = unit
-        self.formula = formula
-        self.range_values = range_values
+        self.data_length = sys.intern(data_length)
+        self.unit = sys.intern(unit)
+        self.formula = sys.intern(formula)
+        self.range_values = sys.intern(range_values)
         self.notes = notes
+        self._decoder = None
+    
+    @property
+    def decoder(self) -> Optional[CompiledFormula]:
+        """该 PID 公式编译后的解码函数 (首次访问时编译并缓存)"""
+        if self._decoder is None or self._decoder.formula != self.formula:
+            self._decoder = compile_formula(self.formula, self.data_length)
+        return self._decoder
+    
+    def decode(self, data) -> Tuple:
+        """解码响应数据字节 (模式/PID 回显之后的 A, B, C... 字节)"""
+        decoder = self.decoder
+        if decoder is None:
+            return ()
+        return decoder(data)
     
     def to_dict(self) -> Dict:
         return {
@@ -77,10 +92,53 @@ class OBDExtractor:
             r'\(([^)]+)\)$',  # 括号中的单位
         ]
         
+        # 各阶段的关键字预筛选 (PID, 长度, 单位)，修改上面的模式时需同步更新
+        self.prefilters = [
+            r'pid|0x|[:\-]',
+            r'\d',
+            r'单位|unit|\)',
+        ]
+        # 逐模式性能分析 (enable_profiling() 启用)
+        self.profiler = None
+        self._scanner = self._build_scanner()
+    
+    def enable_profiling(self, profiler=None):
+        """启用逐模式计数与计时，返回 ExtractionProfiler (可在多个提取器间共享)"""
+        from obd_profile import ExtractionProfiler
+        
+        self.profiler = profiler or ExtractionProfiler()
+        # 用实例属性覆盖逐行步骤的方法 (重复启用时先取回原方法)，未启用时 iter_commands 的执行路径不变
+        for name, phase in (('_find_pid_in_line', 'pid_line'), ('_parse_command_details', 'details')):
+            self.__dict__.pop(name, None)
+            setattr(self, name, self.profiler.wrap(phase, getattr(self, name)))
+        self._scanner = self._build_scanner()
+        return self.profiler
+    
+    def _build_scanner(self) -> LineScanner:
+        """按当前模式列表获取预编译扫描器"""
+        if self.profiler is not None:
+            return self.profiler.build_scanner(self.pid_patterns, self.length_patterns,
+                                               self.unit_patterns, (), self.prefilters)
+        return build_scanner(tuple(self.pid_patterns), tuple(self.length_patterns),
+                             tuple(self.unit_patterns), (), tuple(self.prefilters))
+        
     def extract_from_text(self, text: str) -> List[OBDCommand]:
         """从文本中提取 OBD 命令"""
-        lines = text.split('\n')
+        return self.extract_from_lines(text.split('\n'))
+    
+    def extract_from_lines(self, lines: Iterable[str]) -> List[OBDCommand]:
+        """从逐行输入中提取 OBD 命令并加入 self.commands"""
+        self.commands.extend(self.iter_commands(lines))
+        return self.commands
+    
+    def extract_from_file(self, filename: str, encoding: Optional[str] = None) -> Iterator[OBDCommand]:
+        """流式读取文件，每解析完一条命令立即产出 (不加入 self.commands，内存占用恒定)"""
+        return self.iter_commands(iter_file_lines(filename, encoding))
+    
+    def iter_commands(self, lines: Iterable[str]) -> Iterator[OBDCommand]:
+        """逐行解析，遇到下一条 PID 行时产出上一条已完整的命令"""
         current_command = None
+        self._scanner = self._build_scanner()
         
         for line in lines:
             line = line.strip()
@@ -90,9 +148,9 @@ class OBDExtractor:
             # 检查是否是新的 PID 行
             pid_match = self._find_pid_in_line(line)
             if pid_match:
-                # 保存之前的命令
+                # 产出之前的命令
                 if current_command and current_command.pid:
-                    self.commands.append(current_command)
+                    yield current_command
                 
                 # 开始新命令
                 current_command = OBDCommand()
@@ -103,27 +161,24 @@ class OBDExtractor:
                 # 继续解析当前命令的其他属性
                 self._parse_command_details(current_command, line)
         
-        # 添加最后一个命令
+        # 产出最后一个命令
         if current_command and current_command.pid:
-            self.commands.append(current_command)
-            
-        return self.commands
+            yield current_command
     
     def _find_pid_in_line(self, line: str) -> Optional[Dict]:
         """在行中查找 PID"""
-        for pattern in self.pid_patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
-            if match:
-                if len(match.groups()) >= 2:
-                    return {
-                        'pid': match.group(1),
-                        'description': match.group(2).strip()
-                    }
-                else:
-                    return {
-                        'pid': match.group(1),
-                        'description': line.replace(match.group(0), '').strip()
-                    }
+        match = self._scanner.pid.first(line)
+        if match:
+            if len(match.groups()) >= 2:
+                return {
+                    'pid': match.group(1),
+                    'description': match.group(2).strip()
+                }
+            else:
+                return {
+                    'pid': match.group(1),
+                    'description': line.replace(match.group(0), '').strip()
+                }
         return None
     
     def _parse_command_details(self, command: OBDCommand, line: str):
@@ -132,29 +187,25 @@ class OBDExtractor:
         
         # 查找数据长度
         if not command.data_length:
-            for pattern in self.length_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    command.data_length = match.group(1) + " bytes"
-                    break
+            match = self._scanner.length.first(line)
+            if match:
+                command.data_length = sys.intern(match.group(1) + " bytes")
         
         # 查找单位
         if not command.unit:
-            for pattern in self.unit_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    command.unit = match.group(1).strip()
-                    break
+            match = self._scanner.unit.first(line)
+            if match:
+                command.unit = sys.intern(match.group(1).strip())
         
         # 查找公式
         if 'formula' in line_lower or '公式' in line_lower or '计算' in line_lower:
-            formula_match = re.search(r'[:=]\s*(.+)', line)
+            formula_match = VALUE_RE.search(line)
             if formula_match:
                 command.formula = formula_match.group(1).strip()
         
         # 查找范围
         if 'range' in line_lower or '范围' in line_lower or '取值' in line_lower:
-            range_match = re.search(r'[:=]\s*(.+)', line)
+            range_match = VALUE_RE.search(line)
             if range_match:
                 command.range_values = range_match.group(1).strip()
         
@@ -187,7 +238,10 @@ class OBDExtractor:
             print("没有找到 OBD 命令数据")
             return
         
-        if not PANDAS_AVAILABLE:
+        # pandas 导入较慢，只在导出 Excel 时加载
+        try:
+            import pandas as pd
+        except ImportError:
             print("错误：需要安装 pandas 和 openpyxl 来导出 Excel 文件")
             print("运行: pip install pandas openpyxl")
             return
@@ -211,6 +265,21 @@ class OBDExtractor:
         
         print(f"已导出 {len(self.commands)} 条 OBD 命令到 {filename}")
     
+    def export_stream(self, filename: str, fmt: str, commands: Optional[Iterable[OBDCommand]] = None) -> int:
+        """流式导出 (csv / jsonl / json / excel)，commands 可以是 extract_from_file 产生的生成器"""
+        fieldnames = ['PID', 'Mode', 'Description', 'Data Length', 'Unit', 'Formula', 'Range', 'Notes']
+        try:
+            count = write_stream(self.commands if commands is None else commands, filename, fmt, fieldnames)
+        except ImportError:
+            print("错误：需要安装 openpyxl 来导出 Excel 文件: pip install openpyxl")
+            return 0
+        
+        if count:
+            print(f"已导出 {count} 条 OBD 命令到 {filename}")
+        else:
+            print("没有找到 OBD 命令数据")
+        return count
+    
     def print_summary(self):
         """打印提取结果摘要"""
         print(f"\n=== OBD 命令提取结果 ===")
@@ -221,30 +290,61 @@ class OBDExtractor:
             for i, cmd in enumerate(self.commands[:5], 1):
                 print(f"{i}. PID {cmd.pid}: {cmd.description}")
 
+def _setup_profiling(extractor: OBDExtractor, args):
+    """按命令行参数启用逐模式性能分析"""
+    if args.profile or args.profile_json:
+        extractor.enable_profiling()
+
+def _finish_profiling(extractor: OBDExtractor, args):
+    """输出性能分析报告 / JSON"""
+    if extractor.profiler is None:
+        return
+    if args.profile:
+        extractor.profiler.report()
+    if args.profile_json:
+        extractor.profiler.dump_json(args.profile_json)
+
 def main():
     parser = argparse.ArgumentParser(description='OBD Command Extractor - 从文档中提取 OBD 查询指令')
     parser.add_argument('input_file', help='输入文件路径 (支持 .txt)')
     parser.add_argument('-o', '--output', help='输出文件名 (不含扩展名)', default='obd_commands')
-    parser.add_argument('-f', '--format', choices=['csv', 'excel', 'json', 'all'], 
+    parser.add_argument('-f', '--format', choices=['csv', 'excel', 'json', 'jsonl', 'all'], 
                        default='csv', help='输出格式')
+    parser.add_argument('--stream', action='store_true',
+                       help='边提取边导出，内存占用与文档大小无关 (需要输入文件，不支持 all)')
+    parser.add_argument('--profile', action='store_true',
+                       help='提取结束后打印逐模式性能分析报告')
+    parser.add_argument('--profile-json', metavar='FILE',
+                       help='把逐模式性能分析结果写入 JSON 文件')
     
     args = parser.parse_args()
     
-    # 读取输入文件
+    if args.stream:
+        # 边提取边导出，不在内存中保存全部命令
+        if args.format == 'all':
+            print("错误：--stream 一次只能导出一种格式")
+            sys.exit(1)
+        extractor = OBDExtractor()
+        _setup_profiling(extractor, args)
+        try:
+            extractor.export_stream(f"{args.output}.{STREAM_EXTENSIONS[args.format]}", args.format,
+                                    extractor.extract_from_file(args.input_file))
+        except FileNotFoundError:
+            print(f"错误：找不到文件 {args.input_file}")
+            sys.exit(1)
+        _finish_profiling(extractor, args)
+        return
+    
+    # 创建提取器并逐行读取输入文件处理
+    extractor = OBDExtractor()
+    _setup_profiling(extractor, args)
     try:
-        with open(args.input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except UnicodeDecodeError:
-        with open(args.input_file, 'r', encoding='gb2312') as f:
-            content = f.read()
+        extractor.extract_from_lines(iter_file_lines(args.input_file))
     except FileNotFoundError:
         print(f"错误：找不到文件 {args.input_file}")
         sys.exit(1)
-    
-    # 创建提取器并处理
-    extractor = OBDExtractor()
-    extractor.extract_from_text(content)
     extractor.print_summary()
+    _finish_profiling(extractor, args)
     
     # 导出结果
     if args.format == 'csv' or args.format == 'all':
@@ -258,6 +358,9 @@ def main():
     
     if args.format == 'json' or args.format == 'all':
         extractor.export_to_json(f"{args.output}.json")
+    
+    if args.format == 'jsonl':
+        extractor.export_stream(f"{args.output}.jsonl", 'jsonl')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
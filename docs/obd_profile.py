@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+提取器逐模式性能分析
+为 OBDExtractor / EnhancedOBDExtractor 提供可选的计数与计时：每个正则模式的尝试次数、匹配次数和累计耗时，
+各阶段预筛选的拒绝次数，以及逐行处理各步骤 (PID 行识别、详细信息解析) 的耗时。
+只有调用 enable_profiling() 后才替换为带计时的扫描器，未启用时提取器的执行路径不变
+"""
+
+import json
+import sys
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, TextIO, Tuple
+
+from obd_scanner import LineScanner, PatternSet
+
+STAGES = ('pid', 'length', 'unit', 'formula')
+
+
+class PatternStats:
+    """一个模式的统计"""
+    __slots__ = ('pattern', 'attempts', 'matches', 'seconds')
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.attempts = 0
+        self.matches = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        return {'pattern': self.pattern, 'attempts': self.attempts, 'matches': self.matches,
+                'seconds': self.seconds}
+
+
+class StageStats:
+    """一个阶段 (PID / 长度 / 单位 / 公式) 的统计：预筛选 + 各模式"""
+    __slots__ = ('name', 'calls', 'rejected', 'prefilter_seconds', 'patterns')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.rejected = 0          # 被预筛选直接跳过的行数
+        self.prefilter_seconds = 0.0
+        self.patterns: Dict[str, PatternStats] = {}
+
+    def pattern_stats(self, patterns: Sequence[str]) -> Tuple[PatternStats, ...]:
+        """按模式文本取得统计对象 (模式列表修改后重新构建扫描器时，未变的模式继续累计)"""
+        return tuple(self.patterns.setdefault(p, PatternStats(p)) for p in patterns)
+
+    @property
+    def seconds(self) -> float:
+        return self.prefilter_seconds + sum(s.seconds for s in self.patterns.values())
+
+    def to_dict(self) -> Dict:
+        return {'calls': self.calls, 'rejected': self.rejected,
+                'prefilter_seconds': self.prefilter_seconds, 'seconds': self.seconds,
+                'patterns': [s.to_dict() for s in self.patterns.values()]}
+
+
+class ProfiledPatternSet(PatternSet):
+    """与 PatternSet 语义相同，额外记录每次预筛选和模式搜索的次数与耗时"""
+    __slots__ = ('stage', '_stats')
+
+    def __init__(self, patterns: Sequence[str], prefilter: Optional[str], stage: StageStats):
+        super().__init__(patterns, prefilter)
+        self.stage = stage
+        self._stats = stage.pattern_stats(self.patterns)
+
+    def _passes_prefilter(self, line: str) -> bool:
+        stage = self.stage
+        stage.calls += 1
+        if self._prefilter is None:
+            return True
+        start = perf_counter()
+        passed = self._prefilter(line) is not None
+        stage.prefilter_seconds += perf_counter() - start
+        if not passed:
+            stage.rejected += 1
+        return passed
+
+    def first(self, line: str):
+        if not self._passes_prefilter(line):
+            return None
+        for search, stats in zip(self._searches, self._stats):
+            start = perf_counter()
+            match = search(line)
+            stats.seconds += perf_counter() - start
+            stats.attempts += 1
+            if match:
+                stats.matches += 1
+                return match
+        return None
+
+    def matches(self, line: str):
+        if not self._passes_prefilter(line):
+            return
+        for search, stats in zip(self._searches, self._stats):
+            start = perf_counter()
+            match = search(line)
+            stats.seconds += perf_counter() - start
+            stats.attempts += 1
+            if match:
+                stats.matches += 1
+                yield match
+
+
+class ExtractionProfiler:
+    """收集一次或多次提取运行的统计"""
+
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {name: StageStats(name) for name in STAGES}
+        # 逐行步骤 -> [调用次数, 累计秒数]
+        self.phases: Dict[str, List] = {}
+
+    def build_scanner(self, pid_patterns: Sequence[str], length_patterns: Sequence[str],
+                      unit_patterns: Sequence[str], formula_patterns: Sequence[str] = (),
+                      prefilters: Sequence[Optional[str]] = ()) -> LineScanner:
+        """与 obd_scanner.build_scanner 参数相同，返回带计时的扫描器 (不缓存)"""
+        prefilters = tuple(prefilters) + (None,) * (4 - len(prefilters))
+        sets = [ProfiledPatternSet(patterns, prefilter, self.stages[name])
+                for name, patterns, prefilter in zip(
+                    STAGES, (pid_patterns, length_patterns, unit_patterns, formula_patterns), prefilters)]
+        return LineScanner(*sets)
+
+    def wrap(self, phase: str, func: Callable) -> Callable:
+        """包装一个逐行步骤，记录调用次数和耗时"""
+        record = self.phases.setdefault(phase, [0, 0.0])
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record[0] += 1
+                record[1] += perf_counter() - start
+        return timed
+
+    def reset(self):
+        """清空全部统计"""
+        for stage in self.stages.values():
+            stage.calls = stage.rejected = 0
+            stage.prefilter_seconds = 0.0
+            for stats in stage.patterns.values():
+                stats.attempts = stats.matches = 0
+                stats.seconds = 0.0
+        for record in self.phases.values():
+            record[0], record[1] = 0, 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'phases': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in self.phases.items()},
+            'stages': {name: stage.to_dict() for name, stage in self.stages.items() if stage.calls},
+        }
+
+    def dump_json(self, filename: str):
+        """把统计写入 JSON 文件"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        print(f"性能分析结果已写入 {filename}")
+
+    def report(self, out: TextIO = None):
+        """打印文本报告：各步骤耗时，以及每个阶段内按耗时排序的模式"""
+        out = out or sys.stdout
+        print("\n=== 提取性能分析 ===", file=out)
+        print("逐行步骤:", file=out)
+        for name, (calls, seconds) in self.phases.items():
+            per_call = seconds / calls * 1e6 if calls else 0.0
+            print(f"  {name:16s} {calls:>10,} 次  {seconds * 1000:10.2f} ms  {per_call:8.2f} µs/次", file=out)
+
+        for name, stage in self.stages.items():
+            if not stage.calls:
+                continue
+            print(f"\n阶段 {name}: {stage.calls:,} 行，预筛选跳过 {stage.rejected:,} 行 "
+                  f"({stage.prefilter_seconds * 1000:.2f} ms)，合计 {stage.seconds * 1000:.2f} ms", file=out)
+            for stats in sorted(stage.patterns.values(), key=lambda s: s.seconds, reverse=True):
+                rate = stats.matches / stats.attempts if stats.attempts else 0.0
+                print(f"  {stats.seconds * 1000:10.2f} ms  尝试 {stats.attempts:>9,}  "
+                      f"匹配 {stats.matches:>9,} ({rate:6.1%})  {stats.pattern}", file=out)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+OBD 文档行扫描器
+提取器的所有正则在这里一次性预编译，每个阶段 (PID 行识别、数据长度、单位、公式)
+先用一个合并的关键字正则做预筛选，行中不含任何关键字时直接跳过该阶段的全部模式
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterator, Optional, Sequence
+
+# 取值/公式行中 ":" 或 "=" 之后的内容
+VALUE_RE = re.compile(r'[:=]\s*(.+)')
+# 清理开头的分隔符和结尾的标点
+LEADING_SEPARATORS_RE = re.compile(r'^[:\-\s]+')
+TRAILING_SEPARATORS_RE = re.compile(r'[,;\s]+$')
+
+
+class PatternSet:
+    """按顺序尝试的一组预编译正则，保持 "第一个匹配的模式优先" 的语义
+
+    测试过把整组模式合并成一个带命名组的交替正则 (用前瞻保持优先级)，
+    在 CPython 的 re 引擎上反而比逐个调用预编译模式慢，所以只把预筛选合并为一个正则。
+    """
+    __slots__ = ('patterns', '_searches', '_prefilter')
+
+    def __init__(self, patterns: Sequence[str], prefilter: Optional[str] = None,
+                 flags: int = re.IGNORECASE):
+        self.patterns = tuple(patterns)
+        self._searches = tuple(re.compile(p, flags).search for p in self.patterns)
+        # 预筛选与模式使用相同的标志，保证大小写等匹配规则一致
+        self._prefilter = re.compile(prefilter, flags).search if prefilter else None
+
+    def first(self, line: str):
+        """返回按顺序第一个匹配的结果 (等价于依次 re.search)"""
+        if self._prefilter is not None and self._prefilter(line) is None:
+            return None
+        for search in self._searches:
+            match = search(line)
+            if match:
+                return match
+        return None
+
+    def matches(self, line: str) -> Iterator:
+        """按模式顺序依次产生每个匹配的模式的结果"""
+        if self._prefilter is not None and self._prefilter(line) is None:
+            return
+        for search in self._searches:
+            match = search(line)
+            if match:
+                yield match
+
+
+class LineScanner:
+    """一个提取器的全部预编译模式"""
+    __slots__ = ('pid', 'length', 'unit', 'formula')
+
+    def __init__(self, pid: PatternSet, length: PatternSet, unit: PatternSet, formula: PatternSet):
+        self.pid = pid
+        self.length = length
+        self.unit = unit
+        self.formula = formula
+
+
+@lru_cache(maxsize=32)
+def build_scanner(pid_patterns: tuple, length_patterns: tuple, unit_patterns: tuple,
+                  formula_patterns: tuple = (), prefilters: tuple = ()) -> LineScanner:
+    """编译扫描器 (相同的模式组合在进程内只编译一次)
+
+    prefilters 为 (PID, 长度, 单位, 公式) 四个阶段的预筛选关键字正则，
+    必须覆盖对应阶段每个模式匹配时一定出现的关键字；为 None 时不做预筛选。
+    """
+    prefilters = tuple(prefilters) + (None,) * (4 - len(prefilters))
+    return LineScanner(
+        PatternSet(pid_patterns, prefilters[0]),
+        PatternSet(length_patterns, prefilters[1]),
+        PatternSet(unit_patterns, prefilters[2]),
+        PatternSet(formula_patterns, prefilters[3]),
+    )
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+文档流式读取
+按块检测编码、逐行读取输入文档，内存占用与文档大小无关
+"""
+
+import codecs
+import io
+from typing import Iterator, Optional
+
+# 与原先 main() 的行为一致：先尝试 UTF-8，失败时回退到 GB2312
+FALLBACK_ENCODING = 'gb2312'
+CHUNK_SIZE = 1 << 20
+
+
+def detect_encoding(filename: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """按块增量解码检测整个文件的编码 (UTF-8 或 GB2312)，不把整个文件读入内存
+
+    需要在读取前确定编码时使用 (如按字节偏移分块并行解析)；逐行读取用 iter_file_lines，只读一遍文件
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(filename, 'rb') as f:
+        try:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    decoder.decode(b'', final=True)
+                    return 'utf-8'
+                decoder.decode(chunk)
+        except UnicodeDecodeError:
+            return FALLBACK_ENCODING
+
+
+def _line_break_end(data: bytes) -> int:
+    """data 中最后一个完整换行之后的位置 (没有时为 0)，不把 "\\r\\n" 拆到两块中"""
+    end = data.rfind(b'\n') + 1
+    if not end:
+        # 只用 "\r" 换行的文件；结尾的 "\r" 可能与下一块开头的 "\n" 组成 "\r\n"
+        end = data.rfind(b'\r', 0, len(data) - 1) + 1
+    return end
+
+
+def iter_file_lines(filename: str, encoding: Optional[str] = None,
+                    chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """逐行读取文本文件 (通用换行符，与 f.read().split('\\n') 的切分结果一致)
+
+    未指定编码时边读边按 UTF-8 解码，在第一个解码错误处 (从出错的块开始) 改用 GB2312，
+    文件只读一遍；不超过一块的文件与整个文件检测编码的结果相同。
+    UTF-8 和 GB2312 的多字节字符都不含换行字节，所以可以先按字节找换行再分块解码。
+    """
+    if encoding is not None:
+        with open(filename, 'r', encoding=encoding) as f:
+            yield from f
+        return
+
+    encoding = 'utf-8'
+    with open(filename, 'rb') as f:
+        rest = b''
+        while True:
+            chunk = f.read(chunk_size)
+            data = rest + chunk
+            if chunk:
+                end = _line_break_end(data)
+                if not end:
+                    rest = data
+                    continue
+                data, rest = data[:end], data[end:]
+            try:
+                text = data.decode(encoding)
+            except UnicodeDecodeError:
+                if encoding == FALLBACK_ENCODING:
+                    raise
+                encoding = FALLBACK_ENCODING
+                text = data.decode(encoding)
+            yield from io.StringIO(text, newline=None)
+            if not chunk:
+                return
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+PID 批量解码器 (NumPy)
+用于离线处理录制的原始响应日志：对同一 PID 的大量定长响应数据一次性解码，
+1 字节和 2 字节公式使用预先计算的 256 / 65536 项查找表，其余公式使用向量化运算
+"""
+
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from pid_formula import CompiledFormula, FormulaError, compile_formula
+
+# 位字段向量化解码的最大宽度 (uint64)，更宽的位字段返回 Python 整数的 object 数组
+UINT64_BYTES = 8
+
+
+class BatchDecoder:
+    """单个公式的批量解码器"""
+
+    def __init__(self, compiled: CompiledFormula, payload_length: Optional[int] = None):
+        self.compiled = compiled
+        self.payload_length = payload_length or compiled.byte_count
+        if not self.payload_length:
+            raise FormulaError(f"公式 {compiled.formula!r} 未指定数据长度，无法批量解码")
+        if self.payload_length < compiled.byte_count:
+            raise FormulaError(f"公式 {compiled.formula!r} 需要 {compiled.byte_count} 字节数据，"
+                               f"payload_length 只有 {self.payload_length}")
+
+        self._codes = [compile(src, f"<pid formula {compiled.formula!r}>", 'eval')
+                       for src in compiled.outputs] if compiled.kind == 'expr' else []
+        self._lut = None
+        if compiled.kind == 'expr' and compiled.byte_count == 1:
+            self._lut = self._evaluate([np.arange(256, dtype=np.int64)])
+        elif compiled.kind == 'expr' and compiled.byte_count == 2:
+            index = np.arange(65536, dtype=np.int64)
+            self._lut = self._evaluate([index >> 8, index & 0xFF])
+
+    @property
+    def outputs(self) -> int:
+        return len(self.compiled.outputs)
+
+    def _evaluate(self, columns) -> np.ndarray:
+        """用向量化运算计算公式，columns 为 A, B, C... 各字节列"""
+        count = len(columns[0]) if columns else 0
+        namespace = {}
+        for var in self.compiled.variables:
+            column = columns[ord(var) - ord('A')]
+            namespace[var] = column
+            namespace['S_' + var] = np.where(column > 127, column - 256, column)
+        results = [np.broadcast_to(np.asarray(eval(code, {'__builtins__': {}}, namespace),
+                                              dtype=np.float64), (count,))
+                   for code in self._codes]
+        if len(results) == 1:
+            return np.ascontiguousarray(results[0])
+        return np.stack(results, axis=1)
+
+    def _as_matrix(self, payloads) -> np.ndarray:
+        """将连续字节缓冲区或二维数组转换为 (N, payload_length) 的 uint8 矩阵 (尽量不复制)"""
+        if isinstance(payloads, np.ndarray) and payloads.ndim == 2:
+            matrix = payloads if payloads.dtype == np.uint8 else payloads.astype(np.uint8)
+        else:
+            flat = payloads if isinstance(payloads, np.ndarray) else np.frombuffer(payloads, dtype=np.uint8)
+            if flat.dtype != np.uint8:
+                flat = flat.astype(np.uint8)
+            if flat.size % self.payload_length:
+                raise ValueError(f"缓冲区长度 {flat.size} 不是响应长度 {self.payload_length} 的整数倍")
+            matrix = flat.reshape(-1, self.payload_length)
+        if matrix.shape[1] < self.compiled.byte_count:
+            raise FormulaError(f"公式 {self.compiled.formula!r} 需要 {self.compiled.byte_count} 字节数据，"
+                               f"实际只有 {matrix.shape[1]} 字节")
+        return matrix
+
+    def decode(self, payloads) -> np.ndarray:
+        """批量解码，单输出公式返回形状 (N,) 的数组，多输出公式返回 (N, 输出数)
+
+        位字段返回 uint64 数组，超过 8 字节的位字段返回 object 数组
+        """
+        matrix = self._as_matrix(payloads)
+        compiled = self.compiled
+
+        if compiled.kind == 'bitfield':
+            width = compiled.byte_count or matrix.shape[1]
+            if width > UINT64_BYTES:
+                # uint64 放不下，逐条用标量解码器得到 Python 整数 (object 数组)
+                values = np.empty(len(matrix), dtype=object)
+                for i, row in enumerate(matrix):
+                    values[i] = compiled(row.tobytes())[0]
+                return values
+            values = np.zeros(len(matrix), dtype=np.uint64)
+            for i in range(width):
+                values = (values << np.uint64(8)) | matrix[:, i].astype(np.uint64)
+            return values
+
+        if self._lut is not None:
+            if compiled.byte_count == 1:
+                return self._lut[matrix[:, 0]]
+            index = (matrix[:, 0].astype(np.uint16) << 8) | matrix[:, 1]
+            return self._lut[index]
+
+        columns = [matrix[:, i].astype(np.int64) for i in range(compiled.byte_count)]
+        return self._evaluate(columns)
+
+
+@lru_cache(maxsize=None)
+def _get_batch_decoder(formula: str, data_length, payload_length: Optional[int]) -> BatchDecoder:
+    compiled = compile_formula(formula, data_length)
+    if compiled is None:
+        raise FormulaError("PID 没有公式，无法解码")
+    return BatchDecoder(compiled, payload_length)
+
+
+def get_batch_decoder(record, payload_length: Optional[int] = None) -> BatchDecoder:
+    """获取 VoltPID / OBDCommand 对应的批量解码器 (按公式缓存，查找表只构建一次)"""
+    return _get_batch_decoder(record.formula, getattr(record, 'data_length', None), payload_length)
+
+
+def decode_batch(record, payloads, payload_length: Optional[int] = None) -> np.ndarray:
+    """批量解码同一 PID 的定长响应数据
+
+    payloads 可以是 bytes / bytearray / memoryview 等连续缓冲区 (每条响应 payload_length 字节)，
+    也可以是形状为 (N, payload_length) 的 uint8 数组。
+    """
+    return get_batch_decoder(record, payload_length).decode(payloads)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+ECU 支持的 PID 发现
+读取 VIN (0902) 和 Mode 01 的 "支持的 PID" 位图 (0100 / 0120 / 0140 ...)，并逐个 header 探测 Mode 22 DID，
+记录 ECU 的否定响应 (NRC)；结果按 VIN / ECU 缓存到 JSON 文件，之后按支持的集合过滤
+EnhancedOBDExtractor.reference_pids 和 VoltPIDDatabase，再交给轮询调度，不在总线上浪费请求
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+from did_packer import (NEGATIVE_RESPONSE, NRC_NAMES, POSITIVE_RESPONSE, ResponseError,
+                        pack_requests, split_response)
+from elm327_client import AdapterError, ELM327Client
+
+# Mode 01 位图 PID 间隔 32，最后一位表示下一组位图是否可用
+BITMAP_STEP = 0x20
+MAX_BITMAP_BASE = 0xE0
+ENGINE_ECU = ('7E0', '7E8')
+DEFAULT_CACHE = 'pid_discovery_cache.json'
+# 缓存格式变化时递增，使旧缓存失效
+CACHE_FORMAT = 1
+NRC_INVALID_FORMAT = 0x13
+# 总线暂时性错误的重试次数 (重试后仍失败的 DID 视为 "未确定"，过滤时保留)
+PROBE_RETRIES = 1
+TRANSIENT_ERRORS = ('CAN ERROR', 'BUS BUSY', 'BUS ERROR', 'BUFFER FULL', 'DATA ERROR', 'STOPPED')
+
+
+def decode_supported_bitmap(base: int, data: bytes) -> Tuple[List[str], bool]:
+    """解码 4 字节位图，返回 (支持的 PID 代码列表, 下一组位图是否可用)
+
+    第 1 位 (最高位) 对应 base+1，第 32 位对应 base+32 (即下一组位图本身)。
+    """
+    if len(data) < 4:
+        raise ResponseError(f"位图长度不足: {bytes(data).hex().upper()}")
+    bits = int.from_bytes(data[:4], 'big')
+    codes = [f"{base + i:02X}" for i in range(1, 33) if bits & (1 << (32 - i))]
+    return codes, bool(bits & 1)
+
+
+def parse_vin(payload: bytes) -> str:
+    """解析 0902 响应 (49 02 [条目数] VIN...)，去掉填充字节"""
+    if len(payload) < 3 or payload[0] != 0x49 or payload[1] != 0x02:
+        raise ResponseError(f"非 VIN 响应: {bytes(payload).hex().upper()}")
+    # CAN 上第三个字节为数据条目数 (1)，旧协议没有这个字节
+    body = payload[3:] if payload[2] == 0x01 and len(payload) >= 20 else payload[2:]
+    return ''.join(chr(b) for b in body if 0x20 < b < 0x7F)
+
+
+class EcuSupport:
+    """一个 ECU (请求 header) 的发现结果"""
+    __slots__ = ('header', 'response', 'mode01', 'dids', 'rejected', 'undetermined')
+
+    def __init__(self, header: str, response: str):
+        self.header = header
+        self.response = response
+        self.mode01: Optional[Set[str]] = None       # 支持的 Mode 01 PID (None 表示未查询)
+        self.dids: Set[int] = set()                  # 肯定响应的 DID
+        self.rejected: Dict[int, Optional[int]] = {}  # DID -> NRC (None 表示 NO DATA / 响应中省略)
+        self.undetermined: Set[int] = set()           # 总线错误导致未能确定的 DID
+
+    def supports_did(self, did: int) -> Optional[bool]:
+        """DID 是否支持，未探测或未确定时返回 None"""
+        if did in self.dids:
+            return True
+        if did in self.rejected:
+            return False
+        return None
+
+    def to_dict(self) -> Dict:
+        return {
+            'header': self.header,
+            'response': self.response,
+            'mode01': sorted(self.mode01) if self.mode01 is not None else None,
+            'dids': [f"{did:04X}" for did in sorted(self.dids)],
+            'rejected': {f"{did:04X}": nrc for did, nrc in sorted(self.rejected.items())},
+            'undetermined': [f"{did:04X}" for did in sorted(self.undetermined)],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'EcuSupport':
+        ecu = cls(data['header'], data['response'])
+        ecu.mode01 = set(data['mode01']) if data.get('mode01') is not None else None
+        ecu.dids = {int(did, 16) for did in data.get('dids', ())}
+        ecu.rejected = {int(did, 16): nrc for did, nrc in data.get('rejected', {}).items()}
+        ecu.undetermined = {int(did, 16) for did in data.get('undetermined', ())}
+        return ecu
+
+
+class DiscoveryResult:
+    """一辆车 (VIN) 的发现结果，按请求 header 保存各 ECU"""
+
+    def __init__(self, vin: Optional[str], timestamp: Optional[float] = None):
+        self.vin = vin
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.ecus: Dict[str, EcuSupport] = {}
+
+    def ecu(self, header: str, response: str) -> EcuSupport:
+        key = header.upper()
+        ecu = self.ecus.get(key)
+        if ecu is None:
+            ecu = self.ecus[key] = EcuSupport(key, response.upper())
+        return ecu
+
+    @property
+    def mode01(self) -> Optional[Set[str]]:
+        """支持的 Mode 01 PID (发动机 ECU)"""
+        ecu = self.ecus.get(ENGINE_ECU[0])
+        return ecu.mode01 if ecu is not None else None
+
+    def supports_pid(self, pid: VoltPID) -> Optional[bool]:
+        """VoltPID 是否支持，该 ECU 未探测或结果未确定时返回 None"""
+        ecu = self.ecus.get(pid.header.upper())
+        return ecu.supports_did(pid.did) if ecu is not None else None
+
+    def to_dict(self) -> Dict:
+        return {'vin': self.vin, 'timestamp': self.timestamp,
+                'ecus': {header: ecu.to_dict() for header, ecu in self.ecus.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DiscoveryResult':
+        result = cls(data.get('vin'), data.get('timestamp'))
+        for header, ecu in data.get('ecus', {}).items():
+            result.ecus[header] = EcuSupport.from_dict(ecu)
+        return result
+
+    def print_summary(self):
+        print(f"\n=== PID 发现结果 (VIN {self.vin or '未知'}) ===")
+        for header, ecu in self.ecus.items():
+            if ecu.mode01 is not None:
+                print(f"  {header}/{ecu.response} Mode 01: 支持 {len(ecu.mode01)} 个 PID")
+            if ecu.dids or ecu.rejected or ecu.undetermined:
+                print(f"  {header}/{ecu.response} Mode 22: 支持 {len(ecu.dids)} 个 DID，"
+                      f"拒绝 {len(ecu.rejected)} 个，未确定 {len(ecu.undetermined)} 个")
+                for did, nrc in sorted(ecu.rejected.items()):
+                    reason = f"NRC 0x{nrc:02X} ({NRC_NAMES.get(nrc, 'unknown')})" if nrc is not None else 'NO DATA'
+                    print(f"    {did:04X}: {reason}")
+
+
+class DiscoveryCache:
+    """按 VIN 保存发现结果的 JSON 文件"""
+
+    def __init__(self, path: str = DEFAULT_CACHE):
+        self.path = path
+        self._entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('format') == CACHE_FORMAT:
+                self._entries = data.get('vehicles', {})
+
+    def get(self, vin: str) -> Optional[DiscoveryResult]:
+        entry = self._entries.get(vin)
+        return DiscoveryResult.from_dict(entry) if entry is not None else None
+
+    def put(self, result: DiscoveryResult):
+        """保存结果 (没有 VIN 的结果不缓存)，同一 VIN 已有的其他 ECU 结果保留"""
+        if not result.vin:
+            return
+        entry = self._entries.get(result.vin)
+        if entry is not None:
+            merged = DiscoveryResult.from_dict(entry)
+            merged.ecus.update(result.ecus)
+            merged.timestamp = result.timestamp
+            result = merged
+        self._entries[result.vin] = result.to_dict()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'format': CACHE_FORMAT, 'vehicles': self._entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+async def read_vin(client: ELM327Client, header: str = ENGINE_ECU[0],
+                   response: str = ENGINE_ECU[1]) -> Optional[str]:
+    """读取 VIN，ECU 不支持时返回 None"""
+    try:
+        data = await client.request('0902', header, response)
+        return parse_vin(data) or None
+    except (AdapterError, ResponseError, asyncio.TimeoutError):
+        return None
+
+
+async def read_supported_pids(client: ELM327Client, header: str = ENGINE_ECU[0],
+                              response: str = ENGINE_ECU[1]) -> Set[str]:
+    """依次读取 Mode 01 位图，直到某组位图表示后面没有更多 PID"""
+    supported: Set[str] = set()
+    base = 0
+    while base <= MAX_BITMAP_BASE:
+        try:
+            data = await client.request(f"01{base:02X}", header, response)
+        except (AdapterError, asyncio.TimeoutError):
+            break
+        if len(data) < 6 or data[0] != 0x41 or data[1] != base:
+            break
+        codes, more = decode_supported_bitmap(base, data[2:6])
+        supported.update(codes)
+        if not more:
+            break
+        base += BITMAP_STEP
+    return supported
+
+
+async def _probe_request(client: ELM327Client, ecu: EcuSupport, request) -> bool:
+    """探测一条 (可能是多 DID 的) 请求，返回 False 表示需要把其中的 DID 逐个重新探测"""
+    for attempt in range(PROBE_RETRIES + 1):
+        try:
+            data = await client.request(request.command, request.header, request.response)
+        except AdapterError as exc:
+            if str(exc) in TRANSIENT_ERRORS and attempt < PROBE_RETRIES:
+                continue
+            if str(exc) == 'NO DATA':
+                if len(request.dids) > 1:
+                    # 部分 ECU 对多 DID 请求不回复，逐个重新探测
+                    return False
+                for did in request.dids:
+                    ecu.rejected[did] = None
+            else:
+                ecu.undetermined.update(request.dids)
+            return True
+        except asyncio.TimeoutError:
+            ecu.undetermined.update(request.dids)
+            return True
+        break
+
+    if data and data[0] == NEGATIVE_RESPONSE and len(data) >= 3:
+        nrc = data[2]
+        if nrc == NRC_INVALID_FORMAT and len(request.dids) > 1:
+            return False
+        for did in request.dids:
+            ecu.rejected[did] = nrc
+        return True
+    if not data or data[0] != POSITIVE_RESPONSE:
+        ecu.undetermined.update(request.dids)
+        return True
+
+    if len(request.dids) == 1:
+        found = request.dids if data[1:3] == request.dids[0].to_bytes(2, 'big') else []
+    else:
+        # 多 DID 请求中 ECU 不支持的 DID 直接从响应中省略
+        try:
+            found = list(split_response(data, None, request.lengths))
+        except ResponseError:
+            ecu.undetermined.update(request.dids)
+            return True
+    ecu.dids.update(found)
+    for did in request.dids:
+        if did not in found:
+            ecu.rejected[did] = None
+    return True
+
+
+async def probe_dids(client: ELM327Client, pids: Iterable[VoltPID], result: DiscoveryResult,
+                     max_dids: int = 3):
+    """逐个 ECU 探测 Mode 22 DID，结果写入 result
+
+    max_dids > 1 时先用多 DID 请求一次探测多个 DID，ECU 回复 NRC 0x13 (不接受多 DID)
+    或 NO DATA 时，该请求中的 DID 改为逐个探测。
+    """
+    for request in pack_requests(pids, max_dids=max_dids):
+        ecu = result.ecu(request.header, request.response)
+        if not await _probe_request(client, ecu, request):
+            for single in pack_requests([pid for did in request.dids for pid in request.pids[did]], max_dids=1):
+                await _probe_request(client, ecu, single)
+
+
+async def discover(client: ELM327Client, db: Optional[VoltPIDDatabase] = None,
+                   cache: Optional[DiscoveryCache] = None, refresh: bool = False,
+                   max_dids: int = 3) -> DiscoveryResult:
+    """完整的发现流程：VIN -> 缓存命中则直接返回 -> Mode 01 位图 -> Mode 22 DID 探测 -> 写入缓存"""
+    db = db or client.db
+    vin = await read_vin(client)
+    if cache is not None and vin and not refresh:
+        cached = cache.get(vin)
+        if cached is not None:
+            return cached
+
+    result = DiscoveryResult(vin)
+    result.ecu(*ENGINE_ECU).mode01 = await read_supported_pids(client)
+    await probe_dids(client, db.pids, result, max_dids)
+    if cache is not None:
+        cache.put(result)
+    return result
+
+
+def filter_reference(reference: Dict, result: DiscoveryResult) -> Dict:
+    """只保留 ECU 支持的 Mode 01 参考 PID (位图 PID 本身始终保留)；未查询位图时原样返回"""
+    supported = result.mode01
+    if supported is None:
+        return dict(reference)
+    return {code: cmd for code, cmd in reference.items()
+            if code.upper() in supported or int(code, 16) % BITMAP_STEP == 0}
+
+
+def filter_database(db: VoltPIDDatabase, result: DiscoveryResult) -> VoltPIDDatabase:
+    """返回只包含支持的 PID 的新数据库；未探测或未确定的 PID 保留"""
+    filtered = VoltPIDDatabase()
+    filtered.pids = [pid for pid in db.pids if result.supports_pid(pid) is not False]
+    filtered.rebuild_indexes()
+    return filtered
+
+
+async def _run(args):
+    server = None
+    if args.simulate:
+        from elm327_simulator import ELM327Simulator, SimulatorConfig, serve_tcp
+
+        unsupported = args.unsupported.split(',') if args.unsupported else ()
+        sim = ELM327Simulator(SimulatorConfig(latency=0.0, seed=1, unsupported=unsupported,
+                                              multi_did=not args.no_multi_did))
+        server = await serve_tcp(sim, '127.0.0.1', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        client = await ELM327Client.open_tcp(host, port)
+    elif args.serial:
+        client = await ELM327Client.open_serial(args.serial, args.baudrate)
+    else:
+        host, _, port = args.tcp.rpartition(':')
+        client = await ELM327Client.open_tcp(host or '127.0.0.1', int(port))
+
+    try:
+        version = await client.initialize()
+        print(f"已连接: {version}")
+        cache = DiscoveryCache(args.cache) if args.cache else None
+        start = time.perf_counter()
+        result = await discover(client, cache=cache, refresh=args.refresh, max_dids=args.pack)
+        print(f"发现用时 {time.perf_counter() - start:.2f} 秒，{client.stats.requests} 条请求")
+        result.print_summary()
+
+        from enhanced_obd_extractor import EnhancedOBDExtractor
+        from poll_scheduler import build_poll_plan
+
+        reference = EnhancedOBDExtractor().reference_pids
+        kept = filter_reference(reference, result)
+        db = filter_database(client.db, result)
+        print(f"\nMode 01 参考 PID: {len(reference)} -> {len(kept)}")
+        print(f"Volt PID: {len(client.db.pids)} -> {len(db.pids)}")
+        if args.plan:
+            build_poll_plan(db).print_report()
+    finally:
+        await client.close()
+        if server is not None:
+            server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ECU 支持的 PID 发现')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--tcp', default='127.0.0.1:35000', help='TCP 适配器地址 host:port')
+    target.add_argument('--serial', help='串口或伪终端路径')
+    target.add_argument('--simulate', action='store_true', help='连接进程内的模拟适配器')
+    parser.add_argument('--baudrate', type=int, default=38400, help='串口波特率')
+    parser.add_argument('-c', '--cache', default=DEFAULT_CACHE, help='发现结果缓存文件 (空字符串表示不缓存)')
+    parser.add_argument('--refresh', action='store_true', help='忽略缓存重新探测')
+    parser.add_argument('--pack', type=int, default=3, help='探测时每条请求最多的 DID 数')
+    parser.add_argument('--plan', action='store_true', help='输出按支持的 PID 生成的轮询计划')
+    parser.add_argument('--unsupported', help='模拟器中不支持的 PID 代码，逗号分隔 (配合 --simulate)')
+    parser.add_argument('--no-multi-did', action='store_true', help='模拟器拒绝多 DID 请求 (配合 --simulate)')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
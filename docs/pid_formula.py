@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+PID 公式编译器
+将 "((A*256)+B)/4"、"(S_A*256+B)/20"、"A/200, (B-128)*100/128" 这类公式字符串
+一次性解析、校验并编译为 Python 解码函数，解码时不再做任何字符串解析
+"""
+
+import itertools
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# 允许的字节变量 A-Z，S_ 前缀表示按有符号字节解释
+_TOKEN_RE = re.compile(r'\s*(?:(?P<num>\d+(?:\.\d+)?|\.\d+)|(?P<var>S_[A-Z]|[A-Z])|(?P<op>[-+*/(),]))')
+_BITFIELD_RE = re.compile(r'^(\d+)\s*bits?$', re.IGNORECASE)
+_DATA_LENGTH_RE = re.compile(r'(\d+)')
+
+# 位编码类公式的描述文字
+_BIT_ENCODED_NAMES = {'bit encoded', 'bitfield', 'encoded'}
+
+
+class FormulaError(ValueError):
+    """公式无法解析或数据不足时抛出"""
+
+
+class CompiledFormula:
+    """已编译的 PID 公式"""
+    __slots__ = ('formula', 'kind', 'outputs', 'variables', 'byte_count', '_func')
+
+    def __init__(self, formula: str, kind: str, outputs: Tuple[str, ...],
+                 variables: Tuple[str, ...], byte_count: int, func):
+        self.formula = formula
+        self.kind = kind                # 'expr' 算术公式, 'bitfield' 位字段
+        self.outputs = outputs          # 每个输出值对应的规范化表达式
+        self.variables = variables      # 使用到的字节变量 (不含 S_ 前缀)
+        self.byte_count = byte_count    # 解码所需的最少数据字节数
+        self._func = func
+
+    def __call__(self, data) -> Tuple:
+        """解码响应数据字节 (模式/PID 回显之后的 A, B, C... 字节)，返回各输出值"""
+        if len(data) < self.byte_count:
+            raise FormulaError(f"公式 {self.formula!r} 需要 {self.byte_count} 字节数据，实际只有 {len(data)} 字节")
+        return self._func(data)
+
+    def __repr__(self) -> str:
+        return f"CompiledFormula({self.formula!r}, outputs={len(self.outputs)}, bytes={self.byte_count})"
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    """将公式切分为记号"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise FormulaError(f"公式中存在无法识别的字符: {text[pos:]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降解析器，输出规范化的 Python 表达式"""
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.pos = 0
+        self.variables = set()
+
+    def _peek(self) -> Optional[str]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][1]
+        return None
+
+    def _next(self) -> Tuple[str, str]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse_outputs(self) -> List[str]:
+        outputs = [self._expr()]
+        while self._peek() == ',':
+            self._next()
+            outputs.append(self._expr())
+        if self.pos != len(self.tokens):
+            raise FormulaError(f"公式在 {self._peek()!r} 处有多余内容")
+        return outputs
+
+    def _expr(self) -> str:
+        result = self._term()
+        while self._peek() in ('+', '-'):
+            op = self._next()[1]
+            result = f"{result} {op} {self._term()}"
+        return result
+
+    def _term(self) -> str:
+        result = self._factor()
+        while self._peek() in ('*', '/'):
+            op = self._next()[1]
+            right = self._factor()
+            if op == '/' and _is_zero(right):
+                raise FormulaError("公式中存在除以 0")
+            result = f"{result} {op} {right}"
+        return result
+
+    def _factor(self) -> str:
+        if self.pos >= len(self.tokens):
+            raise FormulaError("公式意外结束")
+        kind, value = self._next()
+        if kind == 'num':
+            return value
+        if kind == 'var':
+            self.variables.add(value[-1])
+            return value
+        if value == '-':
+            return f"(-{self._factor()})"
+        if value == '+':
+            return self._factor()
+        if value == '(':
+            inner = self._expr()
+            if self._peek() != ')':
+                raise FormulaError("公式括号不匹配")
+            self._next()
+            return f"({inner})"
+        raise FormulaError(f"公式在 {value!r} 处语法错误")
+
+
+def _is_zero(expr: str) -> bool:
+    try:
+        return float(expr) == 0
+    except ValueError:
+        return False
+
+
+def _parse_data_length(data_length) -> Optional[int]:
+    """解析 "2 bytes" 之类的数据长度"""
+    if data_length is None or data_length == "":
+        return None
+    if isinstance(data_length, int):
+        return data_length
+    match = _DATA_LENGTH_RE.search(str(data_length))
+    return int(match.group(1)) if match else None
+
+
+def _compile_bitfield(formula: str, byte_count: int) -> CompiledFormula:
+    if byte_count:
+        def decode(data, _n=byte_count):
+            return (int.from_bytes(data[:_n], 'big'),)
+    else:
+        def decode(data):
+            return (int.from_bytes(data, 'big'),)
+    return CompiledFormula(formula, 'bitfield', ('BITS',), (), byte_count, decode)
+
+
+def _compile_expr(formula: str, outputs: List[str], variables: set) -> CompiledFormula:
+    ordered = sorted(variables)
+    byte_count = (ord(ordered[-1]) - ord('A') + 1) if ordered else 0
+    lines = ["def _decode(data):"]
+    for var in ordered:
+        lines.append(f"    {var} = data[{ord(var) - ord('A')}]")
+        if any(f"S_{var}" in out for out in outputs):
+            lines.append(f"    S_{var} = {var} - 256 if {var} > 127 else {var}")
+    lines.append(f"    return ({', '.join(outputs)},)")
+    namespace = {}
+    exec(compile('\n'.join(lines), f"<pid formula {formula!r}>", 'exec'), namespace)
+    return CompiledFormula(formula, 'expr', tuple(outputs), tuple(ordered),
+                           byte_count, namespace['_decode'])
+
+
+@lru_cache(maxsize=None)
+def _compile_cached(formula: str, data_length: Optional[int]) -> Optional[CompiledFormula]:
+    text = formula.strip()
+    if not text:
+        return None
+
+    bits_match = _BITFIELD_RE.match(text)
+    if bits_match:
+        return _compile_bitfield(formula, (int(bits_match.group(1)) + 7) // 8)
+    if text.lower() in _BIT_ENCODED_NAMES:
+        return _compile_bitfield(formula, data_length or 0)
+
+    parser = _Parser(_tokenize(text))
+    outputs = parser.parse_outputs()
+    return _compile_expr(formula, outputs, parser.variables)
+
+
+def compile_formula(formula: str, data_length=None) -> Optional[CompiledFormula]:
+    """编译公式字符串，空公式返回 None，无法解析时抛出 FormulaError
+
+    相同的公式只编译一次，所有使用该公式的 PID 共享同一个解码函数。
+    data_length 仅用于 "Bit encoded" 这类未写明位数的位字段。
+    """
+    return _compile_cached(formula or "", _parse_data_length(data_length))
+
+
+def validate_formula(formula: str, data_length=None) -> Optional[str]:
+    """校验公式，返回错误信息，合法时返回 None"""
+    try:
+        compile_formula(formula, data_length)
+    except FormulaError as e:
+        return str(e)
+    return None
+
+
+def output_spans(decoder: CompiledFormula) -> Tuple[Optional[Tuple[float, float]], ...]:
+    """每个输出在全部原始数据上能取到的 (最小值, 最大值)；位字段为 None
+
+    对各字节取 0 / 127 / 128 / 255 的所有组合求值 (含有符号字节的两端)，
+    对本库中的线性公式即为精确范围。
+    """
+    if decoder.kind != 'expr':
+        return (None,) * len(decoder.outputs)
+    positions = [ord(var) - ord('A') for var in decoder.variables]
+    lows: List[float] = []
+    highs: List[float] = []
+    for combo in itertools.product((0, 127, 128, 255), repeat=len(positions)):
+        data = bytearray(decoder.byte_count)
+        for position, value in zip(positions, combo):
+            data[position] = value
+        values = decoder(data)
+        if not lows:
+            lows, highs = list(values), list(values)
+            continue
+        for index, value in enumerate(values):
+            lows[index] = min(lows[index], value)
+            highs[index] = max(highs[index], value)
+    return tuple((float(low), float(high)) for low, high in zip(lows, highs))
+
+
+def quantization_steps(decoder: CompiledFormula) -> Tuple[Optional[float], ...]:
+    """每个输出的量化步长：某个数据字节变化 1 时输出的最小变化量
+
+    如 "A-40" 为 1，"A*100/255" 为 100/255，"((A*256)+B)/100" 为 0.01；
+    位字段和不依赖数据字节的输出为 None (任何变化都有意义)。
+    """
+    if decoder.kind != 'expr':
+        return (None,) * len(decoder.outputs)
+    zero = bytes(decoder.byte_count)
+    base = decoder(zero)
+    steps: List[Optional[float]] = [None] * len(base)
+    for var in decoder.variables:
+        data = bytearray(zero)
+        data[ord(var) - ord('A')] = 1
+        for index, (value, origin) in enumerate(zip(decoder(data), base)):
+            delta = abs(value - origin)
+            if delta and (steps[index] is None or delta < steps[index]):
+                steps[index] = delta
+    return tuple(steps)
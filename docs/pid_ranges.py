@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+PID 量程表
+把 "-327.68 to 327.67A"、"0-100%" 之类的量程文字解析为数值 (每个 PID 只解析一次)，
+与公式实际能取到的范围取交集并放宽一个量化步长后，按数据库中 PID 的顺序排成 NumPy 下限 / 上限数组，
+用于整批检查解码值是否超出量程 (帧损坏、公式错误)；量程文字与公式不一致的 PID 单独报告
+"""
+
+import argparse
+import re
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pid_formula import output_spans, quantization_steps
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 量程中的数字：前面紧跟数字的 "-" 是分隔符而不是负号 (如 "0-100%")
+RANGE_NUMBER_RE = re.compile(r'(?<![\d.])-?\d+(?:\.\d+)?')
+
+
+def split_range(range_values: str) -> Optional[Tuple[str, str]]:
+    """量程文字中的 (最小值, 最大值) 原文，按数值排序；不足两个数字时返回 None"""
+    numbers = RANGE_NUMBER_RE.findall(range_values or '')
+    if len(numbers) < 2:
+        return None
+    low, high = numbers[0], numbers[1]
+    return (high, low) if float(low) > float(high) else (low, high)
+
+
+def parse_range(range_values: str) -> Optional[Tuple[float, float]]:
+    """量程文字的 (最小值, 最大值)，无法解析时返回 None"""
+    bounds = split_range(range_values)
+    return (float(bounds[0]), float(bounds[1])) if bounds is not None else None
+
+
+def parse_ranges(range_values: str, count: int) -> List[Optional[Tuple[float, float]]]:
+    """多输出公式的量程以逗号分隔 (如 "0-1.275V, -100 to 99.22%")，返回每个输出的量程"""
+    parts = (range_values or '').split(',') if count > 1 else [range_values]
+    return [parse_range(parts[i]) if i < len(parts) else None for i in range(count)]
+
+
+def output_count(record) -> int:
+    """记录 (VoltPID / OBDCommand) 解码输出的个数"""
+    decoder = record.decoder
+    return len(decoder.outputs) if decoder is not None else 1
+
+
+class RangeConflict:
+    """量程文字与公式可取范围不一致的一个输出"""
+    __slots__ = ('pid', 'index', 'stated', 'span', 'step')
+
+    def __init__(self, pid, index: int, stated: Tuple[float, float], span: Tuple[float, float],
+                 step: float):
+        self.pid = pid
+        self.index = index      # 第几个输出
+        self.stated = stated    # 量程文字解析出的范围
+        self.span = span        # 公式在全部原始数据上的范围
+        self.step = step
+
+    def describe(self) -> str:
+        stated_low, stated_high = self.stated
+        span_low, span_high = self.span
+        if stated_low < span_low - self.step or stated_high > span_high + self.step:
+            kind = '量程超出公式可取范围'
+        else:
+            kind = '量程窄于公式可取范围'
+        return (f"{self.pid.pid} {self.pid.description}: 量程 {self.pid.range_values!r} -> "
+                f"[{stated_low:g}, {stated_high:g}]，公式 {self.pid.formula!r} -> "
+                f"[{span_low:g}, {span_high:g}] ({kind})")
+
+
+def output_bounds(record, strict: bool = False) -> Tuple[List[Tuple[float, float]], List[RangeConflict]]:
+    """一个 PID 各输出的检查范围和量程冲突
+
+    范围为量程文字与公式可取范围的交集，两端各放宽一个量化步长 (量程文字常被四舍五入，如 "0-9.3" 对 9.3122)。
+    量程与公式可取范围相差超过一个步长时记为冲突：默认只按公式可取范围检查 (不因可能有误的量程文字丢弃数据)，
+    strict 为 True 时按交集检查。位字段和无法解码的输出为 (-inf, inf)。
+    """
+    count = output_count(record)
+    decoder = record.decoder
+    inf = float('inf')
+    if decoder is None:
+        return [(-inf, inf)] * count, []
+    spans = output_spans(decoder)
+    steps = quantization_steps(decoder)
+    stated_ranges = parse_ranges(record.range_values, count)
+    bounds: List[Tuple[float, float]] = []
+    conflicts: List[RangeConflict] = []
+    for index in range(count):
+        span = spans[index] if index < len(spans) else None
+        if span is None:
+            bounds.append((-inf, inf))
+            continue
+        step = steps[index] or 0.0
+        low, high = span
+        stated = stated_ranges[index]
+        if stated is not None:
+            if abs(stated[0] - span[0]) > step or abs(stated[1] - span[1]) > step:
+                conflicts.append(RangeConflict(record, index, stated, span, step))
+                if strict:
+                    low, high = max(low, stated[0]), min(high, stated[1])
+            else:
+                low, high = max(low, stated[0]), min(high, stated[1])
+            if low > high:
+                low, high = span
+        bounds.append((low - step, high + step))
+    return bounds, conflicts
+
+
+class RangeTable:
+    """按 PID 顺序排列的检查范围数组
+
+    low / high 的形状为 (PID 数, 最多输出数)，第 i 行对应 pids[i]；
+    没有范围的输出 (位编码、无公式) 为 -inf / +inf，任何数值都通过检查。
+    conflicts 列出量程文字与公式不一致的输出 (见 output_bounds)。
+    """
+
+    def __init__(self, pids: Sequence, strict: bool = False):
+        import numpy as np
+
+        self.pids = list(pids)
+        self.strict = strict
+        self.conflicts: List[RangeConflict] = []
+        width = max((output_count(pid) for pid in self.pids), default=1)
+        self.low = np.full((len(self.pids), width), -np.inf)
+        self.high = np.full((len(self.pids), width), np.inf)
+        self._rows: Dict[int, int] = {}
+        for row, pid in enumerate(self.pids):
+            self._rows.setdefault(id(pid), row)
+            bounds, conflicts = output_bounds(pid, strict)
+            self.conflicts.extend(conflicts)
+            for index, (low, high) in enumerate(bounds):
+                self.low[row, index], self.high[row, index] = low, high
+
+    def report(self) -> List[str]:
+        """量程冲突的说明文字"""
+        return [conflict.describe() for conflict in self.conflicts]
+
+    def row(self, pid) -> int:
+        """PID 在表中的行号"""
+        try:
+            return self._rows[id(pid)]
+        except KeyError:
+            raise KeyError(f"PID 不在量程表中: {pid.pid}") from None
+
+    def rows(self, pids: Iterable) -> 'np.ndarray':
+        """一组 PID 的行号数组 (用于 check())"""
+        import numpy as np
+
+        return np.fromiter((self.row(pid) for pid in pids), dtype=np.intp)
+
+    def bounds(self, pid) -> Tuple['np.ndarray', 'np.ndarray']:
+        """一个 PID 各输出的 (下限, 上限)"""
+        row = self.row(pid)
+        count = output_count(pid)
+        return self.low[row, :count], self.high[row, :count]
+
+    def valid_mask(self, pid, values) -> 'np.ndarray':
+        """一个 PID 的整批解码值 ((N,) 或 (N, 输出数)) 是否都在检查范围内，返回 (N,) 布尔数组
+
+        NaN (无法解码) 视为超出量程；位编码 (整数) 结果不检查。
+        """
+        import numpy as np
+
+        values = np.asarray(values)
+        if values.dtype.kind in 'ui':
+            return np.ones(len(values), dtype=bool)
+        low, high = self.bounds(pid)
+        if values.ndim == 1:
+            return (values >= low[0]) & (values <= high[0])
+        return ((values >= low) & (values <= high)).all(axis=1)
+
+    def check(self, rows, values) -> 'np.ndarray':
+        """混合 PID 的单输出采样流：rows 为每个采样的行号，values 为对应的第一个输出值"""
+        import numpy as np
+
+        rows = np.asarray(rows, dtype=np.intp)
+        values = np.asarray(values, dtype=np.float64)
+        return (values >= self.low[rows, 0]) & (values <= self.high[rows, 0])
+
+    def filter(self, pid, timestamps, values):
+        """丢弃超出量程的采样，返回 (时间戳, 值, 丢弃数)"""
+        mask = self.valid_mask(pid, values)
+        dropped = len(mask) - int(mask.sum())
+        if not dropped:
+            return timestamps, values, 0
+        return timestamps[mask], values[mask], dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检查 PID 量程文字与公式可取范围是否一致')
+    parser.add_argument('--strict', action='store_true', help='显示按量程文字 (而非公式范围) 检查时的范围')
+
+    args = parser.parse_args()
+
+    from chevrolet_volt_pids import VoltPIDDatabase
+
+    table = RangeTable(VoltPIDDatabase().pids, strict=args.strict)
+    lines = table.report()
+    print(f"{len(table.pids)} 个 PID，{len(lines)} 个量程与公式不一致:")
+    for line in lines:
+        print(f"  {line}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+PID 轮询调度器
+根据想要采集的 PID 及目标采样率生成循环轮询计划：
+按请求 header 分组以减少 ELM327 的 ATSH 切换，快信号 (高压电流、电机扭矩) 每帧都轮询，
+慢信号 (温度、里程) 分散到不同帧中穿插轮询，并按适配器往返延迟估算每个 PID 实际可达的采样率
+"""
+
+import argparse
+import math
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+
+# 各类别默认目标采样率 (Hz)
+DEFAULT_CATEGORY_RATES = {
+    'Motor': 5.0,
+    'Battery': 2.0,
+    'Charging': 1.0,
+    'Engine': 2.0,
+    'Vehicle': 2.0,
+    'Fuel': 0.5,
+    'Pressure': 0.5,
+    'HVAC': 0.5,
+    'Temperature': 0.2,
+    'Distance': 0.05,
+    'Diagnostics': 0.05,
+}
+
+# 需要更高采样率的快信号 (Hz)
+DEFAULT_PID_RATES = {
+    '2204AF': 10.0,  # 高压电池电流
+    '220273': 10.0,  # 电机 A 扭矩
+    '220275': 10.0,  # 电机 B 扭矩
+    '22F40C': 10.0,  # 电机总扭矩
+}
+
+DEFAULT_RATE = 1.0
+DEFAULT_LATENCY = 0.05
+MAX_DIVISOR = 1024
+
+
+def default_rate(pid: VoltPID) -> float:
+    """PID 的默认目标采样率"""
+    if pid.pid in DEFAULT_PID_RATES:
+        return DEFAULT_PID_RATES[pid.pid]
+    return DEFAULT_CATEGORY_RATES.get(pid.category, DEFAULT_RATE)
+
+
+class PollSlot:
+    """轮询计划中的一次请求 (同一 header 和代码的多个信号共用一次请求)"""
+    __slots__ = ('header', 'response', 'code', 'request', 'pids', 'target_rate', 'divisor', 'offset')
+
+    def __init__(self, header: str, response: str, code: str, request: str, pids: List[VoltPID],
+                 target_rate: float):
+        self.header = header
+        self.response = response
+        self.code = code
+        self.request = request
+        self.pids = pids
+        self.target_rate = target_rate
+        self.divisor = 1
+        self.offset = 0
+
+    def __repr__(self) -> str:
+        return f"PollSlot({self.header} {self.request})"
+
+
+class PollPlan:
+    """循环轮询计划"""
+
+    def __init__(self, slots: List[PollSlot], requests: List[PollSlot], header_switches: int,
+                 latency: float, switch_cost: float):
+        self.slots = slots                      # 一个周期内按顺序发送的请求
+        self.requests = requests                # 计划中的每个不同请求
+        self.header_switches = header_switches  # 一个周期内的 header 切换次数 (含周期首尾衔接)
+        self.latency = latency
+        self.switch_cost = switch_cost
+        self.cycle_time = len(slots) * latency + header_switches * switch_cost
+
+    def achieved_rates(self) -> Dict[Tuple[str, str], float]:
+        """每个 (header, 代码) 请求在给定延迟下的实际采样率 (Hz)"""
+        counts: Dict[Tuple[str, str], int] = {}
+        for slot in self.slots:
+            key = (slot.header, slot.code)
+            counts[key] = counts.get(key, 0) + 1
+        if not self.cycle_time:
+            return {code: 0.0 for code in counts}
+        return {code: count / self.cycle_time for code, count in counts.items()}
+
+    def print_report(self):
+        """打印轮询计划摘要"""
+        rates = self.achieved_rates()
+        print(f"\n=== PID 轮询计划 ===")
+        print(f"请求数/周期: {len(self.slots)}  header 切换/周期: {self.header_switches}  "
+              f"周期时长: {self.cycle_time * 1000:.1f} ms")
+        print(f"适配器往返延迟: {self.latency * 1000:.1f} ms  header 切换开销: {self.switch_cost * 1000:.1f} ms")
+        print(f"\n{'Header':6s} {'请求':8s} {'目标Hz':>8s} {'实际Hz':>8s}  信号")
+        for slot in sorted(self.requests, key=lambda s: (-s.target_rate, s.header, s.code)):
+            names = ', '.join(pid.description for pid in slot.pids)
+            print(f"{slot.header:6s} {slot.request:8s} {slot.target_rate:8.2f} {rates[(slot.header, slot.code)]:8.2f}  {names}")
+
+
+def _collect_requests(db: VoltPIDDatabase,
+                      wanted: Union[None, Iterable[str], Dict[str, float]]) -> List[PollSlot]:
+    """把想要的 PID 合并为按 (header, 代码) 去重的请求，目标采样率必须是大于 0 的有限值"""
+    if wanted is None:
+        wanted = {}
+        for pid in db.pids:
+            wanted[pid.pid] = max(wanted.get(pid.pid, 0.0), default_rate(pid))
+    elif not isinstance(wanted, dict):
+        wanted = {code.upper(): None for code in wanted}
+
+    requests: Dict[Tuple[str, str], PollSlot] = {}
+    for code, rate in wanted.items():
+        if rate is not None and not (rate > 0 and math.isfinite(rate)):
+            raise ValueError(f"PID {code} 的目标采样率必须是大于 0 的有限值: {rate}")
+        pids = db.get_pids_by_code(code)
+        if not pids:
+            raise KeyError(f"未知的 PID: {code}")
+        for pid in pids:
+            target = rate if rate is not None else default_rate(pid)
+            key = (pid.header.upper(), pid.pid)
+            slot = requests.get(key)
+            if slot is None:
+                requests[key] = PollSlot(pid.header.upper(), pid.response.upper(), pid.pid,
+                                         pid.request_code, [pid], target)
+            else:
+                slot.pids.append(pid)
+                slot.target_rate = max(slot.target_rate, target)
+    return list(requests.values())
+
+
+def build_poll_plan(db: VoltPIDDatabase,
+                    wanted: Union[None, Iterable[str], Dict[str, float]] = None,
+                    latency: float = DEFAULT_LATENCY,
+                    switch_cost: Optional[float] = None) -> PollPlan:
+    """生成循环轮询计划
+
+    wanted 可以是 {代码: 目标Hz}、代码列表 (使用默认采样率) 或 None (全部 PID)。
+    最快的请求每帧都发送，其余请求每 2^k 帧发送一次，并分配到负载最轻的帧中；
+    负载相差不超过一次请求时优先选择已包含相同 header 的帧 (减少 ATSH 切换)。
+    帧内按 header 分组，且以上一帧最后的 header 开头。
+    switch_cost 为一次 ATSH 切换的耗时，默认与一次请求往返相同。
+    """
+    if switch_cost is None:
+        switch_cost = latency
+    requests = _collect_requests(db, wanted)
+    if not requests:
+        return PollPlan([], [], 0, latency, switch_cost)
+
+    fastest = max(slot.target_rate for slot in requests)
+    for slot in requests:
+        ratio = fastest / slot.target_rate if slot.target_rate > 0 else MAX_DIVISOR
+        slot.divisor = min(MAX_DIVISOR, 2 ** int(math.floor(math.log2(max(ratio, 1.0)) + 1e-9)))
+    frame_count = max(slot.divisor for slot in requests)
+
+    # 按频率从高到低、同 header 相邻的顺序分配帧偏移
+    requests.sort(key=lambda s: (s.divisor, s.header, s.code))
+    loads = [0.0] * frame_count
+    frame_headers = [set() for _ in range(frame_count)]
+    frames: List[List[PollSlot]] = [[] for _ in range(frame_count)]
+    for slot in requests:
+        # 每个偏移：(其所在各帧的最大负载, 需要新增该 header 的帧数)
+        candidates = []
+        for offset in range(slot.divisor):
+            targets = range(offset, frame_count, slot.divisor)
+            new_headers = sum(1 for f in targets if slot.header not in frame_headers[f])
+            cost = max(loads[f] + latency + (0.0 if slot.header in frame_headers[f] else switch_cost)
+                       for f in targets)
+            candidates.append((cost, new_headers, offset))
+        # 帧负载相差不超过一次请求时视为相当，优先选已有该 header 的帧以减少 ATSH 切换
+        lowest = min(cost for cost, _, _ in candidates)
+        _, _, slot.offset = min((new_headers, cost, offset) for cost, new_headers, offset in candidates
+                                if cost <= lowest + latency + 1e-12)
+        for f in range(slot.offset, frame_count, slot.divisor):
+            if slot.header not in frame_headers[f]:
+                frame_headers[f].add(slot.header)
+                loads[f] += switch_cost
+            loads[f] += latency
+            frames[f].append(slot)
+
+    # 帧内按 header 分组，优先延续上一帧最后的 header
+    slots: List[PollSlot] = []
+    current = None
+    for frame in frames:
+        groups: Dict[str, List[PollSlot]] = {}
+        for slot in frame:
+            groups.setdefault(slot.header, []).append(slot)
+        order = sorted(groups)
+        if current in groups:
+            order.remove(current)
+            order.insert(0, current)
+        for header in order:
+            slots.extend(groups[header])
+            current = header
+
+    switches = 0
+    for i, slot in enumerate(slots):
+        if slot.header != slots[i - 1].header:
+            switches += 1
+
+    return PollPlan(slots, requests, switches, latency, switch_cost)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Volt PID 轮询计划生成器')
+    parser.add_argument('pids', nargs='*', help='PID 代码，可写成 代码=Hz (默认全部 PID)')
+    parser.add_argument('-l', '--latency', type=float, default=DEFAULT_LATENCY * 1000,
+                        help='适配器单次请求往返延迟 (ms)')
+    parser.add_argument('-s', '--switch-cost', type=float, default=None,
+                        help='header 切换开销 (ms，默认与往返延迟相同)')
+
+    args = parser.parse_args()
+
+    wanted = None
+    if args.pids:
+        wanted = {}
+        for item in args.pids:
+            code, _, rate = item.partition('=')
+            try:
+                wanted[code.upper()] = float(rate) if rate else None
+            except ValueError:
+                print(f"错误：无效的采样率 {item}")
+                sys.exit(1)
+
+    db = VoltPIDDatabase()
+    try:
+        plan = build_poll_plan(db, wanted, latency=args.latency / 1000,
+                               switch_cost=None if args.switch_cost is None else args.switch_cost / 1000)
+    except ValueError as e:
+        print(f"错误：{e}")
+        sys.exit(1)
+    plan.print_report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+PID 预聚合 (分钟 / 小时)
+写入采样时增量维护每个信号每分钟、每小时的 最小值 / 最大值 / 平均值 / 点数 / 最后值，
+查询长时间范围 (如一个月的高压电池电压) 时按时间跨度和点数预算自动选择分辨率：
+只有在细分辨率的点数超出预算或数据已过保留期时才改用更粗的一级，不再需要扫描原始数据
+"""
+
+import argparse
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+
+# (名称, 桶宽秒数, 默认保留秒数；None 为不限)
+LEVELS = (
+    ('minute', 60.0, 7 * 86400.0),
+    ('hour', 3600.0, None),
+)
+DEFAULT_MAX_POINTS = 500
+INITIAL_CAPACITY = 64
+COLUMNS = ('min', 'max', 'sum', 'count', 'last', 'last_time')
+
+
+class RollupLevel:
+    """一个信号在一种分辨率下的桶序列
+
+    各列为按桶序号 (时间戳 // 桶宽) 升序排列的可增长数组；乱序到达的采样合并到已有的桶。
+    超过保留时长的旧桶被整段丢弃，complete_from 记录此后数据才完整的时间。
+    """
+
+    def __init__(self, name: str, width: float, retention: Optional[float] = None):
+        self.name = name
+        self.width = width
+        self.keep = int(math.ceil(retention / width)) if retention else None
+        self.complete_from: Optional[float] = None
+        self.size = 0
+        self.bucket = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.min = np.zeros(INITIAL_CAPACITY)
+        self.max = np.zeros(INITIAL_CAPACITY)
+        self.sum = np.zeros(INITIAL_CAPACITY)
+        self.count = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.last = np.zeros(INITIAL_CAPACITY)
+        self.last_time = np.zeros(INITIAL_CAPACITY)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _arrays(self):
+        return (self.bucket, self.min, self.max, self.sum, self.count, self.last, self.last_time)
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        if needed <= len(self.bucket):
+            return
+        capacity = max(needed, 2 * len(self.bucket))
+        for name in ('bucket',) + COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _trim(self):
+        """丢弃超出保留时长的桶 (留出 1/4 余量，避免每个新桶都移动数组)"""
+        if self.keep is None or self.size <= self.keep + self.keep // 4:
+            return
+        cut = int(np.searchsorted(self.bucket[:self.size], self.bucket[self.size - 1] - self.keep + 1))
+        for array in self._arrays():
+            array[:self.size - cut] = array[cut:self.size]
+        self.size -= cut
+        self.complete_from = float(self.bucket[0]) * self.width
+
+    def _merge(self, index: int, low: float, high: float, total: float, count: int,
+               last: float, last_time: float):
+        self.min[index] = min(self.min[index], low)
+        self.max[index] = max(self.max[index], high)
+        self.sum[index] += total
+        self.count[index] += count
+        if last_time >= self.last_time[index]:
+            self.last[index] = last
+            self.last_time[index] = last_time
+
+    def _insert(self, index: int, bucket: int, low: float, high: float, total: float, count: int,
+                last: float, last_time: float):
+        self._reserve(1)
+        size = self.size
+        for array in self._arrays():
+            array[index + 1:size + 1] = array[index:size].copy()
+        self.bucket[index] = bucket
+        self.min[index], self.max[index], self.sum[index] = low, high, total
+        self.count[index] = count
+        self.last[index], self.last_time[index] = last, last_time
+        self.size += 1
+
+    def _add_bucket(self, bucket: int, low: float, high: float, total: float, count: int,
+                    last: float, last_time: float):
+        size = self.size
+        if size and bucket <= self.bucket[size - 1]:
+            if bucket == self.bucket[size - 1]:
+                self._merge(size - 1, low, high, total, count, last, last_time)
+                return
+            # 乱序采样：落在已丢弃的范围内则忽略
+            if self.complete_from is not None and bucket * self.width < self.complete_from:
+                return
+            index = int(np.searchsorted(self.bucket[:size], bucket))
+            if self.bucket[index] == bucket:
+                self._merge(index, low, high, total, count, last, last_time)
+            else:
+                self._insert(index, bucket, low, high, total, count, last, last_time)
+            return
+        self._insert(size, bucket, low, high, total, count, last, last_time)
+        self._trim()
+
+    def add(self, timestamp: float, value: float):
+        """加入一个采样"""
+        size = self.size
+        bucket = int(timestamp // self.width)
+        if size and bucket == self.bucket[size - 1]:
+            # 最常见的情况：落在当前 (最新) 桶
+            index = size - 1
+            if value < self.min[index]:
+                self.min[index] = value
+            if value > self.max[index]:
+                self.max[index] = value
+            self.sum[index] += value
+            self.count[index] += 1
+            if timestamp >= self.last_time[index]:
+                self.last[index] = value
+                self.last_time[index] = timestamp
+            return
+        self._add_bucket(bucket, value, value, value, 1, value, timestamp)
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray):
+        """批量加入 (时间戳已排序)：先在 NumPy 中按桶归约，再逐桶合并"""
+        if not len(timestamps):
+            return
+        buckets = (timestamps // self.width).astype(np.int64)
+        starts = np.flatnonzero(np.diff(buckets)) + 1
+        starts = np.concatenate(([0], starts))
+        ends = np.append(starts[1:], len(buckets)) - 1
+        group_buckets = buckets[starts]
+        lows = np.minimum.reduceat(values, starts)
+        highs = np.maximum.reduceat(values, starts)
+        totals = np.add.reduceat(values, starts)
+        counts = np.diff(np.append(starts, len(buckets)))
+        lasts, last_times = values[ends], timestamps[ends]
+
+        # 与已有桶重叠的部分逐个合并，其余整段追加
+        first_new = 0
+        if self.size:
+            first_new = int(np.searchsorted(group_buckets, self.bucket[self.size - 1], side='right'))
+            for i in range(first_new):
+                self._add_bucket(int(group_buckets[i]), lows[i], highs[i], totals[i], int(counts[i]),
+                                 lasts[i], last_times[i])
+        n = len(group_buckets) - first_new
+        if n:
+            self._reserve(n)
+            size = self.size
+            for array, source in zip(self._arrays(), (group_buckets, lows, highs, totals, counts,
+                                                      lasts, last_times)):
+                array[size:size + n] = source[first_new:]
+            self.size += n
+            self._trim()
+
+    def span(self) -> Optional[Tuple[float, float]]:
+        """已有数据的 (第一个桶起始时间, 最后一个桶结束时间)"""
+        if not self.size:
+            return None
+        return float(self.bucket[0]) * self.width, float(self.bucket[self.size - 1] + 1) * self.width
+
+    def covers(self, start: float) -> bool:
+        """从 start 开始的数据是否完整 (没有因保留时长被丢弃)"""
+        return self.complete_from is None or start >= self.complete_from
+
+    def select(self, start: float, end: float) -> slice:
+        """与 [start, end) 相交的桶的下标范围"""
+        buckets = self.bucket[:self.size]
+        first = int(np.searchsorted(buckets, math.floor(start / self.width)))
+        last = int(np.searchsorted(buckets, math.ceil(end / self.width)))
+        return slice(first, last)
+
+
+class Rollup:
+    """一次查询的结果：每个桶一行"""
+    __slots__ = ('level', 'width', 'times', 'min', 'max', 'mean', 'count', 'last')
+
+    def __init__(self, level: str, width: float, times: np.ndarray, low: np.ndarray, high: np.ndarray,
+                 mean: np.ndarray, count: np.ndarray, last: np.ndarray):
+        self.level = level
+        self.width = width    # 桶宽 (秒)；合并桶后为桶宽的整数倍
+        self.times = times    # 各桶起始时间
+        self.min = low
+        self.max = high
+        self.mean = mean
+        self.count = count
+        self.last = last
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __repr__(self) -> str:
+        return f"Rollup({self.level}, {len(self)} 点, 桶宽 {self.width:g}s)"
+
+
+def _rollup(level: RollupLevel, index: slice, factor: int = 1) -> Rollup:
+    """把一段桶转换为查询结果；factor > 1 时把相邻 factor 个桶 (按桶序号对齐) 合并为一个"""
+    buckets = level.bucket[index]
+    low, high, total = level.min[index], level.max[index], level.sum[index]
+    count, last = level.count[index], level.last[index]
+    width = level.width
+    if factor > 1 and len(buckets):
+        groups = buckets // factor
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(groups)) + 1))
+        ends = np.append(starts[1:], len(groups)) - 1
+        buckets = groups[starts] * factor
+        low = np.minimum.reduceat(low, starts)
+        high = np.maximum.reduceat(high, starts)
+        total = np.add.reduceat(total, starts)
+        count = np.add.reduceat(count, starts)
+        # 组内桶按时间排序，最后一个桶的 last 即为组的 last
+        last = last[ends]
+        width *= factor
+    return Rollup(level.name, width, buckets * level.width, low.copy(), high.copy(), total / count,
+                  count.copy(), last.copy())
+
+
+class RollupEngine:
+    """按信号维护各分辨率的预聚合
+
+    键与 TimeSeriesStore 一致：(代码, 通道)；同一代码下的不同信号 (如 22002F 的燃油液位和剩余燃油量)
+    同属一个类别，只能用通道区分。按类别查询见 keys(category) / query_category()。
+    多输出公式只聚合第一个输出 (obd_data 表同样每行只保存一个数值)。
+    """
+
+    def __init__(self, db: Optional[VoltPIDDatabase] = None,
+                 retention: Optional[Dict[str, Optional[float]]] = None):
+        self.db = db or VoltPIDDatabase()
+        retention = retention or {}
+        self.levels = tuple((name, width, retention.get(name, default)) for name, width, default in LEVELS)
+        self._series: Dict[Tuple[str, int], Tuple[RollupLevel, ...]] = {}
+        self._categories: Dict[Tuple[str, int], str] = {}
+
+    def _channel(self, pid: VoltPID) -> int:
+        for channel, candidate in enumerate(self.db.get_pids_by_code(pid.pid)):
+            if candidate is pid:
+                return channel
+        return 0
+
+    def _levels(self, pid: VoltPID) -> Tuple[RollupLevel, ...]:
+        key = (pid.pid.upper(), self._channel(pid))
+        levels = self._series.get(key)
+        if levels is None:
+            levels = self._series[key] = tuple(RollupLevel(name, width, keep)
+                                               for name, width, keep in self.levels)
+            self._categories[key] = pid.category
+        return levels
+
+    def series(self, code: str, channel: int = 0) -> Tuple[RollupLevel, ...]:
+        """一个信号各分辨率的桶序列 (由细到粗)"""
+        try:
+            return self._series[(code.upper(), channel)]
+        except KeyError:
+            raise KeyError(f"没有聚合数据: {code} (通道 {channel})") from None
+
+    def append(self, pid: VoltPID, timestamp: float, values: Tuple):
+        """加入一个解码结果 (VoltPID.decode / ELM327 客户端 Sample 的值)"""
+        if not len(values):
+            return
+        value = float(values[0])
+        if math.isnan(value):
+            return
+        for level in self._levels(pid):
+            level.add(timestamp, value)
+
+    def ingest(self, samples: Iterable):
+        """加入一批带 timestamp / pid / values 属性的采样 (如 ELM327Client.stream 的产出)"""
+        for sample in samples:
+            self.append(sample.pid, sample.timestamp, sample.values)
+
+    def extend(self, pid: VoltPID, timestamps, values):
+        """批量加入一个信号的采样 (如 LogReplayer.results() 的结果)"""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 2:
+            values = values[:, 0]
+        keep = ~np.isnan(values)
+        if not keep.all():
+            timestamps, values = timestamps[keep], values[keep]
+        if len(timestamps) > 1 and (np.diff(timestamps) < 0).any():
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+        for level in self._levels(pid):
+            level.extend(timestamps, values)
+
+    def load_sqlite(self, path: str, since: Optional[float] = None) -> int:
+        """从 obd_data 表 (sqlite_ingest.py 写入的结构) 重建聚合，返回读取的行数"""
+        import sqlite3
+
+        pids = {(pid.pid.upper(), pid.description): pid for pid in self.db.pids}
+        conn = sqlite3.connect(path)
+        try:
+            sql = "SELECT pid_code, description, timestamp, decoded_value FROM obd_data WHERE decoded_value IS NOT NULL"
+            params: Tuple = ()
+            if since is not None:
+                sql += " AND timestamp >= ?"
+                params = (int(since * 1000),)
+            groups: Dict[Tuple[str, str], List[Tuple[int, float]]] = {}
+            rows = 0
+            for code, description, timestamp, value in conn.execute(sql, params):
+                groups.setdefault((code.upper(), description), []).append((timestamp, value))
+                rows += 1
+        finally:
+            conn.close()
+        for key, points in groups.items():
+            pid = pids.get(key)
+            if pid is None:
+                continue
+            data = np.array(points, dtype=np.float64)
+            self.extend(pid, data[:, 0] / 1000.0, data[:, 1])
+        return rows
+
+    def keys(self, category: Optional[str] = None) -> List[Tuple[str, int]]:
+        """已有聚合数据的信号，可按类别过滤"""
+        if category is None:
+            return list(self._series)
+        category = category.lower()
+        return [key for key, value in self._categories.items() if value.lower() == category]
+
+    def choose_level(self, levels: Tuple[RollupLevel, ...], start: float, end: float,
+                     max_points: int) -> Tuple[RollupLevel, int]:
+        """由细到粗选择第一个覆盖 start 且桶数不超过 max_points 的分辨率
+
+        都超出预算时使用最粗一级，并返回把相邻桶合并的倍数。
+        """
+        span = max(end - start, 0.0)
+        for level in levels:
+            if level.covers(start) and span / level.width <= max_points:
+                return level, 1
+        coarsest = levels[-1]
+        return coarsest, max(1, int(math.ceil(span / coarsest.width / max_points)))
+
+    def query(self, code: str, start: Optional[float] = None, end: Optional[float] = None,
+              max_points: int = DEFAULT_MAX_POINTS, channel: int = 0) -> Rollup:
+        """查询 [start, end) 内的聚合数据，点数不超过 max_points
+
+        start / end 默认取已有数据的范围 (最粗一级)。
+        """
+        levels = self.series(code, channel)
+        span = levels[-1].span()
+        if span is None:
+            level = levels[0]
+            return _rollup(level, slice(0, 0))
+        start = span[0] if start is None else start
+        end = span[1] if end is None else end
+        level, factor = self.choose_level(levels, start, end, max(1, max_points))
+        return _rollup(level, level.select(start, end), factor)
+
+    def query_category(self, category: str, start: Optional[float] = None, end: Optional[float] = None,
+                       max_points: int = DEFAULT_MAX_POINTS) -> Dict[Tuple[str, int], Rollup]:
+        """查询一个类别下所有信号"""
+        return {key: self.query(key[0], start, end, max_points, key[1]) for key in self.keys(category)}
+
+    def bucket_count(self) -> Dict[str, int]:
+        """各分辨率的桶总数 (内存占用估计)"""
+        totals = {name: 0 for name, _, _ in self.levels}
+        for levels in self._series.values():
+            for level in levels:
+                totals[level.name] += level.size
+        return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PID 预聚合演示 (模拟长时间采样后按点数预算查询)')
+    parser.add_argument('--days', type=float, default=30, help='模拟的天数')
+    parser.add_argument('--rate', type=float, default=1.0, help='每个信号的采样率 (Hz)')
+    parser.add_argument('--category', default='Battery', help='模拟的 PID 类别')
+    parser.add_argument('--sqlite', help='改为从 obd_data 表 (sqlite_ingest.py) 加载')
+    parser.add_argument('-p', '--points', type=int, default=DEFAULT_MAX_POINTS, help='查询的点数预算')
+
+    args = parser.parse_args()
+
+    db = VoltPIDDatabase()
+    engine = RollupEngine(db)
+    started = time.perf_counter()
+    if args.sqlite:
+        rows = engine.load_sqlite(args.sqlite)
+    else:
+        pids = db.get_pids_by_category(args.category)
+        count = int(args.days * 86400 * args.rate)
+        timestamps = time.time() - args.days * 86400 + np.arange(count) / args.rate
+        rng = np.random.default_rng(1)
+        for pid in pids:
+            values = 300 + 50 * np.sin(timestamps / 3600.0) + rng.normal(0, 1, count)
+            engine.extend(pid, timestamps, values)
+        rows = count * len(pids)
+    elapsed = time.perf_counter() - started
+    print(f"聚合 {rows:,} 个采样，{elapsed:.2f} 秒 ({rows / elapsed if elapsed else 0:,.0f} 个/秒)")
+    print("桶数: " + ", ".join(f"{name} {count:,}" for name, count in engine.bucket_count().items()))
+
+    for code, channel in engine.keys(None if args.sqlite else args.category)[:3]:
+        latest = engine.series(code, channel)[0].span()[1]
+        for hours in (1, 24, 7 * 24, 30 * 24):
+            started = time.perf_counter()
+            result = engine.query(code, latest - hours * 3600, latest, args.points, channel)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"  {code}/{channel} 最近 {hours:4d} 小时: {result!r}  {elapsed:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+SQLite 批量写入
+把解码后的 VoltPID 采样写入桌面应用读取的 obd_data 表 (electron/services/database.ts 中的同一结构)：
+采集端先在内存中攒批，由专用写线程在 WAL 模式的连接上用 executemany 按事务批量提交；
+队列满时阻塞采集端 (背压)，并统计每秒写入行数和提交延迟
+"""
+
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+
+DEFAULT_DB = 'voltmonitor.db'
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_QUEUE_SIZE = 32       # 队列中最多的批数，超过时 append() 阻塞
+DEFAULT_FLUSH_INTERVAL = 0.5  # 未攒满一批时最长等待 (秒)
+# 写线程一次事务最多合并的行数 (队列积压时合并多批，减少提交次数)
+MAX_TRANSACTION_ROWS = 50000
+PID_TYPE = 'volt'
+
+# 与 electron/services/database.ts 保持一致
+OBD_DATA_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS obd_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        pid_code TEXT NOT NULL,
+        pid_type TEXT NOT NULL,
+        description TEXT,
+        raw_value TEXT,
+        decoded_value REAL,
+        unit TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+      )""",
+    "CREATE INDEX IF NOT EXISTS idx_obd_data_timestamp ON obd_data(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_obd_data_pid ON obd_data(pid_code)",
+)
+INSERT_SQL = ("INSERT INTO obd_data (timestamp, pid_code, pid_type, description, raw_value, decoded_value, unit) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+Row = Tuple[int, str, str, str, Optional[str], Optional[float], str]
+_STOP = None
+
+
+def sample_row(pid: VoltPID, timestamp: float, values: Sequence, raw=None,
+               pid_type: str = PID_TYPE) -> Row:
+    """一个采样对应的 obd_data 行：时间戳为毫秒 (与应用的 Date.now() 一致)，
+    decoded_value 取第一个输出 (obd_data 每行只有一个数值)，raw_value 为原始数据的十六进制"""
+    value = float(values[0]) if len(values) else None
+    raw_text = bytes(raw).hex().upper() if raw is not None else None
+    return (int(timestamp * 1000), pid.pid, pid_type, pid.description, raw_text, value, pid.unit)
+
+
+class IngestStats:
+    """写入统计"""
+
+    def __init__(self):
+        self.rows = 0
+        self.transactions = 0
+        self.commit_seconds = 0.0   # 写入 + 提交的累计耗时
+        self.max_commit = 0.0
+        self.blocked_seconds = 0.0  # 采集端因队列已满而等待的累计时间
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed()
+        return self.rows / elapsed if elapsed else 0.0
+
+    def mean_commit_ms(self) -> float:
+        return self.commit_seconds / self.transactions * 1000 if self.transactions else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.rows} 行 / {self.transactions} 次事务，{self.rows_per_second():,.0f} 行/秒，"
+                f"提交延迟 平均 {self.mean_commit_ms():.2f} ms / 最大 {self.max_commit * 1000:.2f} ms，"
+                f"背压等待 {self.blocked_seconds:.2f} 秒")
+
+
+class SQLiteIngestWriter:
+    """后台线程批量写入 obd_data
+
+    append() / ingest() 只在调用线程中把行加入当前批次，攒满 batch_size 行或距上次提交超过
+    flush_interval 时把整批放入队列；队列满 (写入跟不上) 时阻塞调用方，而不是无限占用内存。
+    写线程独占 SQLite 连接 (sqlite3 连接不能跨线程使用)。
+    """
+
+    def __init__(self, path: str = DEFAULT_DB, batch_size: int = DEFAULT_BATCH_SIZE,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 synchronous: str = 'NORMAL'):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.stats = IngestStats()
+        self.error: Optional[BaseException] = None
+        self._queue: 'queue.Queue[Optional[List[Row]]]' = queue.Queue(maxsize=max(1, queue_size))
+        self._pending: List[Row] = []
+        self._last_put = time.monotonic()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sqlite-ingest', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        self._check()
+
+    def __enter__(self) -> 'SQLiteIngestWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- 采集端 ----
+
+    def append(self, pid: VoltPID, timestamp: float, values: Sequence, raw=None):
+        """加入一个解码结果 (VoltPID.decode 的返回值)"""
+        self._pending.append(sample_row(pid, timestamp, values, raw))
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_put >= self.flush_interval:
+            self.flush()
+
+    def ingest(self, samples: Iterable):
+        """加入一批带 timestamp / pid / values 属性的采样 (如 ELM327Client.stream 的产出)"""
+        for sample in samples:
+            self.append(sample.pid, sample.timestamp, sample.values)
+
+    def extend_rows(self, rows: Iterable[Row]):
+        """直接加入已构造好的 obd_data 行"""
+        self._pending.extend(rows)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """把当前批次放入写队列 (队列满时等待)"""
+        self._last_put = time.monotonic()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._put(batch)
+
+    def close(self):
+        """写完所有数据并关闭连接"""
+        if self._thread.is_alive():
+            self.flush()
+            self._put(_STOP)
+            self._thread.join()
+        self._check()
+
+    def _put(self, item):
+        self._check()
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        started = time.perf_counter()
+        while True:
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                self._check()
+        self.stats.blocked_seconds += time.perf_counter() - started
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"SQLite 写线程已停止: {self.error}") from self.error
+
+    # ---- 写线程 ----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL 下 NORMAL 只在检查点时 fsync，断电最多丢失最近的事务，不会损坏数据库
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        for sql in OBD_DATA_SCHEMA:
+            conn.execute(sql)
+        return conn
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except BaseException as exc:
+            self.error = exc
+            self._ready.set()
+            return
+        self._ready.set()
+        stats = self.stats
+        try:
+            stopping = False
+            while not stopping:
+                batch = self._queue.get()
+                if batch is _STOP:
+                    break
+                rows = batch
+                # 积压时把队列中已有的批次合并到同一个事务
+                while len(rows) < MAX_TRANSACTION_ROWS:
+                    try:
+                        more = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if more is _STOP:
+                        stopping = True
+                        break
+                    rows.extend(more)
+                started = time.perf_counter()
+                conn.execute('BEGIN')
+                conn.executemany(INSERT_SQL, rows)
+                conn.execute('COMMIT')
+                elapsed = time.perf_counter() - started
+                stats.rows += len(rows)
+                stats.transactions += 1
+                stats.commit_seconds += elapsed
+                stats.max_commit = max(stats.max_commit, elapsed)
+        except BaseException as exc:
+            self.error = exc
+            # 出错后继续取出队列中的数据，避免采集端永久阻塞
+            while True:
+                try:
+                    self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    break
+        finally:
+            stats.finished = time.perf_counter()
+            conn.close()
+
+
+def _synthetic_rows(db: VoltPIDDatabase, count: int) -> Iterable[Tuple[VoltPID, float, Tuple, bytes]]:
+    """用模拟器的信号生成器产生 count 个采样 (轮流覆盖全部可解码的 PID)"""
+    import random
+
+    from elm327_simulator import SignalGenerator
+
+    rng = random.Random(1)
+    pids = [pid for pid in db.pids if pid.decoder is not None]
+    generators = [SignalGenerator(pid.decoder, pid.range_values, pid.decoder.byte_count or 1, rng)
+                  for pid in pids]
+    now = time.time()
+    for i in range(count):
+        index = i % len(pids)
+        pid = pids[index]
+        raw = generators[index].next()
+        yield pid, now + i * 0.001, pid.decode(raw), raw
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite 批量写入吞吐量测试 (obd_data 表)')
+    parser.add_argument('--db', default='ingest_test.db', help='SQLite 数据库文件')
+    parser.add_argument('-n', '--rows', type=int, default=200000, help='写入的采样数')
+    parser.add_argument('-b', '--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每批行数')
+    parser.add_argument('-q', '--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='队列中最多的批数')
+    parser.add_argument('--no-raw', action='store_true', help='不写 raw_value 列')
+
+    args = parser.parse_args()
+
+    db = VoltPIDDatabase()
+    samples = list(_synthetic_rows(db, args.rows))
+    print(f"写入 {len(samples)} 个采样到 {os.path.abspath(args.db)}")
+    with SQLiteIngestWriter(args.db, batch_size=args.batch_size, queue_size=args.queue_size) as writer:
+        for pid, timestamp, values, raw in samples:
+            writer.append(pid, timestamp, values, None if args.no_raw else raw)
+    print(writer.stats.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+PID 时间序列环形缓冲存储
+每个信号一个预分配的 NumPy 环形缓冲区 (时间戳, 值)，容量按类别 / 轮询频率和保留时长计算；
+追加为 O(1)，最近 N 个点或最近 N 秒的窗口以零拷贝视图返回，
+并可即时按 min/max/mean 抽稀到目标点数供仪表盘绘图
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from chevrolet_volt_pids import VoltPID, VoltPIDDatabase
+from poll_scheduler import default_rate
+
+DEFAULT_RETENTION = 600.0
+MIN_CAPACITY = 16
+# 容量相对 "采样率 × 保留时长" 的余量 (轮询抖动)
+CAPACITY_HEADROOM = 1.25
+
+
+class RingBuffer:
+    """定长环形缓冲区
+
+    数据写两份 (位置 i 和 i + capacity)，任意最近 n 个点在底层数组中总是连续的，
+    因此 window() 返回的是视图而不是副本。视图在之后写入超过 capacity - n 个点后被覆盖，
+    需要长期保留时请自行 copy()。
+    """
+
+    def __init__(self, capacity: int, outputs: int = 1):
+        self.capacity = max(1, int(capacity))
+        self.outputs = outputs
+        self._times = np.zeros(2 * self.capacity, dtype=np.float64)
+        shape = (2 * self.capacity,) if outputs == 1 else (2 * self.capacity, outputs)
+        self._values = np.zeros(shape, dtype=np.float64)
+        self._pos = 0      # 下一次写入的位置 (0 .. capacity-1)
+        self.count = 0     # 有效点数 (不超过 capacity)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, value):
+        """追加一个点 (O(1))"""
+        pos = self._pos
+        mirror = pos + self.capacity
+        self._times[pos] = self._times[mirror] = timestamp
+        self._values[pos] = self._values[mirror] = value
+        self._pos = pos + 1 if pos + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, timestamps, values):
+        """批量追加 (如日志回放的解码结果)"""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        n = len(timestamps)
+        if n > self.capacity:
+            timestamps, values = timestamps[-self.capacity:], values[-self.capacity:]
+            self._pos = (self._pos + n - self.capacity) % self.capacity
+            n = self.capacity
+        first = min(n, self.capacity - self._pos)
+        for src, dst in ((timestamps, self._times), (values, self._values)):
+            dst[self._pos:self._pos + first] = src[:first]
+            dst[self._pos + self.capacity:self._pos + self.capacity + first] = src[:first]
+            if n > first:
+                dst[:n - first] = src[first:]
+                dst[self.capacity:self.capacity + n - first] = src[first:]
+        self._pos = (self._pos + n) % self.capacity
+        self.count = min(self.capacity, self.count + n)
+
+    def window(self, points: Optional[int] = None, since: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """最近 points 个点 / 时间戳不早于 since 的点，返回只读视图 (时间戳, 值)"""
+        end = self._pos + self.capacity
+        start = end - self.count
+        if points is not None:
+            start = max(start, end - points)
+        times = self._times[start:end]
+        values = self._values[start:end]
+        if since is not None:
+            offset = int(np.searchsorted(times, since, side='left'))
+            times, values = times[offset:], values[offset:]
+        times = times.view()
+        values = values.view()
+        times.flags.writeable = values.flags.writeable = False
+        return times, values
+
+    def latest(self) -> Optional[Tuple[float, object]]:
+        """最新一个点"""
+        if not self.count:
+            return None
+        index = self._pos - 1 + self.capacity
+        return float(self._times[index]), self._values[index]
+
+
+def decimate(times: np.ndarray, values: np.ndarray,
+             target: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """把窗口抽稀为不超过 target 个桶，返回 (桶起始时间, 最小值, 最大值, 平均值)
+
+    点数不超过 target 时不抽稀 (最小/最大/平均均为原值)。
+    """
+    n = len(times)
+    if n <= target or target <= 0:
+        return times, values, values, values
+    starts = (np.arange(target, dtype=np.int64) * n) // target
+    counts = np.diff(np.append(starts, n))
+    if values.ndim == 2:
+        counts = counts[:, None]
+    return (times[starts],
+            np.minimum.reduceat(values, starts, axis=0),
+            np.maximum.reduceat(values, starts, axis=0),
+            np.add.reduceat(values, starts, axis=0) / counts)
+
+
+class TimeSeriesStore:
+    """按 PID 代码存放解码后信号的环形缓冲区
+
+    键与 VoltPIDDatabase 一致：(代码, 通道)，通道是该代码下第几个信号
+    (如 22002F 的燃油液位为 0、剩余燃油量为 1)，大多数代码只有通道 0。
+    """
+
+    def __init__(self, db: Optional[VoltPIDDatabase] = None, retention: float = DEFAULT_RETENTION,
+                 rates: Optional[Dict[str, float]] = None):
+        self.db = db or VoltPIDDatabase()
+        self.retention = retention  # 保留时长 (秒)
+        self.rates = rates or {}
+        self._buffers: Dict[Tuple[str, int], RingBuffer] = {}
+        self.dropped = 0  # extend(validate=True) 丢弃的超出量程采样数
+
+    @classmethod
+    def from_plan(cls, plan, db: Optional[VoltPIDDatabase] = None,
+                  retention: float = DEFAULT_RETENTION) -> 'TimeSeriesStore':
+        """按轮询计划的实际采样率确定各信号的容量"""
+        rates: Dict[str, float] = {}
+        for (_header, code), rate in plan.achieved_rates().items():
+            rates[code] = max(rates.get(code, 0.0), rate)
+        return cls(db, retention, rates)
+
+    def _channel(self, pid: VoltPID) -> int:
+        for channel, candidate in enumerate(self.db.get_pids_by_code(pid.pid)):
+            if candidate is pid:
+                return channel
+        return 0
+
+    def capacity_for(self, pid: VoltPID) -> int:
+        """保留时长内的点数：采样率 (轮询计划或类别默认值) × 保留时长 × 余量"""
+        rate = self.rates.get(pid.pid) or default_rate(pid)
+        return max(MIN_CAPACITY, int(rate * self.retention * CAPACITY_HEADROOM) + 1)
+
+    def buffer(self, code: str, channel: int = 0) -> RingBuffer:
+        """获取 (必要时创建) 一个信号的缓冲区"""
+        key = (code.upper(), channel)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            pids = self.db.get_pids_by_code(key[0])
+            if channel >= len(pids):
+                raise KeyError(f"未知的 PID: {code} (通道 {channel})")
+            pid = pids[channel]
+            decoder = pid.decoder
+            outputs = len(decoder.outputs) if decoder is not None else 1
+            buffer = self._buffers[key] = RingBuffer(self.capacity_for(pid), outputs)
+        return buffer
+
+    def append(self, pid: VoltPID, timestamp: float, values: Tuple):
+        """追加一个解码结果 (VoltPID.decode / ELM327 客户端 Sample 的值)"""
+        value = values[0] if len(values) == 1 else values
+        self.buffer(pid.pid, self._channel(pid)).append(timestamp, value)
+
+    def ingest(self, samples: Iterable):
+        """追加一批带 timestamp / pid / values 属性的采样 (如 ELM327Client.stream 的产出)"""
+        for sample in samples:
+            self.append(sample.pid, sample.timestamp, sample.values)
+
+    def extend(self, pid: VoltPID, timestamps, values, validate: bool = False):
+        """批量追加 (如 LogReplayer.results() 的结果)，validate 为 True 时丢弃超出量程的采样"""
+        if validate:
+            timestamps, values, dropped = self.db.range_table.filter(pid, np.asarray(timestamps),
+                                                                     np.asarray(values))
+            self.dropped += dropped
+        self.buffer(pid.pid, self._channel(pid)).extend(timestamps, values)
+
+    def window(self, code: str, seconds: Optional[float] = None, channel: int = 0,
+               points: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """最近 seconds 秒 (相对该信号最新时间戳) 的零拷贝视图"""
+        buffer = self.buffer(code, channel)
+        since = None
+        if seconds is not None:
+            latest = buffer.latest()
+            if latest is not None:
+                since = latest[0] - seconds
+        return buffer.window(points, since)
+
+    def series(self, code: str, target_points: int, seconds: Optional[float] = None,
+               channel: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """绘图用数据：窗口按 min/max/mean 抽稀到不超过 target_points 个点"""
+        times, values = self.window(code, seconds, channel)
+        return decimate(times, values, target_points)
+
+    def keys(self):
+        return list(self._buffers)